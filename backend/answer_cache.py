@@ -0,0 +1,174 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from typing_extensions import List
+
+from keyword_index import tokenize
+from schemas import ChatMessagePayload, UserQueryResponse
+
+_MONTHS = frozenset(
+    "january february march april may june july august september october november december "
+    "jan feb mar apr jun jul aug sep sept oct nov dec".split()
+)
+
+
+@dataclass
+class AnswerCacheKey:
+    context: str  # hash of the conversation before the query
+    query: str  # normalized query text
+    vector: np.ndarray  # unit-length query embedding
+    terms: FrozenSet[str]  # bill, act and resolution identifiers, numbers and months of the query, see `key_terms`
+
+
+@dataclass
+class _Entry:
+    key: AnswerCacheKey
+    response: UserQueryResponse
+    created_at: float
+
+
+def normalize_query(query: str) -> str:
+    """Lower-cases a query and strips punctuation and extra whitespace."""
+    query = re.sub(r"[^\w\s.]", " ", query.lower())
+    return re.sub(r"\s+", " ", query).strip(" .")
+
+
+def key_terms(query: str) -> FrozenSet[str]:
+    """The terms of a query that must match exactly for a cached answer to be reused.
+
+    These are the bill, act and resolution identifiers of `keyword_index.tokenize` ("h.479",
+    "act.181"), every number, which covers dates and years, and month names. Embeddings of
+    "status of H.479" and "status of H.480" are nearly identical, but their answers are not.
+    """
+    return frozenset(term for term in tokenize(query) if "." in term or term.isdigit() or term in _MONTHS)
+
+
+class SemanticAnswerCache:
+    """In-memory cache of agent answers, matched on query similarity.
+
+    A cached answer is reused when the conversation before the query is identical, the queries
+    name the same identifiers and dates (see `key_terms`), and the cosine similarity of the
+    normalized query embeddings is at least `threshold`. Entries expire after `ttl_seconds`, the
+    least recently used are evicted beyond `max_entries`, and the whole cache is dropped whenever
+    the index version it was filled against changes.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = 0.95,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+    ):
+        """Initialize the SemanticAnswerCache.
+
+        Args:
+            embeddings (Embeddings): Embedder used for the queries.
+            threshold (float): Minimum cosine similarity between queries for a hit.
+            ttl_seconds (float): Lifetime of an entry.
+            max_entries (int): Maximum number of entries. 0 disables the cache.
+        """
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, FrozenSet[str]], List[int]] = {}  # (context, terms) -> entry ids
+        self._next_id = 0
+        self._index_version: Optional[int] = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def make_key(self, query: str, conversation: List[ChatMessagePayload]) -> AnswerCacheKey:
+        """Embeds the normalized query, extracts its key terms and hashes the conversation context."""
+        normalized = normalize_query(query)
+        return self._key(query, normalized, conversation, self.embeddings.embed_query(normalized))
+
+    async def amake_key(self, query: str, conversation: List[ChatMessagePayload]) -> AnswerCacheKey:
+        """Async version of `make_key`, embedding the query with `aembed_query`."""
+        normalized = normalize_query(query)
+        return self._key(query, normalized, conversation, await self.embeddings.aembed_query(normalized))
+
+    @staticmethod
+    def _key(
+        query: str, normalized: str, conversation: List[ChatMessagePayload], embedding: List[float]
+    ) -> AnswerCacheKey:
+        context = hashlib.sha256()
+        for message in conversation:
+            context.update(f"{message.role}\0{(message.content or '').strip()}\0".encode("utf-8"))
+
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        return AnswerCacheKey(context=context.hexdigest(), query=normalized, vector=vector, terms=key_terms(query))
+
+    def get(self, key: AnswerCacheKey, index_version: int) -> Optional[UserQueryResponse]:
+        """Returns a cached answer for a similar query with the same key terms in the same context, if any."""
+        with self._lock:
+            self._check_version(index_version)
+            now = time.time()
+
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._buckets.get((key.context, key.terms), [])):
+                entry = self._entries[entry_id]
+                if now - entry.created_at > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                score = 1.0 if entry.key.query == key.query else float(entry.key.vector @ key.vector)
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id].response
+
+    def put(self, key: AnswerCacheKey, index_version: int, response: UserQueryResponse):
+        """Stores an answer, evicting the least recently used entries if the cache is full."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._check_version(index_version)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(key=key, response=response, created_at=time.time())
+            self._buckets.setdefault((key.context, key.terms), []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        """Drops every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def _check_version(self, index_version: int):
+        if self._index_version != index_version:
+            self._entries.clear()
+            self._buckets.clear()
+            self._index_version = index_version
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        bucket = (entry.key.context, entry.key.terms)
+        ids = self._buckets[bucket]
+        ids.remove(entry_id)
+        if not ids:
+            del self._buckets[bucket]
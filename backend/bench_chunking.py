@@ -0,0 +1,191 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+
+# offline by default; run with EMBEDDINGS_PROVIDER=openai to benchmark with the real embeddings
+os.environ.setdefault("EMBEDDINGS_PROVIDER", "fake")
+
+from langchain_core.documents import Document
+from typing_extensions import List, Tuple, TypedDict
+
+from chunking import CHUNK_SIZE, CHUNKING_STRATEGIES, UNIT_PATTERNS, _units, split_document
+from load import RETRIEVAL_MODES, Storage
+from rerank import estimate_tokens
+
+# Compares the chunking strategies on a generated corpus that is shaped like the real sources:
+# acts with numbered sections, journals with bill entries and transcripts with speaker turns.
+# Every unit states one fact, and every question asks for one fact. A question is a hit when a
+# retrieved chunk contains the whole fact sentence, i.e. the chunk alone answers it.
+
+TOPICS = [
+    "dairy farms", "rural broadband", "housing vouchers", "school meals", "lake water quality",
+    "child care", "workers' compensation", "opioid treatment", "property tax", "solar generation",
+    "flood recovery", "public transit", "nursing homes", "state parks", "forest management",
+    "mental health", "small business loans", "teacher licensing", "road salt", "emergency shelters",
+]
+AGENCIES = [
+    "Agency of Agriculture", "Department of Public Service", "Agency of Education", "Department of Health",
+    "Agency of Transportation", "Department of Labor", "Agency of Natural Resources", "Department of Taxes",
+]
+COMMITTEES = ["Appropriations", "Education", "Judiciary", "Agriculture", "Commerce", "Transportation", "Health Care"]
+SPEAKERS = ["Rep. Marcotte", "Rep. Lanpher", "Sen. Baruth", "Sen. Kitchel", "Chair Sheldon", "Witness"]
+FILLER = [
+    "The {agency} shall adopt rules to carry out the purposes of this section.",
+    "As used in this chapter, the term {topic} has the same meaning as in the federal program.",
+    "Any funds not expended at the close of the fiscal year shall carry forward.",
+    "The report shall include recommendations on {topic} and the cost of each recommendation.",
+    "Nothing in this section shall be construed to limit the authority of the {agency}.",
+    "The Commissioner may contract with one or more organizations to provide the services.",
+    "On or before January 15 of each year, a written report shall be submitted to the General Assembly.",
+    "Eligibility shall be determined in consultation with stakeholders representing {topic}.",
+]
+
+
+class Question(TypedDict):
+    question: str
+    answer: str  # the fact sentence a chunk must contain to answer the question
+
+
+def _filler(rng: random.Random, sentences: int) -> List[str]:
+    return [
+        rng.choice(FILLER).format(agency=rng.choice(AGENCIES), topic=rng.choice(TOPICS))
+        for _ in range(sentences)
+    ]
+
+
+def _paragraph(rng: random.Random, fact: str, sentences: int) -> str:
+    body = _filler(rng, sentences)
+    body.insert(rng.randrange(len(body) + 1), fact)
+    return " ".join(body)
+
+
+def generate_corpus(seed: int = 0, acts: int = 20, journals: int = 10, transcripts: int = 10) -> Tuple[List[Tuple[Document, str]], List[Question]]:
+    """Generates documents with their source type, and one question per unit.
+
+    Units vary between a short paragraph and a few thousand characters, so the fixed splitter cuts
+    through some of them and merges others.
+    """
+    rng = random.Random(seed)
+    documents, questions = [], []
+    fact_id = 0
+
+    def fact() -> Tuple[str, str]:
+        nonlocal fact_id
+        fact_id += 1
+        topic, agency = rng.choice(TOPICS), rng.choice(AGENCIES)
+        amount = f"${rng.randrange(10, 990) * 1000:,}"
+        sentence = f"The {agency} shall award grant program {fact_id} for {topic} a total of {amount}."
+        return sentence, f"How much does grant program {fact_id} of the {agency} award for {topic}?"
+
+    for n in range(acts):
+        sections = []
+        for s in range(1, rng.randint(3, 8) + 1):
+            sentence, question = fact()
+            paragraphs = "\n".join(_paragraph(rng, sentence if p == 0 else "", rng.randint(2, 9)).strip()
+                                   for p in range(rng.randint(1, 3)))
+            sections.append(f"Sec. {s}. {rng.choice(TOPICS).upper()}\n{paragraphs}")
+            questions.append({"question": question, "answer": sentence})
+        text = f"No. {n + 1}. An act relating to {rng.choice(TOPICS)}.\n(H.{100 + n})\n" + "\n".join(sections)
+        documents.append((Document(page_content=text, metadata={"bill_number": f"H.{100 + n}"}), "act"))
+
+    for n in range(journals):
+        entries = []
+        for e in range(rng.randint(6, 14)):
+            sentence, question = fact()
+            bill = f"{rng.choice('HS')}. {rng.randrange(1, 900)}"
+            entries.append(
+                f"{bill}\nAn act relating to {rng.choice(TOPICS)}.\n"
+                f"Was taken up and read the second time. {_paragraph(rng, sentence, rng.randint(1, 6))} "
+                f"Referred to the Committee on {rng.choice(COMMITTEES)}."
+            )
+            questions.append({"question": question, "answer": sentence})
+        text = f"Journal of the House\nTuesday, January {n + 6}, 2026\n" + "\n".join(entries) + "\nAdjournment\nAt four o'clock, the House adjourned."
+        documents.append((Document(page_content=text, metadata={}), "journal"))
+
+    for n in range(transcripts):
+        turns = []
+        for t in range(rng.randint(10, 25)):
+            speaker = rng.choice(SPEAKERS)
+            if rng.random() < 0.5:
+                sentence, question = fact()
+                questions.append({"question": question, "answer": sentence})
+                turns.append(f"{speaker}: {_paragraph(rng, sentence, rng.randint(0, 8))}")
+            else:
+                turns.append(f"{speaker}: Thank you. " + " ".join(_filler(rng, rng.randint(0, 3))))
+        documents.append((Document(page_content="\n".join(turns), metadata={}), "transcript"))
+
+    return documents, questions
+
+
+def chunk_stats(documents: List[Tuple[Document, str]], chunks: List[Document]) -> dict:
+    """Size of the chunks, and the share of them that straddle a unit boundary."""
+    straddling = 0
+    by_source = {}
+    for chunk in chunks:
+        by_source.setdefault(chunk.metadata["doc"], []).append(chunk)
+    for i, (document, source_type) in enumerate(documents):
+        boundaries = [start for start, _, _ in _units(document.page_content, UNIT_PATTERNS[source_type])][1:]
+        for chunk in by_source.get(i, []):
+            start = chunk.metadata["start_index"]
+            end = start + len(chunk.page_content)
+            straddling += any(start < boundary < end - 1 for boundary in boundaries)
+    sizes = [len(chunk.page_content) for chunk in chunks]
+    return {
+        "chunks": len(chunks),
+        "mean_chars": sum(sizes) / len(sizes),
+        "straddling_units": straddling / len(chunks),
+    }
+
+
+def evaluate(storage: Storage, questions: List[Question], k: int, mode: str) -> dict:
+    """Hit rate, MRR and the context the retrieved chunks add to the prompt."""
+    hits = reciprocal_ranks = context_tokens = tokens_to_hit = 0
+    for question in questions:
+        documents = storage.retrieve(question["question"], k=k, mode=mode)
+        context_tokens += sum(estimate_tokens(doc.page_content) for doc in documents)
+        for rank, doc in enumerate(documents, start=1):
+            if question["answer"] in doc.page_content:
+                hits += 1
+                reciprocal_ranks += 1 / rank
+                tokens_to_hit += sum(estimate_tokens(d.page_content) for d in documents[:rank])
+                break
+    return {
+        f"hit_rate_at_{k}": hits / len(questions),
+        "mrr": reciprocal_ranks / len(questions),
+        "mean_context_tokens": context_tokens / len(questions),
+        # tokens the prompt needs up to and including the first answering chunk, over the hits
+        "mean_tokens_to_hit": tokens_to_hit / max(hits, 1),
+    }
+
+
+def run(seed: int, k: int, mode: str, chunk_size: int) -> dict:
+    documents, questions = generate_corpus(seed)
+    results = {"seed": seed, "k": k, "mode": mode, "chunk_size": chunk_size, "questions": len(questions), "strategies": {}}
+    for strategy in CHUNKING_STRATEGIES:
+        chunks = []
+        for i, (document, source_type) in enumerate(documents):
+            document.metadata["doc"] = i
+            chunks.extend(split_document(document, source_type, strategy=strategy, chunk_size=chunk_size))
+        with tempfile.TemporaryDirectory() as path:
+            storage = Storage(path=path)
+            storage.add_documents(chunks, save=False)
+            results["strategies"][strategy] = {**chunk_stats(documents, chunks), **evaluate(storage, questions, k, mode)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare retrieval hit rate and context size of the chunking strategies.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated corpus.")
+    parser.add_argument("--k", type=int, default=4, help="Chunks retrieved per question.")
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, default="hybrid")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = run(args.seed, args.k, args.mode, args.chunk_size)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import tempfile
+import time
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+# offline and deterministic by default; override either variable to benchmark the hosted models
+os.environ.setdefault("EMBEDDINGS_PROVIDER", "fake")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage, SystemMessage
+from typing_extensions import List, Optional, Tuple
+
+from chat_query import create_agent_graph
+from chunking import CHUNKING_STRATEGY, split_document
+from llm import EMBEDDINGS_PROVIDER, LLM_PROVIDER, get_llm
+from load import RAG_K, RETRIEVAL_MODE, RETRIEVAL_MODES, Storage
+
+BASE_DIR = Path(__file__).resolve().parent
+QUESTIONS_PATH = BASE_DIR / "bench_questions.json"
+STAGES = ("retrieve", "rag", "agent")
+
+
+def load_questions(path: str | Path = QUESTIONS_PATH) -> dict:
+    """Loads a question set: its version, the fixture documents and the questions."""
+    with open(path) as f:
+        return json.load(f)
+
+
+def build_storage(documents: List[dict], path: str) -> Storage:
+    """Indexes the fixture documents the way `upload.py` indexes the real sources."""
+    chunks = []
+    for doc in documents:
+        metadata = {
+            "file_name": doc["source_url"],
+            "source_url": doc["source_url"],
+            "chamber": doc.get("chamber"),
+            "journal_date": date.fromisoformat(doc["journal_date"]) if doc.get("journal_date") else None,
+            "bill_number": doc.get("bill_number"),
+            "act_summary": None,
+            "as_enacted": None,
+        }
+        chunks.extend(split_document(Document(page_content=doc["text"], metadata=metadata), doc.get("source_type")))
+    storage = Storage(path=path)
+    storage.add_documents(chunks, save=False)
+    return storage
+
+
+def _score(expected: List[str], documents: List[Document]) -> Tuple[float, float]:
+    # recall of the expected sources among the documents, and the reciprocal rank of the first one
+    urls = [doc.metadata.get("source_url") for doc in documents]
+    recall = len(set(expected) & set(urls)) / len(expected)
+    first = next((rank for rank, url in enumerate(urls, start=1) if url in expected), None)
+    return recall, 1 / first if first else 0.0
+
+
+def _latency(ms: List[float]) -> dict:
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(np.mean(ms)),
+    }
+
+
+def _llm_counters() -> Tuple[int, int]:
+    # (calls, prompt tokens) so far, known only for the fake model
+    llm = get_llm()
+    return getattr(llm, "calls", 0), getattr(llm, "prompt_tokens", 0)
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kilobytes on Linux
+
+
+def _summarize(scores: List[Tuple[float, float]], ms: List[float], calls: int, tokens: int, k: Optional[int]) -> dict:
+    n = len(scores)
+    result = {
+        f"recall_at_{k}" if k else "recall": sum(recall for recall, _ in scores) / n,
+        "mrr": sum(rr for _, rr in scores) / n,
+        **_latency(ms),
+        "llm_calls_per_question": calls / n,
+        "prompt_tokens_per_question": tokens / n,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    return result
+
+
+def bench_retrieve(storage: Storage, questions: List[dict], k: int, mode: str, repeat: int = 1) -> dict:
+    """Ranking quality and latency of `Storage.retrieve`, without any filters."""
+    scores, ms = [], []
+    for _ in range(repeat):
+        for question in questions:
+            started = time.perf_counter()
+            documents = storage.retrieve(question["question"], k=k, mode=mode)
+            ms.append((time.perf_counter() - started) * 1000)
+            scores.append(_score(question["expected_source_urls"], documents))
+    return _summarize(scores, ms, 0, 0, k)
+
+
+def bench_rag(storage: Storage, questions: List[dict], mode: str, repeat: int = 1) -> dict:
+    """Quality of the reranked context, and latency and prompt size of `Storage.rag`."""
+    scores, ms = [], []
+    calls, tokens = _llm_counters()
+    for _ in range(repeat):
+        for question in questions:
+            started = time.perf_counter()
+            retrieval = storage.rag(question["question"], mode=mode, **question.get("filters", {}))
+            ms.append((time.perf_counter() - started) * 1000)
+            scores.append(_score(question["expected_source_urls"], retrieval["documents"]))
+    end_calls, end_tokens = _llm_counters()
+    return _summarize(scores, ms, end_calls - calls, end_tokens - tokens, None)
+
+
+async def bench_agent(storage: Storage, questions: List[dict], repeat: int = 1) -> dict:
+    """The full agent pipeline of `main.py`: model, rag tool calls and the final answer."""
+    with open(BASE_DIR / "prompts.json") as f:
+        system_prompt = json.load(f)["user_query"]
+    graph = create_agent_graph(storage)
+
+    scores, ms = [], []
+    calls, tokens = _llm_counters()
+    for _ in range(repeat):
+        for question in questions:
+            messages = [SystemMessage(content=system_prompt), HumanMessage(content=question["question"])]
+            started = time.perf_counter()
+            state = await graph.ainvoke({"messages": messages, "documents": []})
+            ms.append((time.perf_counter() - started) * 1000)
+            scores.append(_score(question["expected_source_urls"], state.get("documents", [])))
+    end_calls, end_tokens = _llm_counters()
+    return _summarize(scores, ms, end_calls - calls, end_tokens - tokens, None)
+
+
+def run(
+    questions_path: str | Path = QUESTIONS_PATH,
+    index_path: Optional[str] = None,
+    k: int = 4,
+    mode: str = RETRIEVAL_MODE,
+    stages: Tuple[str, ...] = STAGES,
+    repeat: int = 1,
+) -> dict:
+    """Runs the benchmark stages and returns the results as a JSON-serializable dict.
+
+    Args:
+        questions_path (str | Path): The question set, see `bench_questions.json`.
+        index_path (Optional[str]): An existing index to benchmark instead of the fixture documents
+                                    of the question set. Its embeddings must match EMBEDDINGS_PROVIDER.
+        k (int): Chunks retrieved per question in the "retrieve" stage.
+        mode (str): Retrieval mode, one of `RETRIEVAL_MODES`.
+        stages (Tuple[str, ...]): Which of `STAGES` to run.
+        repeat (int): Passes over the questions, for steadier latency percentiles.
+    """
+    question_set = load_questions(questions_path)
+    questions = question_set["questions"]
+    results = {
+        "question_set_version": question_set["version"],
+        "questions": len(questions),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "k": k,
+            "rag_k": RAG_K,
+            "mode": mode,
+            "repeat": repeat,
+            "chunking": CHUNKING_STRATEGY,
+            "index": index_path or "fixture",
+            "embeddings": EMBEDDINGS_PROVIDER,
+            "llm": LLM_PROVIDER,
+        },
+        "stages": {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_path:
+        started = time.perf_counter()
+        if index_path:
+            storage = Storage(path=index_path, from_path=True)
+        else:
+            storage = build_storage(question_set["documents"], tmp_path)
+        results["index"] = {
+            "vectors": storage.vector_store.index.ntotal,
+            "build_ms": (time.perf_counter() - started) * 1000,
+            "peak_rss_mb": _peak_rss_mb(),
+        }
+
+        if "retrieve" in stages:
+            results["stages"]["retrieve"] = bench_retrieve(storage, questions, k, mode, repeat)
+        if "rag" in stages:
+            results["stages"]["rag"] = bench_rag(storage, questions, mode, repeat)
+        if "agent" in stages:
+            results["stages"]["agent"] = asyncio.run(bench_agent(storage, questions, repeat))
+    return results
+
+
+def compare(results: dict, baseline: dict) -> List[str]:
+    """Lines with every stage metric of `results` next to the same metric of `baseline`."""
+    if results["question_set_version"] != baseline.get("question_set_version"):
+        return [f"Baseline uses question set version {baseline.get('question_set_version')}, not comparable."]
+    lines = []
+    for stage, metrics in results["stages"].items():
+        for name, value in metrics.items():
+            old = baseline.get("stages", {}).get(stage, {}).get(name)
+            if isinstance(old, (int, float)):
+                lines.append(f"{stage}.{name}: {old:.4g} -> {value:.4g} ({value - old:+.4g})")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency on a versioned question set.")
+    parser.add_argument("--questions", default=str(QUESTIONS_PATH), help="Question set JSON.")
+    parser.add_argument("--index", default=None, help="Benchmark this existing index instead of the fixture documents.")
+    parser.add_argument("--k", type=int, default=4, help="Chunks retrieved per question in the retrieve stage.")
+    parser.add_argument("--mode", choices=RETRIEVAL_MODES, default=RETRIEVAL_MODE)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the questions.")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file.")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against.")
+    args = parser.parse_args()
+
+    results = run(args.questions, args.index, args.k, args.mode, tuple(args.stages), args.repeat)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            print("\n".join(compare(results, json.load(f))))
@@ -1,17 +1,22 @@
+import asyncio
 import datetime
 import logging
 import operator
 from typing import Annotated, Any, List, TypedDict
 
 from langchain_core.documents import Document
-from langchain_core.messages import BaseMessage, ToolMessage
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
 from langchain_core.tools import tool
 from langgraph.graph import END, StateGraph
 from langgraph.prebuilt import ToolNode
 
-from load import Storage, make_rag_tool
-from llm import llm
+from pydantic import ValidationError
+
+from history import compact_tool_messages
+from load import RAGToolInput, Storage, abatch_rag, make_rag_tool
+from llm import get_llm
 from schemas import DocumentPayload, UserQueryResponse
+from tracing import count, count_usage, span, traced
 
 logger = logging.getLogger(__name__)
 
@@ -30,72 +35,20 @@ class AgentState(TypedDict):
     documents: Annotated[List[Document], operator.add]
 
 
-def _deserialize_tool_output(raw_content: Any) -> Any:
-    """Best-effort conversion of tool output into Python objects."""
+def message_text(raw_content: Any) -> str:
+    """Returns the text of a message's content, which may be a string or a list of blocks."""
+    if (
+        isinstance(raw_content, list)
+        and raw_content
+        and isinstance(raw_content[0], dict)
+        and "text" in raw_content[0]
+    ):
+        return raw_content[0]["text"]
     if isinstance(raw_content, str):
-        logger.debug(
-            "Attempting to deserialize tool output string (len=%d)",
-            len(raw_content),
-        )
-        # Skip obvious error strings before attempting eval
-        if raw_content.startswith("Error invoking tool"):
-            logger.error("Tool returned error text: %s", raw_content)
-            return {}
-
-        try:
-            return eval(  # noqa: S307 – trusted internal string
-                raw_content,
-                {
-                    "Document": Document,
-                    "datetime": datetime,
-                    "date": datetime.date,
-                    "Retrieval": dict,
-                },
-            )
-        except Exception:  # pragma: no cover - never fail the whole request
-            logger.warning("Failed to deserialize tool output", exc_info=True)
-            return {}
-    return raw_content
-
-
-def _collect_documents(candidate: Any) -> List[Document]:
-    documents: List[Document] = []
-
-    if not candidate:
-        return documents
-
-    if isinstance(candidate, dict):
-        candidate = candidate.get("documents", [])
-
-    if not isinstance(candidate, list):
-        return documents
-
-    for item in candidate:
-        if isinstance(item, Document):
-            logger.debug(
-                "Collected Document id=%s metadata_keys=%s",
-                getattr(item, "id", None),
-                list(getattr(item, "metadata", {}).keys()),
-            )
-            documents.append(item)
-        elif isinstance(item, dict):
-            try:
-                metadata = item.get("metadata", {}) or {}
-                doc = Document(
-                    page_content=item.get("page_content", ""),
-                    metadata=metadata,
-                    id=item.get("id"),
-                )
-                documents.append(doc)
-                logger.debug(
-                    "Constructed Document from dict id=%s metadata_keys=%s",
-                    item.get("id"),
-                    list(metadata.keys()),
-                )
-            except Exception:
-                logger.exception("Failed to convert retrieved item into Document")
-                continue
-    return documents
+        return raw_content
+    if isinstance(raw_content, list) and not raw_content:
+        return ""
+    return str(raw_content)
 
 
 def create_agent_graph(storage: Storage):
@@ -106,7 +59,7 @@ def create_agent_graph(storage: Storage):
     rag_tool = make_rag_tool(storage)
     tools = [rag_tool, get_current_datetime]
     tool_node = ToolNode(tools)
-    model = llm.bind_tools(tools)
+    model = get_llm().bind_tools(tools)
 
     def should_continue(state: AgentState):
         messages = state["messages"]
@@ -124,10 +77,13 @@ def create_agent_graph(storage: Storage):
             return "end"
         return "continue"
 
-    def call_model(state: AgentState):
-        messages = state["messages"]
+    async def call_model(state: AgentState):
+        # results of earlier tool steps are cut down to their citations once this turn outgrows its budget
+        messages = compact_tool_messages(state["messages"])
         logger.debug("Calling model with %d messages", len(messages))
-        response = model.invoke(messages)
+        with span("llm.agent"):
+            response = await model.ainvoke(messages)
+        count_usage(response)
         logger.debug(
             "Model responded with type=%s has_tool_calls=%s",
             type(response).__name__,
@@ -135,15 +91,60 @@ def create_agent_graph(storage: Storage):
         )
         return {"messages": [response]}
 
-    def call_tools(state: AgentState):
-        tool_messages = tool_node.invoke(state["messages"])
+    async def run_rag_batch(rag_calls: List[dict]) -> List[ToolMessage]:
+        # several rag calls in one turn: one embedding request and one FAISS search for all of them
+        messages: dict = {}
+        valid_calls, requests = [], []
+        for call in rag_calls:
+            try:
+                requests.append(RAGToolInput(**call["args"]))
+                valid_calls.append(call)
+            except ValidationError as e:
+                messages[call["id"]] = ToolMessage(
+                    content=f"Error: {e}", name="rag", tool_call_id=call["id"], status="error"
+                )
+
+        try:
+            results = await abatch_rag(storage, requests)
+        except Exception as e:
+            logger.exception("Batched rag calls failed")
+            results = [(f"Error: {e!r}", None)] * len(valid_calls)
+        for call, (content, retrieval) in zip(valid_calls, results):
+            messages[call["id"]] = ToolMessage(
+                content=content,
+                artifact=retrieval,
+                name="rag",
+                tool_call_id=call["id"],
+                status="success" if retrieval is not None else "error",
+            )
+        return [messages[call["id"]] for call in rag_calls]
+
+    async def call_tools(state: AgentState):
+        last_message = state["messages"][-1]
+        tool_calls = getattr(last_message, "tool_calls", None) or []
+        rag_calls = [call for call in tool_calls if call["name"] == "rag"]
+        count("tool_calls", len(tool_calls))
+        if len(rag_calls) > 1:
+            logger.info("Batching %d rag calls", len(rag_calls))
+            other_calls = [call for call in tool_calls if call["name"] != "rag"]
+            pending = [run_rag_batch(rag_calls)]
+            if other_calls:
+                pending.append(tool_node.ainvoke([AIMessage(content="", tool_calls=other_calls)]))
+            batches = await asyncio.gather(*pending)
+            by_id = {message.tool_call_id: message for batch in batches for message in batch}
+            tool_messages = [by_id[call["id"]] for call in tool_calls]
+        else:
+            tool_messages = await tool_node.ainvoke(state["messages"])
 
         documents: List[Document] = []
         for message in tool_messages:
             if isinstance(message, ToolMessage) and message.name == "rag":
                 logger.info("Processing output from tool=%s", message.name)
-                retrieval_output = _deserialize_tool_output(message.content)
-                documents.extend(_collect_documents(retrieval_output))
+                # the rag tool hands its Retrieval over as the message artifact
+                if isinstance(message.artifact, dict):
+                    documents.extend(message.artifact.get("documents", []))
+                elif message.status == "error":
+                    logger.error("Tool returned error: %s", message.content)
         logger.info("Tool invocation produced %d documents", len(documents))
         return {"messages": tool_messages, "documents": documents}
 
@@ -155,17 +156,7 @@ def create_agent_graph(storage: Storage):
             type(raw_content).__name__,
         )
 
-        if (
-            isinstance(raw_content, list)
-            and raw_content
-            and isinstance(raw_content[0], dict)
-            and "text" in raw_content[0]
-        ):
-            final_response_text = raw_content[0]["text"]
-        elif isinstance(raw_content, str):
-            final_response_text = raw_content
-        else:
-            final_response_text = str(raw_content)
+        final_response_text = message_text(raw_content)
 
         payloads: List[DocumentPayload] = []
         seen_keys: set[str] = set()
@@ -218,9 +209,9 @@ def create_agent_graph(storage: Storage):
         return {"final_response": final_response}
 
     workflow = StateGraph(AgentState)
-    workflow.add_node("agent", call_model)
-    workflow.add_node("action", call_tools)
-    workflow.add_node("builder", build_final_response)
+    workflow.add_node("agent", traced("node.agent")(call_model))
+    workflow.add_node("action", traced("node.action")(call_tools))
+    workflow.add_node("builder", traced("node.builder")(build_final_response))
 
     workflow.set_entry_point("agent")
     workflow.add_conditional_edges(
@@ -0,0 +1,218 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterator, Optional, Set, Tuple, Union
+
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+from typing_extensions import List
+
+from keyword_index import FTS_TOKENIZER, index_terms, match_expression, tokenize
+
+# Query terms found in more than this share of chunks are left out of keyword searches: their BM25
+# weight is below log(2), and matching them would score most of the corpus on every query.
+KEYWORD_MAX_DOC_FREQUENCY = float(os.getenv("KEYWORD_MAX_DOC_FREQUENCY", "0.5"))
+
+# BM25 over the chunk terms: `chunk_terms` is an FTS5 index whose content lives in
+# `chunk_terms_text`, kept in sync by triggers. Its own INTEGER PRIMARY KEY is used as the FTS
+# rowid, since the implicit rowids of `chunks` may change on VACUUM.
+_KEYWORD_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS chunk_terms_text (rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, terms TEXT NOT NULL)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_terms USING fts5("
+    f"terms, content='chunk_terms_text', content_rowid='rowid', tokenize=\"{FTS_TOKENIZER}\")",
+    "CREATE TRIGGER IF NOT EXISTS chunk_terms_insert AFTER INSERT ON chunk_terms_text BEGIN "
+    "INSERT INTO chunk_terms (rowid, terms) VALUES (new.rowid, new.terms); END",
+    "CREATE TRIGGER IF NOT EXISTS chunk_terms_delete AFTER DELETE ON chunk_terms_text BEGIN "
+    "INSERT INTO chunk_terms (chunk_terms, rowid, terms) VALUES ('delete', old.rowid, old.terms); END",
+)
+
+
+def _encode(value: Any) -> Any:
+    # tag dates so they come back as dates, e.g. `journal_date`
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    return str(value)
+
+
+def _decode(obj: Dict[str, Any]) -> Any:
+    if "__date__" in obj:
+        return date.fromisoformat(obj["__date__"])
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """Docstore keeping chunk text and metadata in a SQLite file instead of a pickled dict.
+
+    Nothing is loaded up front: `search` fetches a single chunk by id, so only the hits of a
+    vector search are ever read into Python objects. The BM25 keyword index of the chunks lives in
+    the same file, see `keyword_search`. Writes stay in an open transaction until `commit()`, which
+    `Storage.save` calls together with writing the FAISS index, so chunks of an interrupted
+    ingestion are rolled back along with its unsaved vectors.
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        """Initialize the SQLiteDocstore.
+
+        Args:
+            path (str): Path of the SQLite file. Created if it does not exist, unless read-only.
+                        The keyword index of a file written by an older version is built on the
+                        first writable open.
+            read_only (bool): Open the file read-only, e.g. when many workers share it.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            self._create_keyword_index()
+            self._conn.commit()
+        self.has_keyword_index = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chunk_terms'"
+        ).fetchone() is not None
+        if self.has_keyword_index:
+            # per-term document counts; a temp table, so it works on read-only files too
+            self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.chunk_vocab USING fts5vocab(main, chunk_terms, 'row')")
+        self._doc_frequencies: Dict[str, int] = {}  # cached until the next write
+        self._chunk_count: Optional[int] = None
+
+    def _create_keyword_index(self):
+        exists = self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunk_terms'").fetchone()
+        for statement in _KEYWORD_SCHEMA:
+            self._conn.execute(statement)
+        if exists:
+            return
+        cursor = self._conn.execute("SELECT id, page_content FROM chunks")
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            self._conn.executemany(
+                "INSERT INTO chunk_terms_text (id, terms) VALUES (?, ?)",
+                [(doc_id, index_terms(page_content)) for doc_id, page_content in rows],
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, search: str) -> Union[str, Document]:
+        """Returns the chunk with the given id, or an error string if there is none."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1], object_hook=_decode))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        """Adds chunks, keyed by id. Not persisted until `commit()`."""
+        rows = [
+            (doc_id, doc.page_content, json.dumps(doc.metadata, default=_encode))
+            for doc_id, doc in texts.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, page_content, metadata) VALUES (?, ?, ?)", rows
+            )
+            # delete and insert rather than REPLACE, which would skip the delete trigger
+            self._conn.executemany("DELETE FROM chunk_terms_text WHERE id = ?", [(doc_id,) for doc_id in texts])
+            self._conn.executemany(
+                "INSERT INTO chunk_terms_text (id, terms) VALUES (?, ?)",
+                [(doc_id, index_terms(doc.page_content)) for doc_id, doc in texts.items()],
+            )
+            self._doc_frequencies, self._chunk_count = {}, None
+
+    def delete(self, ids: List) -> None:
+        """Deletes chunks by id. Not persisted until `commit()`."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(doc_id,) for doc_id in ids])
+            self._conn.executemany("DELETE FROM chunk_terms_text WHERE id = ?", [(doc_id,) for doc_id in ids])
+            self._doc_frequencies, self._chunk_count = {}, None
+
+    def clear(self) -> None:
+        """Deletes every chunk. Not persisted until `commit()`."""
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM chunk_terms_text")
+            self._doc_frequencies, self._chunk_count = {}, None
+
+    def keyword_search(self, query: str, k: int = 4, ids: Optional[Set[str]] = None) -> List[Tuple[str, float]]:
+        """Returns the `k` best BM25 matches for a query, scored by SQLite's FTS5 `bm25()`.
+
+        Terms in more than `KEYWORD_MAX_DOC_FREQUENCY` of the chunks are left out; a query made of
+        such terms only has no keyword matches, and hybrid retrieval ranks it by vectors alone.
+
+        Args:
+            query (str): The query text, split into terms with `keyword_index.tokenize`.
+            k (int): The number of ids to return.
+            ids (Optional[Set[str]]): If given, only chunks with these ids are considered.
+
+        Returns:
+            List[Tuple[str, float]]: Chunk ids with their BM25 scores (higher is better), best first.
+        """
+        if not self.has_keyword_index or (ids is not None and not ids):
+            return []
+        expression = match_expression(self._selective_terms(list(dict.fromkeys(tokenize(query)))))
+        if expression is None:
+            return []
+        sql = (
+            "SELECT chunk_terms_text.id, bm25(chunk_terms) AS score FROM chunk_terms "
+            "JOIN chunk_terms_text ON chunk_terms_text.rowid = chunk_terms.rowid "
+            "WHERE chunk_terms MATCH ?"
+        )
+        params: list = [expression]
+        if ids is not None:
+            sql += " AND chunk_terms_text.id IN (SELECT value FROM json_each(?))"
+            params.append(json.dumps(list(ids)))
+        sql += " ORDER BY score LIMIT ?"
+        params.append(k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        # bm25() is lower for better matches
+        return [(doc_id, -score) for doc_id, score in rows]
+
+    def _selective_terms(self, terms: List[str]) -> List[str]:
+        with self._lock:
+            if self._chunk_count is None:
+                self._chunk_count = self._conn.execute("SELECT COUNT(*) FROM chunk_terms_text").fetchone()[0]
+            if len(self._doc_frequencies) > 100_000:
+                self._doc_frequencies = {}
+            for term in terms:
+                if term not in self._doc_frequencies:
+                    row = self._conn.execute("SELECT doc FROM temp.chunk_vocab WHERE term = ?", (term,)).fetchone()
+                    self._doc_frequencies[term] = row[0] if row else 0
+            limit = KEYWORD_MAX_DOC_FREQUENCY * self._chunk_count
+        return [term for term in terms if 0 < self._doc_frequencies[term] <= limit]
+
+    def commit(self):
+        """Persists all pending additions and deletions."""
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        """Closes the file. Changes not committed yet are discarded."""
+        with self._lock:
+            self._conn.close()
+
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Document]:
+        """Iterates over every chunk, a batch at a time."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT id, page_content, metadata FROM chunks")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for doc_id, page_content, metadata in rows:
+                    yield Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata, object_hook=_decode))
@@ -0,0 +1,149 @@
+import bisect
+import os
+import re
+from typing import Optional, Pattern
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from typing_extensions import List, Tuple
+
+# "structured" cuts acts at their sections, journals at their bill and order-of-business entries
+# and transcripts at speaker turns; "fixed" is the plain 1000 character splitter used before.
+# "fixed" stays the default until "structured" beats it on the real scraped sources; so far it has
+# only been compared on the generated corpus of bench_chunking.py.
+CHUNKING_STRATEGIES = ("fixed", "structured")
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "fixed")
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+# units shorter than this are merged with the next one, as long as the result fits in CHUNK_SIZE
+MIN_CHUNK_SIZE = int(os.getenv("MIN_CHUNK_SIZE", "200"))
+# bump when the boundaries change, so the next upload re-chunks every source
+CHUNKING_VERSION = 1
+
+SOURCE_TYPES = ("act", "journal", "transcript")
+
+# "Sec. 1.", "Sec. 12a.", "* * * Education * * *" headings of an act
+ACT_UNIT = re.compile(r"^[ \t]*(?:Sec\.[ \t]+\d+[a-z]?\.|\*[ \t]*\*[ \t]*\*.+\*[ \t]*\*[ \t]*\*[ \t]*$)", re.MULTILINE)
+# journal entries start with the bill they act on or an order-of-business heading
+JOURNAL_UNIT = re.compile(
+    r"^[ \t]*(?:"
+    r"(?:H|S)\.(?:C\.R\.|R\.)?[ \t]*\d+\b"
+    r"|J\.R\.(?:H|S)\.[ \t]*\d+\b"
+    r"|Message from the (?:House|Senate|Governor)"
+    r"|Bills? (?:Introduced|Referred|Passed|Amended|Messaged|Signed)"
+    r"|(?:Second|Third) Reading"
+    r"|(?:Joint|House|Senate|Concurrent) Resolutions?"
+    r"|Proposals? of Amendment"
+    r"|Committee (?:Bills?|Relieved)"
+    r"|Rules Suspended"
+    r"|Consideration (?:Postponed|Resumed)"
+    r"|Adjournment"
+    r")",
+    re.MULTILINE,
+)
+# a new speaker: a caption marker (">>") or a "Rep. Smith:" / "CHAIR LANPHER:" label
+TRANSCRIPT_UNIT = re.compile(r">>|^[ \t]*[A-Z][A-Za-z.'\-]*(?:[ \t]+[A-Z][A-Za-z.'\-]*){0,3}:(?=[ \t])", re.MULTILINE)
+
+UNIT_PATTERNS = {"act": ACT_UNIT, "journal": JOURNAL_UNIT, "transcript": TRANSCRIPT_UNIT}
+
+
+def chunker_id(strategy: Optional[str] = None, chunk_size: int = CHUNK_SIZE) -> str:
+    """Identifies the chunking in effect, for content hashes that should change with it."""
+    return f"{strategy or CHUNKING_STRATEGY}-v{CHUNKING_VERSION}-{chunk_size}"
+
+
+def chunked_hash(content_hash: str, chunker: Optional[str] = None) -> str:
+    """Adds the chunking to a source's content hash, so changing the chunking re-chunks the source.
+
+    The default fixed chunking adds nothing: it cuts the same chunks as the splitter used before the
+    strategies existed, so the hashes of indexes built back then stay valid.
+    """
+    chunker = chunker or chunker_id()
+    return content_hash if chunker == chunker_id("fixed", 1000) else f"{content_hash}:{chunker}"
+
+
+def page_starts(pages: List[str]) -> List[int]:
+    """Returns the offset of every page in the text `load.PDF` builds from `pages`."""
+    starts, offset = [], 0
+    for text in pages:
+        starts.append(offset)
+        offset += len(text) + 1  # pages are joined with a newline after each
+    return starts
+
+
+def _units(text: str, pattern: Pattern) -> List[Tuple[int, int, Optional[str]]]:
+    # (start, end, heading) of every unit, with any text before the first heading as its own unit
+    starts = [match.start() for match in pattern.finditer(text)]
+    if not starts or starts[0] > 0:
+        starts.insert(0, 0)
+    units = []
+    for start, end in zip(starts, starts[1:] + [len(text)]):
+        if text[start:end].strip():
+            match = pattern.match(text, start)
+            heading = match.group(0).strip() if match and match.group(0) != ">>" else None
+            units.append((start, end, heading))
+    return units
+
+
+def _merge_small(units: List[Tuple[int, int, Optional[str]]], chunk_size: int, min_size: int):
+    merged = []
+    for start, end, heading in units:
+        if merged:
+            prev_start, prev_end, prev_heading = merged[-1]
+            if prev_end - prev_start < min_size and end - prev_start <= chunk_size:
+                merged[-1] = (prev_start, end, prev_heading or heading)
+                continue
+        merged.append((start, end, heading))
+    return merged
+
+
+def split_document(
+    document: Document,
+    source_type: Optional[str] = None,
+    pages: Optional[List[int]] = None,
+    strategy: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    min_size: int = MIN_CHUNK_SIZE,
+) -> List[Document]:
+    """Splits a document into chunks along the units of its source type.
+
+    Units larger than `chunk_size` are split further with the fixed splitter, and every chunk
+    records where it came from: `start_index` (character offset in the document), `page`
+    (1-based, when `pages` is given) and `section` (the heading of its unit, if any).
+
+    Args:
+        document (Document): The document to split.
+        source_type (Optional[str]): One of `SOURCE_TYPES`. Other types use the fixed splitter.
+        pages (Optional[List[int]]): Offsets of the pages in the document, see `page_starts`.
+        strategy (Optional[str]): One of `CHUNKING_STRATEGIES`. Defaults to `CHUNKING_STRATEGY`.
+        chunk_size (int): Maximum chunk size in characters.
+        min_size (int): Units shorter than this are merged with the next unit.
+
+    Returns:
+        List[Document]: The chunks, in document order.
+    """
+    strategy = strategy or CHUNKING_STRATEGY
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy {strategy!r}, expected one of {CHUNKING_STRATEGIES}")
+
+    text = document.page_content
+    if strategy == "structured" and source_type in UNIT_PATTERNS:
+        units = _merge_small(_units(text, UNIT_PATTERNS[source_type]), chunk_size, min_size)
+    else:
+        units = [(0, len(text), None)]
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0, add_start_index=True)
+    chunks = []
+    for start, end, heading in units:
+        unit = text[start:end]
+        if len(unit) <= chunk_size:
+            pieces = [(start + len(unit) - len(unit.lstrip()), unit.strip())]
+        else:
+            pieces = [(start + piece.metadata["start_index"], piece.page_content) for piece in splitter.create_documents([unit])]
+        for offset, content in pieces:
+            if not content:
+                continue
+            metadata = {**document.metadata, "start_index": offset, "section": heading}
+            if pages:
+                metadata["page"] = bisect.bisect_right(pages, offset)
+            chunks.append(Document(page_content=content, metadata=metadata))
+    return chunks
@@ -0,0 +1,195 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """Persistent, size-bounded embedding cache in front of another `Embeddings`.
+
+    Vectors are stored in a SQLite file keyed by a hash of the model name and the text, so
+    unchanged chunks are never re-embedded across runs. When the cache grows past
+    `max_entries`, the least recently used vectors are evicted, `evict_batch` at a time.
+
+    Lookups only read: the `last_used` times of hits are kept in memory and written with the
+    next store, or once `touch_batch` of them are pending. The row count is kept in memory too,
+    so stores never count the table.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        path: str,
+        max_entries: int = 500_000,
+        model_name: Optional[str] = None,
+        evict_batch: Optional[int] = None,
+        touch_batch: int = 1000,
+    ):
+        """Initialize the CachedEmbeddings.
+
+        Args:
+            underlying (Embeddings): The embedder to call on cache misses.
+            path (str): Path of the SQLite cache file. Created if it does not exist.
+            max_entries (int): Maximum number of vectors kept before LRU eviction.
+            model_name (Optional[str]): Name mixed into the cache key. Defaults to the
+                                        `model` attribute of `underlying`.
+            evict_batch (Optional[int]): Vectors evicted below `max_entries` at once, so eviction
+                                         runs rarely. Defaults to 1% of `max_entries`.
+            touch_batch (int): Pending `last_used` updates of cache hits that trigger a write.
+        """
+        self.underlying = underlying
+        self.max_entries = max_entries
+        self.model_name = model_name or getattr(underlying, "model", None) or type(underlying).__name__
+        self.evict_batch = evict_batch if evict_batch is not None else max(1, max_entries // 100)
+        self.touch_batch = touch_batch
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        # other processes may share the file, so this is an estimate, recounted before evicting
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self._touched: Dict[str, float] = {}  # key -> last use, not yet written
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(unique), 500):  # stay under SQLite's variable limit
+                chunk = unique[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            self._touched.update(dict.fromkeys(found, now))
+            if len(self._touched) >= self.touch_batch:
+                self._write_touched()
+                self._conn.commit()
+        return found
+
+    def flush(self):
+        """Writes the pending `last_used` times of cache hits."""
+        with self._lock:
+            self._write_touched()
+            self._conn.commit()
+
+    def _write_touched(self):
+        # callers hold the lock and commit
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(last_used, key) for key, last_used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            self._write_touched()
+            inserted = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in vectors.items()],
+            ).rowcount
+            self._count += max(inserted, 0)
+            if self._count > self.max_entries:
+                (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if self._count > self.max_entries:
+                evicted = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (self._count - self.max_entries + self.evict_batch,),
+                ).rowcount
+                self._count -= evicted
+                logger.info("Evicted %d least recently used embeddings, %d left", evicted, self._count)
+            self._conn.commit()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds documents, only calling the underlying embedder for texts not in the cache."""
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embeds a query, serving repeated queries from the cache."""
+        key = self._key(f"query\0{text}")
+        cached = self._lookup([key])
+        if key in cached:
+            return cached[key]
+
+        vector = self.underlying.embed_query(text)
+        self._store({key: vector})
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        """Async version of `embed_query`; a miss awaits the underlying embedder without holding a thread."""
+        key = self._key(f"query\0{text}")
+        cached = self._lookup([key])
+        if key in cached:
+            return cached[key]
+
+        vector = await self.underlying.aembed_query(text)
+        self._store({key: vector})
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeds several queries with a single cache lookup.
+
+        The missing queries go through the underlying `embed_query` one by one, since providers may
+        embed queries differently from documents; the vectors are shared with `embed_query`.
+        """
+        keys = [self._key(f"query\0{text}") for text in texts]
+        cached = self._lookup(keys)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            vectors = [self.underlying.embed_query(text) for text in missing.values()]
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Async version of `embed_queries`; the missing queries are embedded concurrently."""
+        keys = [self._key(f"query\0{text}") for text in texts]
+        cached = self._lookup(keys)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in cached}
+        if missing:
+            vectors = await asyncio.gather(*(self.underlying.aembed_query(text) for text in missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        return [cached[key] for key in keys]
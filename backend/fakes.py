@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import Any, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from typing_extensions import List
+
+from keyword_index import tokenize
+from rerank import estimate_tokens
+
+# Offline stand-ins for the hosted models, for benchmarks and local runs without API keys.
+# Select them with EMBEDDINGS_PROVIDER=fake and LLM_PROVIDER=fake (see `llm.py`).
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic bag-of-words embeddings.
+
+    Every token of `keyword_index.tokenize` is hashed to a dimension and a sign, and the counts are
+    L2-normalized. Texts that share words end up close, which is enough to compare chunkings and
+    retrieval settings against each other; absolute quality is not comparable to real embeddings.
+    """
+
+    def __init__(self, size: int = 512, latency: float = 0.0):
+        """Initialize the HashingEmbeddings.
+
+        Args:
+            size (int): Dimension of the vectors.
+            latency (float): Seconds every call sleeps, to stand in for an embeddings API round trip.
+                             Async calls sleep without blocking the event loop.
+        """
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for token in tokenize(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._embed(text)
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model that answers from its own prompt.
+
+    When bound to a `rag` tool and the last message is the user's, it calls `rag` with that
+    message as the question. Otherwise it answers with the start of the last message, which is
+    the retrieved context in both the agent and `Storage.rag`. Calls and estimated tokens are
+    counted, so benchmarks can report what a real model would have been sent.
+
+    Every call takes `latency` seconds plus `latency_per_1k_tokens` per thousand prompt tokens,
+    sleeping without blocking the event loop when called asynchronously, so load tests see the
+    same concurrency as with a hosted model.
+    """
+
+    answer_chars: int = 300
+    latency: float = 0.0
+    latency_per_1k_tokens: float = 0.0
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def bind_tools(self, tools, **kwargs):
+        names = [convert_to_openai_tool(tool)["function"]["name"] for tool in tools]
+        return self.bind(tool_names=names, **kwargs)
+
+    def _delay(self, messages: List[BaseMessage]) -> float:
+        prompt_tokens = sum(estimate_tokens(_text(message)) for message in messages)
+        return self.latency + self.latency_per_1k_tokens * prompt_tokens / 1000
+
+    def _respond(self, messages: List[BaseMessage], tool_names: Optional[List[str]]) -> AIMessage:
+        self.calls += 1
+        prompt_tokens = sum(estimate_tokens(_text(message)) for message in messages)
+        last = messages[-1]
+        if tool_names and "rag" in tool_names and isinstance(last, HumanMessage):
+            content = ""
+            tool_calls = [{"name": "rag", "args": {"question": _text(last)}, "id": f"call_{self.calls}"}]
+        else:
+            content = "According to the records: " + re.sub(r"\s+", " ", _text(last)).strip()[: self.answer_chars]
+            tool_calls = []
+        completion_tokens = estimate_tokens(content) + 10 * len(tool_calls)
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        return AIMessage(
+            content=content,
+            tool_calls=tool_calls,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        tool_names: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        delay = self._delay(messages)
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, tool_names))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        tool_names: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        delay = self._delay(messages)
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, tool_names))])
@@ -0,0 +1,218 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from typing_extensions import List
+
+from llm import get_llm
+from rerank import estimate_tokens
+from tracing import count_usage, span
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_KEEP_MESSAGES = int(os.getenv("HISTORY_KEEP_MESSAGES", "6"))  # most recent messages, always kept verbatim
+HISTORY_SUMMARY_CACHE = int(os.getenv("HISTORY_SUMMARY_CACHE", "256"))
+# tokens of the current turn's agent steps (tool calls and their results) above which earlier rag
+# results are cut down to their citations; about three full rag contexts (see CONTEXT_TOKEN_BUDGET)
+TOOL_RESULTS_TOKEN_BUDGET = int(os.getenv("TOOL_RESULTS_TOKEN_BUDGET", "6000"))
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant about state "
+    "legislature records. Update the summary with the new messages below. Keep every bill number, "
+    "act, date, chamber and source URL that was mentioned, and what the user wanted to know. "
+    "Answer with the updated summary only, in at most 200 words.\n\n"
+    "Current summary:\n{summary}\n\n"
+    "New messages:\n{messages}"
+)
+
+
+@dataclass
+class HistoryStats:
+    messages_in: int
+    messages_out: int
+    tokens_in: int
+    tokens_out: int
+    summarized: int = 0  # older messages folded into the summary
+    summary_reused: bool = False  # the summary of an older prefix came from the cache
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+
+
+def count_tokens(messages: List[BaseMessage]) -> int:
+    """Rough token count of messages, see `rerank.estimate_tokens`."""
+    return sum(estimate_tokens(_text(message)) for message in messages)
+
+
+def compact_tool_messages(messages: List[BaseMessage], token_budget: int = TOOL_RESULTS_TOKEN_BUDGET) -> List[BaseMessage]:
+    """Replaces the payload of tool results from earlier agent steps with their citations, if needed.
+
+    In the default rag tool mode the tool results are the retrieved excerpts themselves, and the
+    final answer can only use evidence that is still in the prompt. So nothing is cut while the
+    messages after the latest user message fit in `token_budget`. Beyond that, rag results are cut
+    down to the sources of their documents, oldest first, until they fit. Tool messages that answer
+    the latest tool-calling step are always kept whole, since the model has not seen them yet.
+    """
+    last_human = max((i for i, message in enumerate(messages) if isinstance(message, HumanMessage)), default=-1)
+    last_call = max(
+        (i for i, message in enumerate(messages) if isinstance(message, AIMessage) and message.tool_calls),
+        default=None,
+    )
+    if last_call is None:
+        return messages
+    excess = count_tokens(messages[last_human + 1:]) - token_budget
+    if excess <= 0:
+        return messages
+
+    compacted = list(messages)
+    for i in range(last_human + 1, last_call):
+        message = compacted[i]
+        if excess <= 0:
+            break
+        if not (isinstance(message, ToolMessage) and message.name == "rag"):
+            continue
+        documents = message.artifact.get("documents", []) if isinstance(message.artifact, dict) else []
+        sources = list(dict.fromkeys(
+            doc.metadata["source_url"] for doc in documents if doc.metadata.get("source_url")
+        ))
+        if sources:
+            content = f"[Earlier result, {len(documents)} documents] Sources: " + ", ".join(sources)
+        else:
+            content = f"[Earlier result] {_text(message)[:200]}"
+        excess -= estimate_tokens(_text(message)) - estimate_tokens(content)
+        compacted[i] = message.model_copy(update={"content": content})
+    return compacted
+
+
+class HistoryManager:
+    """Keeps the conversation sent to the agent within a token budget.
+
+    The most recent messages are kept verbatim. Once the conversation exceeds the budget, older
+    messages are folded into a running summary. Summaries are cached by a hash of the messages
+    they cover, so on the next turn only the messages that newly aged out are summarized, on top
+    of the cached summary of the earlier ones.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        keep_messages: int = HISTORY_KEEP_MESSAGES,
+        max_summaries: int = HISTORY_SUMMARY_CACHE,
+    ):
+        """Initialize the HistoryManager.
+
+        Args:
+            token_budget (int): Estimated tokens above which older messages are summarized.
+            keep_messages (int): Number of most recent messages that are never summarized.
+            max_summaries (int): Number of summaries kept in the LRU cache.
+        """
+        self.token_budget = token_budget
+        self.keep_messages = keep_messages
+        self.max_summaries = max_summaries
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.compacted = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.summaries_generated = 0
+        self.summary_cache_hits = 0
+
+    async def compact(self, messages: List[BaseMessage]) -> Tuple[List[BaseMessage], HistoryStats]:
+        """Returns the messages to send in place of `messages`, and what compaction saved.
+
+        Args:
+            messages (List[BaseMessage]): The prior conversation, oldest first, without the
+                                          system prompt or the new query.
+        """
+        tokens_in = count_tokens(messages)
+        self.requests += 1
+        self.tokens_in += tokens_in
+
+        if tokens_in <= self.token_budget or len(messages) <= self.keep_messages:
+            self.tokens_out += tokens_in
+            return messages, HistoryStats(len(messages), len(messages), tokens_in, tokens_in)
+
+        split = len(messages) - self.keep_messages
+        older, recent = messages[:split], messages[split:]
+        summary, reused = await self._summarize(older)
+
+        compacted = list(recent)
+        if summary:
+            compacted.insert(0, HumanMessage(content=f"Summary of our earlier conversation:\n{summary}"))
+        tokens_out = count_tokens(compacted)
+        self.compacted += 1
+        self.tokens_out += tokens_out
+        return compacted, HistoryStats(
+            messages_in=len(messages),
+            messages_out=len(compacted),
+            tokens_in=tokens_in,
+            tokens_out=tokens_out,
+            summarized=len(older),
+            summary_reused=reused,
+        )
+
+    async def _summarize(self, messages: List[BaseMessage]) -> Tuple[Optional[str], bool]:
+        # hash of every prefix, so the longest already summarized prefix can be found
+        prefix_keys, digest = [], hashlib.sha256()
+        for message in messages:
+            digest.update(f"{message.type}\0{_text(message)}\0".encode("utf-8"))
+            prefix_keys.append(digest.hexdigest())
+
+        summary, start = "", 0
+        with self._lock:
+            for length in range(len(messages), 0, -1):
+                cached = self._summaries.get(prefix_keys[length - 1])
+                if cached is not None:
+                    self._summaries.move_to_end(prefix_keys[length - 1])
+                    summary, start = cached, length
+                    self.summary_cache_hits += 1
+                    break
+        if start == len(messages):
+            return summary, True
+
+        new_messages = "\n".join(f"{message.type}: {_text(message)}" for message in messages[start:])
+        try:
+            with span("llm.summary"):
+                response = await get_llm().ainvoke(
+                    SUMMARY_PROMPT.format(summary=summary or "(none)", messages=new_messages)
+                )
+            count_usage(response)
+        except Exception:
+            logger.warning("Failed to summarize %d messages, dropping them", len(messages) - start, exc_info=True)
+            return summary or None, start > 0
+        summary = _text(response).strip()
+        self.summaries_generated += 1
+
+        with self._lock:
+            self._summaries[prefix_keys[-1]] = summary
+            while len(self._summaries) > self.max_summaries:
+                self._summaries.popitem(last=False)
+        return summary, start > 0
+
+    def metrics(self) -> dict:
+        """Totals since startup: requests seen, how many were compacted and the tokens saved."""
+        return {
+            "requests": self.requests,
+            "compacted": self.compacted,
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "tokens_saved": self.tokens_in - self.tokens_out,
+            "summaries_generated": self.summaries_generated,
+            "summary_cache_hits": self.summary_cache_hits,
+        }
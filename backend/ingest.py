@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Set
+from uuid import uuid4
+
+from langchain_core.documents import Document
+from typing_extensions import List, TypedDict
+
+from load import Storage
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "512"))
+INGEST_CHECKPOINT_EVERY = int(os.getenv("INGEST_CHECKPOINT_EVERY", "10000"))
+MANIFEST_FILE = "source_manifest.json"
+
+
+class SourceEntry(TypedDict):
+    hash: str
+    ids: List[str]
+
+
+def hash_file(path: str) -> str:
+    """Returns the sha256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_text(text: str, metadata: dict) -> str:
+    """Returns the sha256 hex digest of a text and the metadata it is indexed with."""
+    payload = json.dumps(metadata, sort_keys=True, default=str)
+    return hashlib.sha256(f"{payload}\0{text}".encode("utf-8")).hexdigest()
+
+
+class BulkIngestor:
+    """Buffers splits from many sources and writes them to a Storage in large batches.
+
+    Splits are embedded and added to the in-memory FAISS index once `batch_size` of them are
+    buffered, and the index is only written to disk every `checkpoint_every` splits.
+
+    A source manifest next to the index maps every source (file name or URL) to the hash of its
+    content and the docstore ids of its splits. Sources whose hash is unchanged are skipped,
+    changed sources have their old splits replaced, and sources that disappeared are dropped,
+    so re-running ingestion keeps the index proportional to the corpus. Sources exempted with
+    `keep_unseen`, e.g. those under a directory that is missing during this run, are not dropped.
+    The manifest is only written together with the index, which also lets an interrupted run
+    resume where it stopped.
+    """
+
+    def __init__(
+        self,
+        storage: Storage,
+        batch_size: int = INGEST_BATCH_SIZE,
+        checkpoint_every: int = INGEST_CHECKPOINT_EVERY,
+        resume: bool = True,
+        prune: bool = True,
+    ):
+        """Initialize the BulkIngestor.
+
+        Args:
+            storage (Storage): The Storage to ingest into.
+            batch_size (int): Number of splits to embed and add to the index at once.
+            checkpoint_every (int): Number of splits to add between writes of the index to disk.
+            resume (bool): If True, load the existing index and manifest and only re-index what
+                           changed. If False, start from an empty index.
+            prune (bool): If True, sources not seen during this run are removed from the index
+                          when the ingestor is closed.
+        """
+        self.storage = storage
+        self.batch_size = batch_size
+        self.checkpoint_every = checkpoint_every
+        self.prune = prune
+        self.manifest_path = os.path.join(storage.FAISS_INDEX_PATH, MANIFEST_FILE)
+
+        self.manifest: Dict[str, SourceEntry] = {}
+        self._seen: Set[str] = set()
+        self._keep_unseen: List[Callable[[str], bool]] = []
+        self._buffer: List[Document] = []
+        self._deletes: List[str] = []
+        self._since_checkpoint = 0
+
+        if resume and os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f).get("sources", {})
+            if self.storage.vector_store is None and not self.storage.load():
+                self.manifest = {}  # manifest without an index: nothing to resume from
+            print(f"Resuming ingestion: {len(self.manifest)} sources already indexed.")
+        elif not resume:
+            self.storage.vector_store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Only persist on a clean exit; after a failure the last checkpoint stays authoritative.
+        if exc_type is None:
+            self.close()
+
+    def needs_indexing(self, source_key: str, content_hash: str) -> bool:
+        """Marks a source as seen and checks whether it has to be (re-)indexed.
+
+        If the source is known but its content changed, its previous splits are scheduled for
+        deletion.
+
+        Args:
+            source_key (str): A stable identifier of the source, e.g. its file name or URL.
+            content_hash (str): A hash of the source content, see `hash_file` and `hash_text`.
+
+        Returns:
+            bool: False if the source is already indexed with the same content, or was
+                  already seen during this run.
+        """
+        if source_key in self._seen:
+            return False  # the same source listed twice in one run
+        self._seen.add(source_key)
+        entry = self.manifest.get(source_key)
+        if entry is None:
+            return True
+        if entry["hash"] == content_hash:
+            return False
+
+        self._deletes.extend(self.manifest.pop(source_key)["ids"])
+        return True
+
+    def keep_unseen(self, matches: Callable[[str], bool]):
+        """Exempts sources from pruning even if they are not seen during this run.
+
+        Args:
+            matches (Callable[[str], bool]): Called with each unseen source key; the source is
+                                             kept if it returns True.
+        """
+        self._keep_unseen.append(matches)
+
+    def add(self, source_key: str, content_hash: str, documents: List[Document]):
+        """Queues all splits of one source for ingestion.
+
+        Args:
+            source_key (str): A stable identifier of the source, e.g. its file name or URL.
+            content_hash (str): The hash passed to `needs_indexing` for this source.
+            documents (List[Document]): The splits produced from the source.
+        """
+        for document in documents:
+            document.id = str(uuid4())
+        self._seen.add(source_key)
+        self.manifest[source_key] = SourceEntry(hash=content_hash, ids=[doc.id for doc in documents])
+
+        self._buffer.extend(documents)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Embeds every buffered split into the in-memory index, checkpointing when due."""
+        self._apply_buffer()
+        if self._since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Flushes the buffer, then writes the index and the manifest to disk."""
+        self._apply_buffer()
+        self.storage.save()
+        self._since_checkpoint = 0
+
+        os.makedirs(self.storage.FAISS_INDEX_PATH, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "sources": self.manifest}, f)
+        os.replace(tmp_path, self.manifest_path)
+        print(f"Checkpoint saved: {len(self.manifest)} sources indexed.")
+
+    def close(self):
+        """Drops sources that were not seen during this run (if pruning) and checkpoints."""
+        if self.prune:
+            unseen = [key for key in self.manifest if key not in self._seen]
+            removed = [key for key in unseen if not any(matches(key) for matches in self._keep_unseen)]
+            for key in removed:
+                self._deletes.extend(self.manifest.pop(key)["ids"])
+            if removed:
+                print(f"Removing {len(removed)} sources that no longer exist.")
+            if len(unseen) > len(removed):
+                print(f"Keeping {len(unseen) - len(removed)} sources that were not checked during this run.")
+        self.checkpoint()
+
+    def _apply_buffer(self):
+        if self._deletes:
+            self.storage.delete_documents(self._deletes)
+            self._deletes = []
+
+        for start in range(0, len(self._buffer), self.batch_size):
+            batch = self._buffer[start:start + self.batch_size]
+            self.storage.add_documents(documents=batch, save=False)
+            self._since_checkpoint += len(batch)
+        self._buffer = []
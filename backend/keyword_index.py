@@ -0,0 +1,54 @@
+import re
+from typing import Optional
+
+from typing_extensions import List
+
+# BM25 keyword search runs in SQLite: every chunk's terms are kept in an FTS5 table of the chunk
+# store (see `chunk_store.SQLiteDocstore.keyword_search`), so no worker holds posting lists in
+# memory. This module turns text into those terms and queries into FTS5 match expressions.
+
+# bills ("H.479", "S 12", "H479", "H.C.R. 3"), acts ("Act 181", "Act No. 181") and resolutions
+_IDENTIFIER = re.compile(
+    r"\b(?P<kind>h\.?\s?c\.?\s?r|s\.?\s?c\.?\s?r|j\.?\s?r\.?\s?h|j\.?\s?r\.?\s?s|h|s)\s*\.?\s*(?P<num>\d+)\b"
+    r"|\bact\s+(?:no\.?\s*)?(?P<act>\d+)\b",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what when which who will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Splits text into lower-case terms for keyword search.
+
+    Bill, resolution and act identifiers are kept whole and normalized, so "H.479", "H 479"
+    and "h479" all become the single term "h.479", and "Act No. 181" becomes "act.181".
+    Ordinary words are kept as well, so the bare number still matches on its own.
+    """
+    text = text.lower()
+    terms = []
+    for match in _IDENTIFIER.finditer(text):
+        if match.group("act"):
+            terms.append(f"act.{match.group('act')}")
+        else:
+            kind = re.sub(r"[\s.]", "", match.group("kind"))
+            terms.append(f"{kind}.{match.group('num')}")
+    terms.extend(word for word in _WORD.findall(text) if word not in _STOPWORDS)
+    return terms
+
+
+# the terms are stored space-separated; keep the "." of identifiers such as "h.479" inside a token
+FTS_TOKENIZER = "unicode61 tokenchars '.'"
+
+
+def index_terms(text: str) -> str:
+    """The text stored in the FTS5 table for a chunk: its terms, space-separated."""
+    return " ".join(tokenize(text))
+
+
+def match_expression(terms: List[str]) -> Optional[str]:
+    """An FTS5 query matching chunks that contain any of the terms, or None if there are none."""
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
@@ -1,17 +1,89 @@
-from langchain_community.document_loaders.parsers import LLMImageBlobParser
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import OpenAIEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langsmith import Client
+from functools import lru_cache
+import logging
+import os
+from pathlib import Path
 
 from dotenv import load_dotenv
+from langchain_core.prompts import ChatPromptTemplate
 
 load_dotenv()
 
-llm = ChatGoogleGenerativeAI(model="models/gemini-2.5-flash")
-embeddings = OpenAIEmbeddings()
-image_parser = LLMImageBlobParser(model=llm)
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+logger = logging.getLogger(__name__)
 
-client = Client()
-prompt = client.pull_prompt("rlm/rag-prompt", include_model=True)
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", str((Path(__file__).parent.parent / "embedding_cache.sqlite").resolve())
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+# "openai" / "google", or "fake" for the offline models of fakes.py (benchmarks, no API key needed)
+EMBEDDINGS_PROVIDER = os.getenv("EMBEDDINGS_PROVIDER", "openai")
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google")
+# seconds the fake models wait per call (and per 1000 prompt tokens), to load test the request path
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+FAKE_LLM_LATENCY_PER_1K_TOKENS = float(os.getenv("FAKE_LLM_LATENCY_PER_1K_TOKENS", "0"))
+FAKE_EMBEDDINGS_LATENCY = float(os.getenv("FAKE_EMBEDDINGS_LATENCY", "0"))
+# set to pull "rlm/rag-prompt" from LangSmith instead of using the vendored copy below
+RAG_PROMPT_FROM_HUB = os.getenv("RAG_PROMPT_FROM_HUB", "").lower() in ("1", "true", "yes")
+
+# Vendored copy of the "rlm/rag-prompt" LangSmith hub prompt.
+RAG_PROMPT_TEMPLATE = (
+    "You are an assistant for question-answering tasks. Use the following pieces of retrieved "
+    "context to answer the question. If you don't know the answer, just say that you don't know. "
+    "Use three sentences maximum and keep the answer concise.\n"
+    "Question: {question} \n"
+    "Context: {context} \n"
+    "Answer:"
+)
+
+# Components that reach the network or open files are built on first use, so importing this
+# module stays cheap and works offline.
+
+
+@lru_cache(maxsize=None)
+def get_llm():
+    """Returns the shared chat model."""
+    if LLM_PROVIDER == "fake":
+        from fakes import FakeChatModel
+
+        return FakeChatModel(latency=FAKE_LLM_LATENCY, latency_per_1k_tokens=FAKE_LLM_LATENCY_PER_1K_TOKENS)
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model="models/gemini-2.5-flash")
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    """Returns the shared, disk-cached embedding model."""
+    if EMBEDDINGS_PROVIDER == "fake":
+        from fakes import HashingEmbeddings
+
+        return HashingEmbeddings(latency=FAKE_EMBEDDINGS_LATENCY)
+
+    from langchain_openai import OpenAIEmbeddings
+
+    from embedding_cache import CachedEmbeddings
+
+    return CachedEmbeddings(
+        OpenAIEmbeddings(), path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+    )
+
+
+@lru_cache(maxsize=None)
+def get_image_parser():
+    """Returns the parser used to describe images embedded in documents."""
+    from langchain_community.document_loaders.parsers import LLMImageBlobParser
+
+    return LLMImageBlobParser(model=get_llm())
+
+
+@lru_cache(maxsize=None)
+def get_prompt():
+    """Returns the RAG prompt, taking it from the LangSmith hub only if `RAG_PROMPT_FROM_HUB` is set."""
+    if RAG_PROMPT_FROM_HUB:
+        try:
+            from langsmith import Client
+
+            return Client().pull_prompt("rlm/rag-prompt")
+        except Exception:
+            logger.warning("Failed to pull rlm/rag-prompt, using the vendored copy", exc_info=True)
+    return ChatPromptTemplate.from_messages([("human", RAG_PROMPT_TEMPLATE)])
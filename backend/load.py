@@ -1,7 +1,7 @@
 from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 from langchain_core.documents.base import Blob
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
 from datetime import datetime, date
 from collections import defaultdict
 
@@ -14,15 +14,32 @@ from tqdm import tqdm
 import warnings
 
 from pydantic import BaseModel
-from typing import IO, Optional
+from typing import IO, Dict, Iterable, Iterator, Optional, Set, Tuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from typing_extensions import List, TypedDict
 import io
+import json
+import sqlite3
+import pickle
+import hashlib
 
 from dotenv import load_dotenv
 import os
 from pathlib import Path
 
-from llm import llm, embeddings, image_parser, text_splitter, prompt
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+
+import faiss
+import numpy as np
+
+from llm import get_embeddings, get_llm, get_prompt
+from chunking import page_starts, split_document
+from metadata_index import MetadataIndex
+from rerank import Reranker, select_context
+from chunk_store import SQLiteDocstore
+from tracing import count, count_usage, span, traced
 
 load_dotenv()
 
@@ -30,7 +47,76 @@ STORAGE_PATH = Path(
     os.getenv("STORAGE_PATH", str((Path(__file__).parent.parent / "uploads").resolve()))
 ).resolve()
 
-# TODO: text splitting might be best done within textbook units
+RAG_K = int(os.getenv("RAG_K", "15"))
+# filtered searches over at most this many candidates are scored directly instead of scanning the index
+PREFILTER_SCAN_LIMIT = int(os.getenv("PREFILTER_SCAN_LIMIT", "50000"))
+METADATA_INDEX_FILE = "metadata_index.json"
+# BM25 postings of older versions, superseded by the FTS5 table in the chunk store
+LEGACY_KEYWORD_INDEX_FILE = "keyword_index.json"
+# "hybrid" fuses the vector and BM25 keyword rankings with reciprocal rank fusion, "vector" uses
+# embeddings only; set RETRIEVAL_MODE=hybrid to opt in
+RETRIEVAL_MODES = ("vector", "hybrid")
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))  # taken from each ranking before fusing
+RRF_K = int(os.getenv("RRF_K", "60"))
+# chunk text and metadata live in SQLite; the FAISS position -> chunk id mapping is a plain id list
+CHUNK_STORE_FILE = "chunks.sqlite"
+INDEX_IDS_FILE = "index_ids.txt"
+
+# "flat" loads the exact index into RAM. "sq8" and "ivfpq" open a compressed copy built by
+# quantize.py memory-mapped and read-only, so all worker processes share one page-cache copy:
+# the inverted lists of "ivfpq", and the flat codes of "sq8" with faiss versions that can map
+# them in place (IO_FLAG_MMAP_IFC); older versions read "sq8" codes into each process.
+COMPRESSED_INDEX_KINDS = ("sq8", "ivfpq")
+FAISS_INDEX_MODE = os.getenv("FAISS_INDEX_MODE", "flat")
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+_MMAP_FLAGS = {
+    "sq8": getattr(faiss, "IO_FLAG_MMAP_IFC", 0),
+    "ivfpq": faiss.IO_FLAG_MMAP,
+}
+
+# FAISS releases the GIL while searching, so a small thread pool bounds the CPU spent on
+# query-time retrieval without blocking the event loop of async callers. Only the CPU-bound search
+# runs here: async callers embed the question on the event loop first (see `aembed_queries`), so
+# embeddings API round trips are not capped at SEARCH_WORKERS.
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="faiss-search")
+
+# "retrieve" makes the agent's rag tool return the reranked, trimmed chunks themselves, so the agent's
+# own answer is the only generation; "synthesize" has the tool answer with its own LLM call first.
+RAG_TOOL_MODES = ("retrieve", "synthesize")
+RAG_TOOL_MODE = os.getenv("RAG_TOOL_MODE", "retrieve")
+
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+
+def compressed_index_file(kind: str) -> str:
+    """Returns the file name of a compressed index of the given kind inside the index directory."""
+    return f"index.{kind}.faiss"
+
+
+def compressed_manifest_file(kind: str) -> str:
+    """Returns the file name recording which chunk ids a compressed index was built from."""
+    return f"index.{kind}.json"
+
+
+def index_ids_digest(ids: str) -> str:
+    """Digest of the contents of an `INDEX_IDS_FILE`, i.e. of the FAISS position -> chunk id mapping."""
+    return hashlib.sha256(ids.encode("utf-8")).hexdigest()
+
+
+async def aembed_queries(questions: List[str]) -> List[List[float]]:
+    """Embeds questions on the event loop with the async embeddings API.
+
+    Async callers embed with this and hand the vectors to the search, so waiting on the network
+    never holds one of the few `search_executor` threads.
+    """
+    embeddings = get_embeddings()
+    with span("retrieval.embed"):
+        if hasattr(embeddings, "aembed_queries"):
+            return await embeddings.aembed_queries(questions)
+        return list(await asyncio.gather(*(embeddings.aembed_query(question) for question in questions)))
+
 
 class Retrieval(TypedDict):
     question: str
@@ -42,36 +128,141 @@ class RAGToolInput(BaseModel):
     question: str
     schema: Optional[BaseModel] = None
     date_range: Optional[List[str]] = None
+    chamber: Optional[str] = None
+    bill_number: Optional[str] = None
 
 
 class Storage:
-    """Handles the storage and retrieval of document embeddings using FAISS & SQLAlchemy."""
+    """Handles the storage and retrieval of document embeddings using FAISS & SQLite."""
     
-    def __init__(self, path: str, from_path: bool = False):
+    def __init__(self, path: str, from_path: bool = False, index_mode: str = "flat", read_only: bool = False):
         """Initialize the Storage class.
 
         Args:
             path (str): The path where the FAISS index file will be located.
             from_path (bool): If True, load the vector store from the specified path if it exists.
                               If False, will initialize a new vector store.
+            index_mode (str): "flat" for the exact in-memory index, or one of `COMPRESSED_INDEX_KINDS`
+                              to open the compressed index memory-mapped. Compressed stores are read-only.
+            read_only (bool): Open the chunk store read-only and refuse writes, for servers that only
+                              search an index `upload.py` maintains.
         """
         self.vector_store = None
         self.FAISS_INDEX_PATH = path
+        self.index_mode = index_mode
+        self.open_read_only = read_only
+        self.read_only = read_only
+        self.metadata_index = MetadataIndex()
+        # reorders retrieved chunks before they are packed into the prompt; None uses `rerank.get_reranker()`
+        self.reranker: Optional[Reranker] = None
+        self._id_to_position: Optional[Dict[str, int]] = None
+        # bumped whenever the indexed documents change, so caches of answers can be invalidated
+        self.version = 0
 
         # if a vector store already exists at path, and user specifies from_path, then load vector store from path rather than intializing a new one.
         if from_path:
-            if os.path.exists(path):
-                self.vector_store = FAISS.load_local(
-                    path, embeddings, allow_dangerous_deserialization=True
-                )
-            else:
-                warnings.warn(f"FAISS index file not found at {path}")
+            self.load()
+
+    def load(self) -> bool:
+        """Loads the vector store from `FAISS_INDEX_PATH`, if it exists.
+
+        Only the FAISS index and the list of chunk ids are read; chunk text and metadata stay in
+        the SQLite chunk store and are fetched lazily for search hits. An index saved in the old
+        pickled-docstore format is converted on first load.
+
+        Returns:
+            bool: True if an index was loaded, False otherwise.
+        """
+        if not os.path.exists(self.FAISS_INDEX_PATH):
+            warnings.warn(f"FAISS index file not found at {self.FAISS_INDEX_PATH}")
+            return False
+
+        chunks_path = os.path.join(self.FAISS_INDEX_PATH, CHUNK_STORE_FILE)
+        if not os.path.exists(chunks_path) and os.path.exists(os.path.join(self.FAISS_INDEX_PATH, "index.pkl")):
+            self._migrate_pickled_docstore()
+
+        with open(os.path.join(self.FAISS_INDEX_PATH, INDEX_IDS_FILE)) as f:
+            ids = f.read()
+        index_to_docstore_id = dict(enumerate(ids.split()))
+
+        index = self._read_compressed_index(ids) if self.index_mode != "flat" else None
+        self.read_only = self.open_read_only or index is not None
+        if index is None:
+            index = faiss.read_index(os.path.join(self.FAISS_INDEX_PATH, "index.faiss"))
+        docstore = SQLiteDocstore(chunks_path, read_only=self.read_only)
+        if not docstore.has_keyword_index:
+            docstore = self._add_keyword_index(chunks_path)
+        self.vector_store = FAISS(get_embeddings(), index, docstore, index_to_docstore_id)
+        self._id_to_position = None
+        self.version += 1
 
-    def retrieve(self, query: str) -> List[Document]:
-        """Retrieves documents from the vector store based on similarity to a query.
+        metadata_path = os.path.join(self.FAISS_INDEX_PATH, METADATA_INDEX_FILE)
+        if os.path.exists(metadata_path):
+            self.metadata_index = MetadataIndex.load(metadata_path)
+        if not os.path.exists(metadata_path) or len(self.metadata_index) != self.vector_store.index.ntotal:
+            # missing or out of sync with the index (e.g. an index saved by an older version): rebuild it
+            self.metadata_index = MetadataIndex()
+            self.metadata_index.add(docstore.iter_documents())
+        return True
+
+    def _add_keyword_index(self, chunks_path: str) -> SQLiteDocstore:
+        # A read-only chunk store written by an older version has no keyword index yet: build it
+        # with a writable connection once. Without one, hybrid retrieval falls back to vectors only.
+        try:
+            SQLiteDocstore(chunks_path)
+        except sqlite3.OperationalError:
+            warnings.warn(f"Cannot add the keyword index to {chunks_path}, hybrid retrieval will use vectors only")
+        return SQLiteDocstore(chunks_path, read_only=self.read_only)
+
+    def _read_compressed_index(self, ids: str) -> Optional[faiss.Index]:
+        """Opens the compressed index of `index_mode`, if it was built from the current chunk ids.
+
+        quantize.py records the digest of `INDEX_IDS_FILE` it was built from. Any later upload
+        shifts or extends the FAISS positions, so a compressed index with another digest would map
+        hits to the wrong chunks; it is skipped with a warning and the flat index is loaded instead.
+        """
+        compressed_path = os.path.join(self.FAISS_INDEX_PATH, compressed_index_file(self.index_mode))
+        manifest_path = os.path.join(self.FAISS_INDEX_PATH, compressed_manifest_file(self.index_mode))
+        if not os.path.exists(compressed_path):
+            warnings.warn(f"Compressed index not found at {compressed_path}, loading the flat index")
+            return None
+        manifest = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        if manifest.get("ids_sha256") != index_ids_digest(ids) or manifest.get("ntotal") != len(ids.split()):
+            warnings.warn(
+                f"Compressed index at {compressed_path} was built from other chunks than the current index "
+                "(re-run quantize.py after uploads), loading the flat index"
+            )
+            return None
+
+        index = faiss.read_index(compressed_path, _MMAP_FLAGS[self.index_mode] | faiss.IO_FLAG_READ_ONLY)
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = FAISS_NPROBE
+        return index
+
+    def _migrate_pickled_docstore(self):
+        """Converts an index saved with `FAISS.save_local` to the chunk store format."""
+        pickle_path = os.path.join(self.FAISS_INDEX_PATH, "index.pkl")
+        print(f"Converting pickled docstore at {pickle_path} to {CHUNK_STORE_FILE}...")
+        with open(pickle_path, "rb") as f:
+            legacy_docstore, index_to_docstore_id = pickle.load(f)
+
+        docstore = SQLiteDocstore(os.path.join(self.FAISS_INDEX_PATH, CHUNK_STORE_FILE))
+        docstore.add(legacy_docstore._dict)
+        docstore.commit()
+        self._write_ids(self.FAISS_INDEX_PATH, index_to_docstore_id)
+        os.remove(pickle_path)
+
+    def retrieve(self, query: str, k: int = 4, mode: Optional[str] = None) -> List[Document]:
+        """Retrieves documents from the vector store based on a query.
 
         Args:
             query (str): The query string to search for.
+            k (int): The number of documents to return.
+            mode (Optional[str]): One of `RETRIEVAL_MODES`. Defaults to `RETRIEVAL_MODE`.
 
         Returns:
             List[Document]: A list of documents that match the query.
@@ -79,93 +270,571 @@ class Storage:
         
         if not self.vector_store:
             raise ValueError("Vector store not initialized.")
-        return self.vector_store.similarity_search(query)
+        return self.search(query, k=k, mode=mode)
+
+    def search(
+        self,
+        query: str,
+        k: int = 4,
+        ids: Optional[Set[str]] = None,
+        mode: Optional[str] = None,
+        vector: Optional[List[float]] = None,
+    ) -> List[Document]:
+        """Retrieves the `k` best documents for a query, with vector or hybrid ranking.
+
+        Args:
+            query (str): The query string to search for.
+            k (int): The number of documents to return.
+            ids (Optional[Set[str]]): If given, only documents with these docstore ids are considered.
+            mode (Optional[str]): One of `RETRIEVAL_MODES`. Defaults to `RETRIEVAL_MODE`.
+            vector (Optional[List[float]]): The query's embedding, if the caller already has it.
+
+        Returns:
+            List[Document]: The matching documents, best first.
+        """
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+        if mode == "hybrid" and self._has_keyword_index():
+            return self.hybrid_search(query, k=k, ids=ids, vector=vector)
+        return self.similarity_search(query, k=k, ids=ids, vector=vector)
+
+    def hybrid_search(
+        self, query: str, k: int = 4, ids: Optional[Set[str]] = None, vector: Optional[List[float]] = None
+    ) -> List[Document]:
+        """Fuses the vector and BM25 keyword rankings of a query with reciprocal rank fusion.
+
+        Each ranking contributes 1 / (RRF_K + rank) per document, so a chunk that names the exact
+        bill asked about is surfaced even when its embedding ranks it low, and vice versa.
+
+        Args:
+            query (str): The query string to search for.
+            k (int): The number of documents to return.
+            ids (Optional[Set[str]]): If given, only documents with these docstore ids are considered.
+            vector (Optional[List[float]]): The query's embedding, if the caller already has it.
+
+        Returns:
+            List[Document]: The fused top `k` documents, best first.
+        """
+        if not self.vector_store:
+            raise ValueError("Vector store not initialized.")
+
+        if vector is None:
+            with span("retrieval.embed"):
+                vector = get_embeddings().embed_query(query)
+        vector_hits = self._vector_hits(vector, max(k, HYBRID_CANDIDATES), ids)
+        return self._documents(self._fuse(query, vector_hits, k, ids))
+
+    def _fuse(self, query: str, vector_hits: List[Tuple[int, float]], k: int, ids: Optional[Set[str]]) -> List[str]:
+        # reciprocal rank fusion of the vector hits with the keyword ranking, as docstore ids
+        index_to_docstore_id = self.vector_store.index_to_docstore_id
+        with span("retrieval.keyword"):
+            keyword_hits = self.vector_store.docstore.keyword_search(query, k=max(k, HYBRID_CANDIDATES), ids=ids)
+        # the chunk store may already hold chunks of an upload this index was loaded before
+        positions = self._position_map()
+        rankings = [
+            [index_to_docstore_id[i] for i, _ in vector_hits],
+            [doc_id for doc_id, _ in keyword_hits if doc_id in positions],
+        ]
+
+        fused: Dict[str, float] = {}
+        for ranking in rankings:
+            for rank, doc_id in enumerate(ranking, start=1):
+                fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+        return sorted(fused, key=fused.get, reverse=True)[:k]
+
+    def similarity_search(
+        self, query: str, k: int = 4, ids: Optional[Set[str]] = None, vector: Optional[List[float]] = None
+    ) -> List[Document]:
+        """Retrieves the `k` documents most similar to a query, optionally restricted to a set of ids.
+
+        Args:
+            query (str): The query string to search for.
+            k (int): The number of documents to return.
+            ids (Optional[Set[str]]): If given, only documents with these docstore ids are considered,
+                                      e.g. the result of `self.metadata_index.match(...)`.
+            vector (Optional[List[float]]): The query's embedding, if the caller already has it.
+
+        Returns:
+            List[Document]: The matching documents, most similar first.
+        """
+        if not self.vector_store:
+            raise ValueError("Vector store not initialized.")
+
+        if vector is None:
+            with span("retrieval.embed"):
+                vector = get_embeddings().embed_query(query)
+        return [doc for doc, _ in self.similarity_search_by_vector(vector, k=k, ids=ids)]
+
+    def similarity_search_by_vector(
+        self, vector: List[float], k: int = 4, ids: Optional[Set[str]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Same as `similarity_search`, for an already embedded query.
+
+        Returns:
+            List[Tuple[Document, float]]: The matching documents with their FAISS distance scores.
+        """
+        docstore = self.vector_store.docstore
+        index_to_docstore_id = self.vector_store.index_to_docstore_id
+        hits = self._vector_hits(vector, k, ids)
+        with span("retrieval.docstore"):
+            results = [(docstore.search(index_to_docstore_id[i]), score) for i, score in hits]
+        return [(doc, score) for doc, score in results if isinstance(doc, Document)]
+
+    def _documents(self, doc_ids: List[str]) -> List[Document]:
+        # The chunk store is shared with upload.py, which deletes the chunks of re-indexed sources
+        # while this index still points at them; those come back as a "not found" string.
+        docstore = self.vector_store.docstore
+        with span("retrieval.docstore"):
+            documents = [docstore.search(doc_id) for doc_id in doc_ids]
+        return [doc for doc in documents if isinstance(doc, Document)]
 
-    def rag(self, question: str, schema: Optional[BaseModel] = None, date_range: Optional[List[str]] = None):
+    @traced("retrieval.faiss")
+    def _vector_hits(self, vector: List[float], k: int, ids: Optional[Set[str]] = None) -> List[Tuple[int, float]]:
+        # (index position, FAISS score) of the nearest neighbours, without touching the docstore
+        index = self.vector_store.index
+        query = np.asarray([vector], dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            faiss.normalize_L2(query)
+
+        if ids is None:
+            scores, found = index.search(query, k)
+            return [(int(i), float(score)) for i, score in zip(found[0], scores[0]) if i != -1]
+
+        positions = self._positions(ids)
+        if not positions:
+            return []
+
+        if isinstance(index, faiss.IndexFlat) and len(positions) <= PREFILTER_SCAN_LIMIT:
+            # score only the candidate subset instead of scanning the whole index
+            candidates = np.asarray(positions, dtype=np.int64)
+            vectors = index.reconstruct_batch(candidates)
+            if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                scores = vectors @ query[0]
+                order = np.argsort(-scores)[:k]
+            else:
+                scores = ((vectors - query[0]) ** 2).sum(axis=1)
+                order = np.argsort(scores)[:k]
+            return [(int(candidates[i]), float(scores[i])) for i in order]
+
+        selector = faiss.IDSelectorBatch(np.asarray(positions, dtype=np.int64))
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        scores, found = index.search(query, k, params=params)
+        return [(int(i), float(score)) for i, score in zip(found[0], scores[0]) if i != -1]
+
+    @traced("retrieval.faiss")
+    def _vector_hits_batch(self, vectors: List[List[float]], k: int) -> List[List[Tuple[int, float]]]:
+        # unfiltered nearest neighbours of several queries with a single FAISS search
+        queries = np.asarray(vectors, dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            faiss.normalize_L2(queries)
+        scores, found = self.vector_store.index.search(queries, k)
+        return [
+            [(int(i), float(score)) for i, score in zip(row_found, row_scores) if i != -1]
+            for row_found, row_scores in zip(found, scores)
+        ]
+
+    def _has_keyword_index(self) -> bool:
+        return self.vector_store is not None and self.vector_store.docstore.has_keyword_index
+
+    def _position_map(self) -> Dict[str, int]:
+        if self._id_to_position is None:
+            self._id_to_position = {
+                doc_id: position for position, doc_id in self.vector_store.index_to_docstore_id.items()
+            }
+        return self._id_to_position
+
+    def _positions(self, ids: Set[str]) -> List[int]:
+        positions = self._position_map()
+        return [positions[doc_id] for doc_id in ids if doc_id in positions]
+
+    def rag(
+        self,
+        question: str,
+        schema: Optional[BaseModel] = None,
+        date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
+        mode: Optional[str] = None,
+    ):
         """Retrieve documents relevant to the input and generates a response. The documents here are state legislature records, including meeting transcripts, approved bills, and journals (daily notes of all legislature activities). Please use this to find information relevant to a given topic or issue. You can specify the date range of the outputs, to find more relevant information.
 
         Args:
             question (str): The question to retrieve context for.
             schema (Optional[BaseModel]): The schema for structured output. Defaults to None.
             date_range (Optional[List[str]]): A list containing the start and end date for filtering documents, in ["YYYY-MM-DD", "YYYY-MM-DD"] format.
+            chamber (Optional[str]): Only use documents from this chamber: "house", "senate" or "joint".
+            bill_number (Optional[str]): Only use documents about this bill, e.g. "H.479".
+            mode (Optional[str]): "vector" or "hybrid" retrieval. Defaults to `RETRIEVAL_MODE`.
         Returns:
             The response generated by the LLM based on the retrieved documents.
         """
 
-        retrieved_docs = self.vector_store.similarity_search(question, k=15)
-
-        # Filter by date range
-        if date_range and len(date_range) == 2:
-            start_date_str, end_date_str = date_range
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date() if start_date_str else None
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date() if end_date_str else None
-            
-            filtered_docs = []
-            for doc in retrieved_docs:
-                if 'journal_date' in doc.metadata and doc.metadata['journal_date']:
-                    doc_date = doc.metadata['journal_date']
-                    if isinstance(doc_date, str):
-                        try:
-                            doc_date = datetime.strptime(doc_date, "%Y-%m-%d").date()
-                        except ValueError:
-                            continue
-                    
-                    if (not start_date or (start_date <= doc_date)) and (not end_date or (doc_date <= end_date)):
-                        filtered_docs.append(doc)
-            retrieved_docs = filtered_docs
-        
-        docs_content = "\n\n".join(doc.page_content for doc in retrieved_docs)
-        messages = prompt.invoke({"question": question, "context": docs_content})
-        
-        if schema:
-            response = llm.with_structured_output(schema).invoke(messages)
-        else:
-            response = llm.invoke(messages).content
+        retrieved_docs = self._retrieve_context(question, date_range, chamber, bill_number, mode)
+        if not retrieved_docs:
+            return Retrieval(
+                question=question,
+                documents=[],
+                response="No documents matched the requested filters.",
+            )
+
+        messages = self._rag_messages(question, retrieved_docs)
+        with span("llm.rag"):
+            if schema:
+                response = get_llm().with_structured_output(schema).invoke(messages)
+            else:
+                message = get_llm().invoke(messages)
+                count_usage(message)
+                response = message.content
         
         return Retrieval(
             question=question,
             documents=retrieved_docs,
             response=response,
         )
+
+    async def arag(
+        self,
+        question: str,
+        schema: Optional[BaseModel] = None,
+        date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
+        mode: Optional[str] = None,
+    ):
+        """Async version of `rag`.
+
+        The question is embedded with `aembed_query` on the event loop, the FAISS search and reranking
+        run on the bounded `search_executor` and the LLM is called with `ainvoke`, so the event loop
+        is never blocked.
+        """
+        (vector,) = await aembed_queries([question])
+        loop = asyncio.get_running_loop()
+        # run in a copy of the context, so the spans of the search land on this request's trace
+        retrieved_docs = await loop.run_in_executor(
+            search_executor,
+            copy_context().run,
+            self._retrieve_context,
+            question,
+            date_range,
+            chamber,
+            bill_number,
+            mode,
+            vector,
+        )
+        if not retrieved_docs:
+            return Retrieval(
+                question=question,
+                documents=[],
+                response="No documents matched the requested filters.",
+            )
+
+        return await self._agenerate(question, retrieved_docs, schema)
+
+    async def _agenerate(
+        self, question: str, documents: List[Document], schema: Optional[BaseModel] = None
+    ) -> Retrieval:
+        messages = self._rag_messages(question, documents)
+        with span("llm.rag"):
+            if schema:
+                response = await get_llm().with_structured_output(schema).ainvoke(messages)
+            else:
+                message = await get_llm().ainvoke(messages)
+                count_usage(message)
+                response = message.content
+
+        return Retrieval(
+            question=question,
+            documents=documents,
+            response=response,
+        )
+
+    def _retrieve_filtered(
+        self,
+        question: str,
+        date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
+        mode: Optional[str] = None,
+        vector: Optional[List[float]] = None,
+    ) -> List[Document]:
+        # Restrict the search to documents matching the filters before ranking, so filtered
+        # queries still get k real hits.
+        with span("retrieval.filter"):
+            allowed_ids = self.metadata_index.match(
+                date_range=date_range, chamber=chamber, bill_number=bill_number
+            )
+        return self.search(question, k=RAG_K, ids=allowed_ids, mode=mode, vector=vector)
+
+    def retrieve_context(
+        self,
+        question: str,
+        date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
+        mode: Optional[str] = None,
+        vector: Optional[List[float]] = None,
+    ) -> Retrieval:
+        """Retrieves, reranks and trims the context for a question without calling the LLM.
+
+        Takes the same filters as `rag`, and the question's embedding as `vector` if the caller
+        already has it. The response is the packed chunks formatted for a prompt, see `format_context`.
+        """
+        documents = self._retrieve_context(question, date_range, chamber, bill_number, mode, vector)
+        return Retrieval(question=question, documents=documents, response=format_context(documents))
+
+    async def aretrieve_context(
+        self,
+        question: str,
+        date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
+        mode: Optional[str] = None,
+    ) -> Retrieval:
+        """Async version of `retrieve_context`: embeds on the event loop, searches on the `search_executor`."""
+        (vector,) = await aembed_queries([question])
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            search_executor,
+            copy_context().run,
+            self.retrieve_context,
+            question,
+            date_range,
+            chamber,
+            bill_number,
+            mode,
+            vector,
+        )
+
+    def retrieve_context_batch(
+        self,
+        requests: List[RAGToolInput],
+        mode: Optional[str] = None,
+        vectors: Optional[List[List[float]]] = None,
+    ) -> List[Retrieval]:
+        """Same as `retrieve_context` for several requests, sharing the embedding and search work.
+
+        All questions are embedded together, with a single lookup in the embedding cache, and the
+        requests without metadata filters are answered by a single batched FAISS search. Filtered
+        requests are searched one by one over their pre-filtered candidates.
+
+        Args:
+            requests (List[RAGToolInput]): The questions and their filters. `schema` is ignored.
+            mode (Optional[str]): One of `RETRIEVAL_MODES`. Defaults to `RETRIEVAL_MODE`.
+            vectors (Optional[List[List[float]]]): The questions' embeddings, if the caller already has them.
+
+        Returns:
+            List[Retrieval]: One retrieval per request, in order.
+        """
+        if not requests:
+            return []
+        if not self.vector_store:
+            raise ValueError("Vector store not initialized.")
+        mode = mode or RETRIEVAL_MODE
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+        hybrid = mode == "hybrid" and self._has_keyword_index()
+
+        questions = [request.question for request in requests]
+        if vectors is None:
+            embeddings = get_embeddings()
+            with span("retrieval.embed"):
+                if hasattr(embeddings, "embed_queries"):
+                    vectors = embeddings.embed_queries(questions)
+                else:
+                    vectors = [embeddings.embed_query(question) for question in questions]
+
+        with span("retrieval.filter"):
+            allowed = [
+                self.metadata_index.match(
+                    date_range=request.date_range, chamber=request.chamber, bill_number=request.bill_number
+                )
+                for request in requests
+            ]
+        k = max(RAG_K, HYBRID_CANDIDATES) if hybrid else RAG_K
+        hits: Dict[int, List[Tuple[int, float]]] = {}
+        unfiltered = [i for i, ids in enumerate(allowed) if ids is None]
+        if unfiltered:
+            hits.update(zip(unfiltered, self._vector_hits_batch([vectors[i] for i in unfiltered], k)))
+        for i, ids in enumerate(allowed):
+            if ids is not None:
+                hits[i] = self._vector_hits(vectors[i], k, ids)
+
+        index_to_docstore_id = self.vector_store.index_to_docstore_id
+        retrievals = []
+        for i, question in enumerate(questions):
+            if hybrid:
+                doc_ids = self._fuse(question, hits[i], RAG_K, allowed[i])
+            else:
+                doc_ids = [index_to_docstore_id[position] for position, _ in hits[i][:RAG_K]]
+            candidates = self._documents(doc_ids)
+            documents = select_context(question, candidates, reranker=self.reranker).documents if candidates else []
+            retrievals.append(Retrieval(question=question, documents=documents, response=format_context(documents)))
+        return retrievals
+
+    def _retrieve_context(
+        self,
+        question: str,
+        date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
+        mode: Optional[str] = None,
+        vector: Optional[List[float]] = None,
+    ) -> List[Document]:
+        # Rerank the RAG_K candidates and keep only the best ones that fit the context token
+        # budget, instead of pasting all of them into the prompt.
+        candidates = self._retrieve_filtered(question, date_range, chamber, bill_number, mode, vector)
+        if not candidates:
+            return []
+        return select_context(question, candidates, reranker=self.reranker).documents
+
+    def _rag_messages(self, question: str, documents: List[Document]):
+        docs_content = "\n\n".join(doc.page_content for doc in documents)
+        return get_prompt().invoke({"question": question, "context": docs_content})
         
-    def add_documents(self, documents: List[Document]):
+    def add_documents(self, documents: List[Document], save: bool = True):
         """Adds documents to the vector store.
         
         Args:
             documents (List[Document]): A list of Document objects to be added.
+            save (bool): If True, persist the index to disk after adding. Bulk callers
+                         pass False and call `save()` at their own checkpoints.
         """
+        if not documents:
+            return
+        if self.read_only:
+            raise ValueError("Cannot add documents to a compressed, read-only index.")
+
+        for document in documents:
+            if not document.id:
+                document.id = str(uuid4())
+
+        texts = [document.page_content for document in documents]
+        vectors = get_embeddings().embed_documents(texts)
         if (
             not self.vector_store
         ):  # if vector store is not initialized, create a new one
-            self.vector_store = FAISS.from_documents(
-                documents=documents, embedding=embeddings
-            )
-        else:  # otherwise, add to existing vector store
-            self.vector_store.add_documents(documents=documents)
+            os.makedirs(self.FAISS_INDEX_PATH, exist_ok=True)
+            docstore = SQLiteDocstore(os.path.join(self.FAISS_INDEX_PATH, CHUNK_STORE_FILE))
+            docstore.clear()  # drop chunks of a previous index at this path once we save
+            self.vector_store = FAISS(get_embeddings(), faiss.IndexFlatL2(len(vectors[0])), docstore, {})
+            self.metadata_index = MetadataIndex()
+        # otherwise, add to existing vector store
+        self.vector_store.add_embeddings(
+            text_embeddings=list(zip(texts, vectors)),
+            metadatas=[document.metadata for document in documents],
+            ids=[document.id for document in documents],
+        )
+        self.metadata_index.add(documents)
+        self._id_to_position = None
+        self.version += 1
         
-        self.vector_store.save_local(self.FAISS_INDEX_PATH)
+        if save:
+            self.save()
+
+    def delete_documents(self, ids: List[str], save: bool = False):
+        """Removes documents from the vector store by docstore id.
+
+        Ids that are not in the index are ignored.
+
+        Args:
+            ids (List[str]): The docstore ids of the documents to remove.
+            save (bool): If True, persist the index to disk after deleting.
+        """
+        if not self.vector_store:
+            return
+        if self.read_only:
+            raise ValueError("Cannot delete documents from a compressed, read-only index.")
+
+        present = set(self.vector_store.index_to_docstore_id.values())
+        ids = [doc_id for doc_id in ids if doc_id in present]
+        if ids:
+            self.vector_store.delete(ids=ids)
+            self.metadata_index.remove(ids)
+            self._id_to_position = None
+            self.version += 1
+
+        if save:
+            self.save()
+
+    def save(self):
+        """Persists the vector store to `FAISS_INDEX_PATH`.
+
+        The index is written to a sibling temporary directory first and then moved into place,
+        so an interrupted save never leaves a half-written index behind.
+        """
+        if not self.vector_store or self.read_only:
+            return
+
+        tmp_path = f"{self.FAISS_INDEX_PATH}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        faiss.write_index(self.vector_store.index, os.path.join(tmp_path, "index.faiss"))
+        self._write_ids(tmp_path, self.vector_store.index_to_docstore_id)
+        self.metadata_index.save(os.path.join(tmp_path, METADATA_INDEX_FILE))
+
+        # chunks first: rows the index does not reference yet are harmless
+        self.vector_store.docstore.commit()
+        os.makedirs(self.FAISS_INDEX_PATH, exist_ok=True)
+        for name in os.listdir(tmp_path):
+            os.replace(os.path.join(tmp_path, name), os.path.join(self.FAISS_INDEX_PATH, name))
+        os.rmdir(tmp_path)
+        legacy_keyword_path = os.path.join(self.FAISS_INDEX_PATH, LEGACY_KEYWORD_INDEX_FILE)
+        if os.path.exists(legacy_keyword_path):
+            os.remove(legacy_keyword_path)
+
+    def close(self):
+        """Closes the chunk store and unloads the vector store; changes since the last `save()` are discarded."""
+        if self.vector_store is not None:
+            self.vector_store.docstore.close()
+            self.vector_store = None
+            self._id_to_position = None
+
+    @staticmethod
+    def _write_ids(folder: str, index_to_docstore_id: Dict[int, str]):
+        with open(os.path.join(folder, INDEX_IDS_FILE), "w") as f:
+            f.write("\n".join(index_to_docstore_id[i] for i in range(len(index_to_docstore_id))))
 
 class PDF:
-    def __init__(self, pdf_file: str | IO, storage: Storage, metadata: dict):
+    def __init__(
+        self,
+        pdf_file: str | IO,
+        storage: Optional[Storage],
+        metadata: dict,
+        pages: Optional[List[str]] = None,
+        source_type: Optional[str] = None,
+    ):
         """
         Initializes the Material class from PDF file.
 
         Args:
             pdf_file (str | IO): The path to the PDF file, or the file-like object, to load.
-            storage (Storage): The Storage class for vector storage to associate with the material.
+            storage (Optional[Storage]): The Storage class for vector storage to associate with the material.
+                                         If None, the splits are only kept on `self.splits` (used by bulk ingestion).
             metadata (dict): A dictionary containing metadata about the source file.
+            pages (Optional[List[str]]): Page texts already extracted by `extract_pdf_pages`.
+                                         If None, the PDF is read here on a single core.
+            source_type (Optional[str]): "act" or "journal", chunks the text along the units of that
+                                         source type (see `chunking.split_document`).
         """
 
         self.storage = storage
-        document = self._load_documents(pdf_file)
+        if pages is None:
+            document = self._load_documents(pdf_file)
+        else:
+            document = self._document_from_pages(pdf_file, pages)
 
         # Add the parsed metadata to the document itself.
         # This is useful if we want to see this info when retrieving docs.
         document.metadata.update(metadata)
 
         # split & store documents
-        splits = text_splitter.split_documents([document])
-        self.storage.add_documents(documents=splits)
+        self.splits = split_document(document, source_type, pages=self.page_starts)
+        if self.storage is not None:
+            self.storage.add_documents(documents=self.splits)
 
     def _load_documents(self, pdf_file: str | IO) -> Document:
         """
@@ -178,22 +847,145 @@ class PDF:
             Document: Document constructed from PDF content.
         """
         
-        content = ""
-        self.images = []
-        
         reader = PdfReader(pdf_file)
-        
-        for page in tqdm(reader.pages, desc="Processing PDF pages"):
-            content += page.extract_text() + "\n" # extract text from each page
+        pages = [page.extract_text() for page in tqdm(reader.pages, desc="Processing PDF pages")]
+        return self._document_from_pages(pdf_file, pages)
+
+    def _document_from_pages(self, pdf_file: str | IO, pages: List[str]) -> Document:
+        """
+        Builds a single Document from per-page texts.
 
+        Args:
+            pdf_file (str | IO): The PDF the pages were extracted from.
+            pages (List[str]): The text of each page, in order.
+
+        Returns:
+            Document: Document constructed from PDF content.
+        """
+        self.images = []
+        self.page_starts = page_starts(pages)
+
+        # a single join keeps this linear in the document size, unlike repeated `+=`
+        content = "".join(f"{text}\n" for text in pages)
         return Document(page_content=content, metadata={"source": pdf_file}, id=str(uuid4()))
 
-def make_rag_tool(storage: Storage):
-    @tool
+
+def _count_pdf_pages(path: str) -> int:
+    return len(PdfReader(path).pages)
+
+
+def _extract_page_range(path: str, start: int, stop: int) -> List[str]:
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+def extract_pdf_pages(
+    paths: Iterable[str],
+    max_workers: int = PDF_EXTRACT_WORKERS,
+    pages_per_task: int = PDF_PAGES_PER_TASK,
+) -> Iterator[Tuple[str, List[str]]]:
+    """Extracts page texts from many PDFs on a process pool.
+
+    Each file is cut into page ranges of `pages_per_task`, so a single long journal is spread
+    over several cores as well. Files are yielded as soon as all of their ranges are done, and
+    only a bounded number of ranges is in flight at once to keep memory flat.
+
+    Args:
+        paths (Iterable[str]): Paths of the PDF files to extract.
+        max_workers (int): Number of worker processes. With 1 or less, extraction runs inline.
+        pages_per_task (int): Number of pages extracted by one task.
+
+    Yields:
+        Tuple[str, List[str]]: The path and the text of each of its pages, in page order.
+    """
+    paths = list(paths)
+    if max_workers <= 1:
+        for path in paths:
+            yield path, _extract_page_range(path, 0, _count_pdf_pages(path))
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        page_counts = dict(zip(paths, pool.map(_count_pdf_pages, paths)))
+        tasks = (
+            (path, start, min(start + pages_per_task, count))
+            for path, count in page_counts.items()
+            for start in range(0, count, pages_per_task)
+        )
+
+        results: Dict[str, Dict[int, List[str]]] = defaultdict(dict)
+        remaining = {
+            path: -(-count // pages_per_task) for path, count in page_counts.items()
+        }
+        for path, count in remaining.items():
+            if count == 0:
+                yield path, []
+
+        in_flight = {}
+        max_in_flight = max_workers * 4
+        for task in tasks:
+            in_flight[pool.submit(_extract_page_range, *task)] = task
+            if len(in_flight) < max_in_flight:
+                continue
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from _collect_page_ranges(done, in_flight, results, remaining)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from _collect_page_ranges(done, in_flight, results, remaining)
+
+
+def _collect_page_ranges(done, in_flight, results, remaining) -> Iterator[Tuple[str, List[str]]]:
+    for future in done:
+        path, start, _ = in_flight.pop(future)
+        results[path][start] = future.result()
+        remaining[path] -= 1
+        if remaining[path] == 0:
+            ranges = results.pop(path)
+            yield path, [text for start in sorted(ranges) for text in ranges[start]]
+
+def format_context(documents: List[Document]) -> str:
+    """Formats chunks as numbered excerpts, each headed by its source, for use in a prompt."""
+    if not documents:
+        return "No documents matched the requested filters."
+
+    excerpts = []
+    for i, doc in enumerate(documents, start=1):
+        details = [
+            str(doc.metadata[key])
+            for key in ("chamber", "bill_number", "journal_date", "source_url")
+            if doc.metadata.get(key)
+        ]
+        header = f"[{i}] " + " | ".join(details) if details else f"[{i}]"
+        excerpts.append(f"{header}\n{doc.page_content.strip()}")
+    return "\n\n".join(excerpts)
+
+
+RAG_TOOL_RETRIEVE_DESCRIPTION = (
+    "Retrieve excerpts of documents relevant to the input. The documents here are state legislature records, "
+    "including meeting transcripts, approved bills, and journals (daily notes of all legislature activities). "
+    "Please use this to find information relevant to a given topic or issue, and answer from the returned "
+    "excerpts, citing their sources. You can specify the date range, chamber or bill number of the outputs, "
+    "to find more relevant information."
+)
+
+
+def make_rag_tool(storage: Storage, mode: str = RAG_TOOL_MODE):
+    """Builds the agent's `rag` tool over a storage.
+
+    Args:
+        storage (Storage): The storage to retrieve from.
+        mode (str): One of `RAG_TOOL_MODES`. In "retrieve" mode the tool returns the reranked
+                    chunks and `schema` is ignored; in "synthesize" mode it returns an LLM answer.
+    """
+    if mode not in RAG_TOOL_MODES:
+        raise ValueError(f"Unknown rag tool mode {mode!r}, expected one of {RAG_TOOL_MODES}")
+
     def rag(
         question: str,
         schema: Optional[BaseModel] = None,
         date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
     ):
         """Retrieve documents relevant to the input and generates a response. The documents here are state legislature records, including meeting transcripts, approved bills, and journals (daily notes of all legislature activities). Please use this to find information relevant to a given topic or issue. You can specify the date range of the outputs, to find more relevant information.
 
@@ -201,6 +993,8 @@ def make_rag_tool(storage: Storage):
             question (str): The question to retrieve context for.
             schema (Optional[BaseModel]): The schema for structured output. Defaults to None.
             date_range (Optional[List[str]]): A list containing the start and end date for filtering documents, in ["YYYY-MM-DD", "YYYY-MM-DD"] format.
+            chamber (Optional[str]): Only use documents from this chamber: "house", "senate" or "joint".
+            bill_number (Optional[str]): Only use documents about this bill, e.g. "H.479".
         Returns:
             The response generated by the LLM based on the retrieved documents.
         """
@@ -208,8 +1002,115 @@ def make_rag_tool(storage: Storage):
             question=question,
             schema=schema,
             date_range=date_range,
+            chamber=chamber,
+            bill_number=bill_number,
+        )
+        if mode == "retrieve":
+            retrieval = storage.retrieve_context(**payload.dict(exclude={"schema"}))
+            return retrieval["response"], retrieval
+        retrieval = storage.rag(**payload.dict())
+        return _summarize_retrieval(retrieval), retrieval
+
+    async def arag(
+        question: str,
+        schema: Optional[BaseModel] = None,
+        date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
+    ):
+        payload = RAGToolInput(
+            question=question,
+            schema=schema,
+            date_range=date_range,
+            chamber=chamber,
+            bill_number=bill_number,
         )
-        return storage.rag(**payload.dict())
+        if mode == "retrieve":
+            retrieval = await storage.aretrieve_context(**payload.dict(exclude={"schema"}))
+            return retrieval["response"], retrieval
+        retrieval = await storage.arag(**payload.dict())
+        return _summarize_retrieval(retrieval), retrieval
+
+    # The agent graph runs async and uses `arag`; sync callers still get `rag`.
+    # Only the summary goes to the model as the ToolMessage content; the Retrieval itself is
+    # passed through as the message artifact, so documents are never serialized and parsed back.
+    return StructuredTool.from_function(
+        func=rag,
+        coroutine=arag,
+        name="rag",
+        description=RAG_TOOL_RETRIEVE_DESCRIPTION if mode == "retrieve" else None,
+        response_format="content_and_artifact",
+    )
+
+
+def _summarize_retrieval(retrieval: Retrieval) -> str:
+    response = retrieval["response"]
+    if isinstance(response, BaseModel):
+        response = response.model_dump_json()
+
+    sources = list(dict.fromkeys(
+        doc.metadata["source_url"] for doc in retrieval["documents"] if doc.metadata.get("source_url")
+    ))
+    if not sources:
+        return str(response)
+    return f"{response}\n\nSources ({len(retrieval['documents'])} documents): " + ", ".join(sources)
+
+
+async def abatch_rag(
+    storage: Storage, requests: List[RAGToolInput], mode: str = RAG_TOOL_MODE
+) -> List[Tuple[str, Retrieval]]:
+    """Runs the rag tool for several calls of one agent turn at once.
+
+    Retrieval for all calls is batched with `Storage.retrieve_context_batch`; in "synthesize"
+    mode the per-call LLM answers are then generated concurrently. Chunks already returned by an
+    earlier call of the batch are left out of later ones, so the agent and its state only see
+    each chunk once.
+
+    Args:
+        storage (Storage): The storage to retrieve from.
+        requests (List[RAGToolInput]): The arguments of each rag call.
+        mode (str): One of `RAG_TOOL_MODES`, as for `make_rag_tool`.
+
+    Returns:
+        List[Tuple[str, Retrieval]]: The tool message content and artifact of each call, in order.
+    """
+    vectors = await aembed_queries([request.question for request in requests]) if requests else []
+    loop = asyncio.get_running_loop()
+    retrievals = await loop.run_in_executor(
+        search_executor, copy_context().run, storage.retrieve_context_batch, requests, None, vectors
+    )
+
+    seen: Set[str] = set()
+    deduplicated = []
+    for retrieval in retrievals:
+        documents = [doc for doc in retrieval["documents"] if doc.id not in seen]
+        seen.update(doc.id for doc in documents)
+        deduplicated.append((retrieval, documents, len(retrieval["documents"]) - len(documents)))
+    count("documents_deduplicated", sum(duplicates for _, _, duplicates in deduplicated))
+
+    if mode == "synthesize":
+        answers = await asyncio.gather(*(
+            storage._agenerate(request.question, retrieval["documents"], request.schema)
+            if retrieval["documents"]
+            else asyncio.sleep(0, result=retrieval)
+            for request, retrieval in zip(requests, retrievals)
+        ))
+        return [
+            (
+                _summarize_retrieval(answer),
+                Retrieval(question=answer["question"], documents=documents, response=answer["response"]),
+            )
+            for answer, (_, documents, _) in zip(answers, deduplicated)
+        ]
+
+    results = []
+    for retrieval, documents, duplicates in deduplicated:
+        if duplicates and not documents:
+            content = f"All {duplicates} excerpts were already returned by another rag call in this turn."
+        else:
+            content = format_context(documents)
+            if duplicates:
+                content += f"\n\n({duplicates} excerpts already returned by another rag call in this turn were left out.)"
+        results.append((content, Retrieval(question=retrieval["question"], documents=documents, response=content)))
+    return results
 
-    rag.__name__ = "rag"
-    return rag
@@ -0,0 +1,266 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# the fixture index is embedded here with the same fake embeddings the spawned server uses
+os.environ.setdefault("EMBEDDINGS_PROVIDER", "fake")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+import aiohttp
+import numpy as np
+from typing_extensions import Dict, List, Optional
+
+from bench_retrieval import build_storage, load_questions
+
+# Closed-loop load test of /user-query. By default a main.py server is started with the fake
+# models of fakes.py, which answer after a fixed, injected latency, and an index built from the
+# fixture documents of bench_questions.json. Every combination of concurrency and conversation
+# length is run for a fixed time, and throughput and latency are reported per combination.
+
+BASE_DIR = Path(__file__).resolve().parent
+READY_TIMEOUT = 60
+
+
+def build_index(path: str, scale: int = 1) -> int:
+    """Writes an index of the fixture documents, each repeated `scale` times, and returns its size."""
+    documents = load_questions()["documents"]
+    copies = [
+        {**doc, "source_url": doc["source_url"] if i == 0 else f"{doc['source_url']}#copy-{i}"}
+        for i in range(scale)
+        for doc in documents
+    ]
+    storage = build_storage(copies, path)
+    storage.save()
+    return storage.vector_store.index.ntotal
+
+
+def make_conversation(turns: int, offset: int) -> List[dict]:
+    """A conversation of `turns` prior user/assistant messages, taken from the question set."""
+    questions = [question["question"] for question in load_questions()["questions"]]
+    conversation = []
+    for i in range(turns):
+        question = questions[(offset + i // 2) % len(questions)]
+        if i % 2 == 0:
+            conversation.append({"role": "user", "content": question})
+        else:
+            answer = f"According to the records, {question.rstrip('?').lower()} is covered in the journals. " * 4
+            conversation.append({"role": "assistant", "content": answer})
+    return conversation
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(index_path: str, llm_latency: float, llm_latency_per_1k: float, embedding_latency: float, workers: int):
+    """Starts main.py with uvicorn and the fake models; returns the process and its URL."""
+    port = _free_port()
+    env = {
+        **os.environ,
+        "FAISS_PATH": index_path,
+        "EMBEDDINGS_PROVIDER": "fake",
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY": str(llm_latency),
+        "FAKE_LLM_LATENCY_PER_1K_TOKENS": str(llm_latency_per_1k),
+        "FAKE_EMBEDDINGS_LATENCY": str(embedding_latency),
+        "ANSWER_CACHE_MAX_ENTRIES": os.getenv("ANSWER_CACHE_MAX_ENTRIES", "0"),  # every request does the full work
+        "AGENT_LOG_LEVEL": os.getenv("AGENT_LOG_LEVEL", "ERROR"),  # rejections past saturation are expected
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BASE_DIR,
+        env=env,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(session: aiohttp.ClientSession, url: str, timeout: float = READY_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{url}/ready") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.25)
+    raise TimeoutError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+async def run_level(session: aiohttp.ClientSession, url: str, concurrency: int, turns: int, duration: float) -> dict:
+    """Runs `concurrency` clients back to back for `duration` seconds and summarizes their requests."""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    spans: Dict[str, float] = {}
+    conversations = [make_conversation(turns, offset) for offset in range(concurrency)]
+    questions = [question["question"] for question in load_questions()["questions"]]
+    deadline = time.monotonic() + duration
+
+    async def client(worker: int):
+        n = 0
+        while time.monotonic() < deadline:
+            body = {
+                "user_query": questions[(worker + n) % len(questions)],
+                "conversation": conversations[worker],
+                "include_timings": True,
+            }
+            n += 1
+            started = time.perf_counter()
+            try:
+                async with session.post(f"{url}/user-query", json=body) as response:
+                    payload = await response.json() if response.status == 200 else None
+                    status = str(response.status)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                payload, status = None, "error"
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append((time.perf_counter() - started) * 1000)
+                for name, entry in ((payload.get("timings") or {}).get("by_name") or {}).items():
+                    spans[name] = spans.get(name, 0.0) + entry["total_ms"]
+            elif status == "503":
+                await asyncio.sleep(0.1)  # rejected while saturated, as a client honouring Retry-After would
+
+    started = time.monotonic()
+    await asyncio.gather(*(client(worker) for worker in range(concurrency)))
+    elapsed = time.monotonic() - started
+
+    ok = len(latencies)
+    result = {
+        "concurrency": concurrency,
+        "turns": turns,
+        "requests": sum(statuses.values()),
+        "ok": ok,
+        "rejected": statuses.get("503", 0),
+        "errors": sum(n for status, n in statuses.items() if status not in ("200", "503")),
+        "throughput_rps": ok / elapsed,
+    }
+    if ok:
+        result.update({
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "p99_ms": float(np.percentile(latencies, 99)),
+            "mean_ms": float(np.mean(latencies)),
+            # server-side time per request by span, see tracing.py
+            "span_mean_ms": {name: round(total / ok, 3) for name, total in sorted(spans.items())},
+        })
+    return result
+
+
+async def sweep(url: str, concurrency_levels: List[int], turns_levels: List[int], duration: float) -> List[dict]:
+    timeout = aiohttp.ClientTimeout(total=300)
+    connector = aiohttp.TCPConnector(limit=max(concurrency_levels))
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await wait_ready(session, url)
+        points = []
+        for turns in turns_levels:
+            for concurrency in concurrency_levels:
+                point = await run_level(session, url, concurrency, turns, duration)
+                print(
+                    f"turns={turns:<3} concurrency={concurrency:<4} {point['throughput_rps']:7.2f} req/s  "
+                    f"p50={point.get('p50_ms', 0):8.1f}ms  p95={point.get('p95_ms', 0):8.1f}ms  "
+                    f"p99={point.get('p99_ms', 0):8.1f}ms  rejected={point['rejected']} errors={point['errors']}",
+                    flush=True,
+                )
+                points.append(point)
+        return points
+
+
+def saturation(points: List[dict]) -> Dict[int, dict]:
+    """Per conversation length, the peak throughput and the lowest concurrency reaching 95% of it."""
+    summary = {}
+    for turns in sorted({point["turns"] for point in points}):
+        curve = [point for point in points if point["turns"] == turns]
+        peak = max(point["throughput_rps"] for point in curve)
+        knee = min(point["concurrency"] for point in curve if point["throughput_rps"] >= 0.95 * peak)
+        summary[turns] = {"peak_throughput_rps": peak, "saturation_concurrency": knee}
+    return summary
+
+
+def run(
+    url: Optional[str] = None,
+    concurrency_levels: List[int] = (1, 2, 4, 8, 16, 32),
+    turns_levels: List[int] = (0, 8),
+    duration: float = 10.0,
+    llm_latency: float = 0.5,
+    llm_latency_per_1k: float = 0.05,
+    embedding_latency: float = 0.02,
+    scale: int = 1,
+    workers: int = 1,
+) -> dict:
+    """Runs the sweep, against `url` or a freshly started server, and returns the results.
+
+    Args:
+        url (Optional[str]): Base URL of a running server. If None, one is started with the fake
+                             models and an index of the fixture documents.
+        concurrency_levels (List[int]): Numbers of concurrent clients to sweep.
+        turns_levels (List[int]): Numbers of prior conversation messages to sweep.
+        duration (float): Seconds each combination runs.
+        llm_latency (float): Seconds per fake LLM call, for a started server.
+        llm_latency_per_1k (float): Extra seconds per 1000 prompt tokens of a fake LLM call.
+        embedding_latency (float): Seconds per fake embeddings call.
+        scale (int): Copies of the fixture documents in the started server's index.
+        workers (int): Uvicorn worker processes of the started server.
+    """
+    results = {
+        "config": {
+            "url": url or "spawned",
+            "duration_s": duration,
+            "llm_latency_s": llm_latency if url is None else None,
+            "llm_latency_per_1k_tokens_s": llm_latency_per_1k if url is None else None,
+            "embedding_latency_s": embedding_latency if url is None else None,
+            "workers": workers if url is None else None,
+        },
+    }
+    if url is not None:
+        results["points"] = asyncio.run(sweep(url, list(concurrency_levels), list(turns_levels), duration))
+    else:
+        with tempfile.TemporaryDirectory() as index_path:
+            results["config"]["index_vectors"] = build_index(index_path, scale)
+            process, server_url = start_server(index_path, llm_latency, llm_latency_per_1k, embedding_latency, workers)
+            try:
+                results["points"] = asyncio.run(sweep(server_url, list(concurrency_levels), list(turns_levels), duration))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    results["saturation"] = saturation(results["points"])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /user-query throughput and latency across concurrency and conversation length.")
+    parser.add_argument("--url", default=None, help="Load test this running server instead of starting one with the fake models.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--turns", type=int, nargs="+", default=[0, 8], help="Prior conversation messages sent with each query.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level and conversation length.")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per fake LLM call.")
+    parser.add_argument("--llm-latency-per-1k", type=float, default=0.05, help="Extra seconds per 1000 prompt tokens.")
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Seconds per fake embeddings call.")
+    parser.add_argument("--scale", type=int, default=1, help="Copies of the fixture documents to index.")
+    parser.add_argument("--workers", type=int, default=1, help="Uvicorn workers of the started server.")
+    parser.add_argument("--output", default=None, help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = run(
+        url=args.url,
+        concurrency_levels=args.concurrency,
+        turns_levels=args.turns,
+        duration=args.duration,
+        llm_latency=args.llm_latency,
+        llm_latency_per_1k=args.llm_latency_per_1k,
+        embedding_latency=args.embedding_latency,
+        scale=args.scale,
+        workers=args.workers,
+    )
+    print(json.dumps(results["saturation"], indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,17 +1,28 @@
+import time
+
+_BOOT_STARTED = time.perf_counter()
+
 from typing import List
 
+import asyncio
 import json
 import logging
 import os
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
-from chat_query import create_agent_graph
-from load import Storage
-from schemas import ChatMessagePayload, UserQueryRequest, UserQueryResponse
+from answer_cache import SemanticAnswerCache
+from chat_query import create_agent_graph, message_text
+from history import HistoryManager
+from llm import get_embeddings
+from load import FAISS_INDEX_MODE, Storage
+from schemas import ChatMessagePayload, DocumentPayload, UserQueryRequest, UserQueryResponse
+from tracing import Trace, count, render_prometheus, span, trace
 
 load_dotenv()
 
@@ -22,7 +33,78 @@ logging.basicConfig(
 )
 logger = logging.getLogger("agent")
 
-app = FastAPI()
+# Requests beyond this many in flight are rejected with a 503 instead of queueing behind the
+# LLM round trips of the others.
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "32"))
+_in_flight = 0
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))  # 0 disables the cache
+
+# Importing this module must stay fast: the index and models are loaded in the background
+# after startup, and /ready reports when they are warm.
+BOOT_BUDGET_SECONDS = float(os.getenv("BOOT_BUDGET_SECONDS", "2"))
+
+BASE_DIR = Path(__file__).resolve().parent
+FAISS_PATH = os.getenv("FAISS_PATH", str((BASE_DIR.parent / "faiss_index").resolve()))
+# upload.py maintains the index; the server only reads the chunk store
+storage = Storage(path=FAISS_PATH, index_mode=FAISS_INDEX_MODE, read_only=True)
+app_graph = None  # set once the index is loaded
+answer_cache: SemanticAnswerCache | None = None
+# older turns of long conversations are summarized to keep the prompt within HISTORY_TOKEN_BUDGET
+history_manager = HistoryManager()
+boot_seconds: float | None = None
+warm_seconds: float | None = None
+warm_error: str | None = None  # why warming up failed, reported by /ready
+
+
+def _warm_up():
+    """Loads the FAISS index and builds the agent graph and answer cache."""
+    global app_graph, answer_cache, warm_seconds
+    started = time.perf_counter()
+    if not storage.load():
+        raise FileNotFoundError(f"No FAISS index at {FAISS_PATH}, run upload.py first")
+    answer_cache = SemanticAnswerCache(
+        get_embeddings(),
+        threshold=ANSWER_CACHE_THRESHOLD,
+        ttl_seconds=ANSWER_CACHE_TTL,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    )
+    app_graph = create_agent_graph(storage)
+    warm_seconds = time.perf_counter() - started
+    logger.info("Agent graph initialised in %.2fs; FAISS path=%s", warm_seconds, FAISS_PATH)
+
+
+def _on_warm_up_done(task: asyncio.Task):
+    """Logs and records a failed warm-up, which would otherwise stay inside the un-awaited task."""
+    global warm_error
+    if task.cancelled() or task.exception() is None:
+        return
+    error = task.exception()
+    warm_error = f"{type(error).__name__}: {error}"
+    logger.error("Warming up failed, this worker will not become ready", exc_info=error)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global boot_seconds
+    boot_seconds = time.perf_counter() - _BOOT_STARTED
+    if boot_seconds > BOOT_BUDGET_SECONDS:
+        logger.warning("Worker boot took %.2fs, over the %.2fs budget", boot_seconds, BOOT_BUDGET_SECONDS)
+    else:
+        logger.info("Worker booted in %.2fs", boot_seconds)
+
+    warm_task = None
+    if app_graph is None:
+        warm_task = asyncio.create_task(asyncio.to_thread(_warm_up))
+        warm_task.add_done_callback(_on_warm_up_done)
+    yield
+    if warm_task is not None and not warm_task.done():
+        warm_task.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost",
@@ -38,12 +120,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-BASE_DIR = Path(__file__).resolve().parent
-FAISS_PATH = str((BASE_DIR.parent / "faiss_index").resolve())
-storage = Storage(path=FAISS_PATH, from_path=True)
-app_graph = create_agent_graph(storage)
-logger.info("Agent graph initialised; FAISS path=%s", FAISS_PATH)
-
 with open(BASE_DIR / "prompts.json") as f:
     prompts = json.load(f)
 system_prompt = prompts["user_query"]
@@ -66,16 +142,134 @@ def _convert_conversation(conversation: List[ChatMessagePayload]):
             history.append(HumanMessage(content=content))
     return history
 
-@app.post("/user-query", response_model=UserQueryResponse)
-async def user_query_endpoint(user_request: UserQueryRequest):
+@app.get("/ready")
+async def ready_endpoint():
+    """Reports whether the index is loaded and the worker can answer queries, or why warming up failed."""
+    ready = app_graph is not None and storage.vector_store is not None
+    body = {
+        "ready": ready,
+        "documents": storage.vector_store.index.ntotal if storage.vector_store else 0,
+        "boot_seconds": boot_seconds,
+        "warm_seconds": warm_seconds,
+        "error": warm_error,
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Span latency histograms, request counters and current state, in the Prometheus text format."""
+    gauges = {
+        "ready": float(app_graph is not None),
+        "in_flight_requests": _in_flight,
+        "index_documents": storage.vector_store.index.ntotal if storage.vector_store else 0,
+    }
+    if answer_cache is not None:
+        gauges["answer_cache_hits"] = answer_cache.hits
+        gauges["answer_cache_misses"] = answer_cache.misses
+    gauges.update({f"history_{name}": value for name, value in history_manager.metrics().items()})
+    return PlainTextResponse(render_prometheus(gauges), media_type="text/plain; version=0.0.4")
+
+
+def _with_timings(response: UserQueryResponse, user_request: UserQueryRequest, request_trace: Trace | None) -> UserQueryResponse:
+    """Returns a copy of the response with the request's timings, if they were asked for."""
+    if not user_request.include_timings or request_trace is None:
+        return response
+    return response.model_copy(update={"timings": request_trace.summary()})
+
+
+def _admit():
+    """Reserves an in-flight slot, or rejects the request with a 503 when saturated or still warming up."""
+    global _in_flight
+    if app_graph is None:
+        raise HTTPException(
+            status_code=503,
+            detail="The index is still loading, please retry shortly.",
+            headers={"Retry-After": "5"},
+        )
+    if _in_flight >= MAX_IN_FLIGHT_REQUESTS:
+        logger.warning("Rejecting request: %d requests already in flight", _in_flight)
+        raise HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+    _in_flight += 1
+
+
+def _release():
+    global _in_flight
+    _in_flight -= 1
+
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """Releases the in-flight slot of its request once the response ends, however it ends.
+
+    The body generator cannot do it: if the client disconnects before the response starts, the
+    generator is never iterated and its `finally` never runs.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            _release()
+
+
+async def _build_history(user_request: UserQueryRequest):
     history = [SystemMessage(content=system_prompt)]
     existing_messages = _convert_conversation(user_request.conversation)
     logger.debug("Received %d prior turns", len(existing_messages))
-    history.extend(existing_messages)
+    with span("history.compact"):
+        compacted, stats = await history_manager.compact(existing_messages)
+    if stats.summarized:
+        logger.info(
+            "Compacted history: %d -> %d messages, ~%d -> ~%d tokens (summary %s)",
+            stats.messages_in,
+            stats.messages_out,
+            stats.tokens_in,
+            stats.tokens_out,
+            "reused" if stats.summary_reused else "new",
+        )
+    history.extend(compacted)
     history.append(HumanMessage(content=user_request.user_query.strip()))
+    return history
+
+
+@app.post("/user-query", response_model=UserQueryResponse)
+async def user_query_endpoint(user_request: UserQueryRequest):
+    _admit()
+    try:
+        with trace() as request_trace:
+            count("requests")
+            response = await _answer_query(user_request)
+        return _with_timings(response, user_request, request_trace)
+    finally:
+        _release()
+
+
+async def _cache_lookup(user_request: UserQueryRequest):
+    """Returns the answer cache key for the request and a cached response, if there is one."""
+    if answer_cache is None or not answer_cache.enabled:
+        return None, None
+    with span("answer_cache.lookup"):
+        key = await answer_cache.amake_key(user_request.user_query, user_request.conversation)
+        cached = answer_cache.get(key, storage.version)
+    if cached is not None:
+        count("answer_cache_hits")
+        logger.info("Answer cache hit (hits=%d misses=%d)", answer_cache.hits, answer_cache.misses)
+    return key, cached
+
+
+async def _answer_query(user_request: UserQueryRequest) -> UserQueryResponse:
+    cache_key, cached = await _cache_lookup(user_request)
+    if cached is not None:
+        return cached
+
+    history = await _build_history(user_request)
 
     logger.info("Invoking agent graph with %d total messages", len(history))
-    response = app_graph.invoke({"messages": history, "documents": []})
+    response = await app_graph.ainvoke({"messages": history, "documents": []})
     final_response = response.get("final_response")
 
     if isinstance(final_response, UserQueryResponse):
@@ -83,14 +277,86 @@ async def user_query_endpoint(user_request: UserQueryRequest):
             "Agent produced response with %d supporting documents",
             len(final_response.documents),
         )
-        return final_response
+    else:
+        final_response = UserQueryResponse.model_validate(final_response)
+        logger.info(
+            "Agent response validated with %d supporting documents",
+            len(final_response.documents),
+        )
 
-    validated = UserQueryResponse.model_validate(final_response)
-    logger.info(
-        "Agent response validated with %d supporting documents",
-        len(validated.documents),
-    )
-    return validated
+    if cache_key is not None:
+        answer_cache.put(cache_key, storage.version, final_response)
+    return final_response
+
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+@app.post("/user-query/stream")
+async def user_query_stream_endpoint(user_request: UserQueryRequest):
+    """Streams the answer as server-sent events.
+
+    Events are JSON objects with a `type`:
+    - "documents": supporting documents, sent as soon as each tool call returns them.
+    - "token": a piece of the agent's answer text, as the model generates it.
+    - "final": the complete `UserQueryResponse`, with the deduplicated document list.
+    - "error": the request failed; `detail` holds a message.
+    """
+    _admit()
+
+    async def events():
+        sent_keys: set[str] = set()
+        with trace() as request_trace:
+            try:
+                count("requests")
+                cache_key, cached = await _cache_lookup(user_request)
+                if cached is not None:
+                    if cached.documents:
+                        yield _sse({"type": "documents", "documents": [doc.model_dump() for doc in cached.documents]})
+                    yield _sse({"type": "token", "text": cached.text_response})
+                    final_response = _with_timings(cached, user_request, request_trace)
+                    yield _sse({"type": "final", "response": final_response.model_dump()})
+                    return
+
+                history = await _build_history(user_request)
+                logger.info("Streaming agent graph with %d total messages", len(history))
+
+                async for mode, chunk in app_graph.astream(
+                    {"messages": history, "documents": []},
+                    stream_mode=["updates", "messages"],
+                ):
+                    if mode == "messages":
+                        message, metadata = chunk
+                        if metadata.get("langgraph_node") != "agent":
+                            continue  # e.g. the synthesis call inside the rag tool
+                        text = message_text(message.content)
+                        if text:
+                            yield _sse({"type": "token", "text": text})
+                        continue
+
+                    for node, update in chunk.items():
+                        if node == "action":
+                            payloads = []
+                            for document in (update or {}).get("documents", []):
+                                payload = DocumentPayload.from_document(document)
+                                key = str(payload.metadata.get("url") or payload.id)
+                                if key not in sent_keys:
+                                    sent_keys.add(key)
+                                    payloads.append(payload.model_dump())
+                            if payloads:
+                                yield _sse({"type": "documents", "documents": payloads})
+                        elif node == "builder":
+                            final_response = UserQueryResponse.model_validate(update["final_response"])
+                            if cache_key is not None:
+                                answer_cache.put(cache_key, storage.version, final_response)
+                            final_response = _with_timings(final_response, user_request, request_trace)
+                            yield _sse({"type": "final", "response": final_response.model_dump()})
+            except Exception:
+                logger.exception("Streaming agent graph failed")
+                yield _sse({"type": "error", "detail": "The request failed."})
+
+    return _AdmittedStreamingResponse(events(), media_type="text/event-stream")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,157 @@
+import json
+import os
+import re
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional, Set
+
+from langchain_core.documents import Document
+from typing_extensions import List
+
+INDEXED_FIELDS = ("journal_date", "chamber", "bill_number", "act_summary", "as_enacted")
+
+
+def normalize_value(field: str, value: Any) -> Optional[str]:
+    """Normalizes a metadata value into the key it is indexed under.
+
+    Dates become ISO strings (so they sort chronologically), booleans become "true"/"false",
+    chambers are lower-cased and bill numbers are written as e.g. "H.479" whatever the spacing.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()[:10]
+    if field == "chamber":
+        return str(value).strip().lower()
+    if field == "bill_number":
+        match = re.fullmatch(r"\s*([A-Za-z]+)\s*\.?\s*(\d+)\s*", str(value))
+        if match:
+            return f"{match.group(1).upper()}.{match.group(2)}"
+        return str(value).strip().upper()
+    return str(value)
+
+
+def parse_date(value: Any) -> date:
+    """Parses a date filter bound, given as a date or a "YYYY-MM-DD" string.
+
+    Month and day may be written without a leading zero, e.g. "2026-1-5".
+
+    Raises:
+        ValueError: If the value is not a valid date.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text = str(value).strip()
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+class MetadataIndex:
+    """Inverted index from metadata values to docstore ids.
+
+    Built at ingest time so that filtered searches can restrict the vector search to the
+    matching ids up front, instead of over-fetching neighbours and filtering them afterwards.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, Set[str]]] = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self._values: Dict[str, Dict[str, str]] = {}  # id -> {field: key}, used for removals
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, documents: Iterable[Document]):
+        """Indexes the metadata of documents. Each document must have an id."""
+        for document in documents:
+            keys = {}
+            for field in INDEXED_FIELDS:
+                key = normalize_value(field, document.metadata.get(field))
+                if key is not None:
+                    self._postings[field][key].add(document.id)
+                    keys[field] = key
+            self._values[document.id] = keys
+
+    def remove(self, ids: Iterable[str]):
+        """Removes documents from the index by id. Unknown ids are ignored."""
+        for doc_id in ids:
+            for field, key in self._values.pop(doc_id, {}).items():
+                postings = self._postings[field][key]
+                postings.discard(doc_id)
+                if not postings:
+                    del self._postings[field][key]
+
+    def match(
+        self,
+        date_range: Optional[List[str]] = None,
+        chamber: Optional[str] = None,
+        bill_number: Optional[str] = None,
+        act_summary: Optional[bool] = None,
+        as_enacted: Optional[bool] = None,
+    ) -> Optional[Set[str]]:
+        """Returns the ids of documents matching every given filter.
+
+        Args:
+            date_range (Optional[List[str]]): Start and end `journal_date`, in ["YYYY-MM-DD", "YYYY-MM-DD"]
+                                              format. Either bound may be empty.
+            chamber (Optional[str]): "house", "senate" or "joint".
+            bill_number (Optional[str]): A bill number such as "H.479".
+            act_summary (Optional[bool]): Whether the document is an act summary.
+            as_enacted (Optional[bool]): Whether the document is an act as enacted.
+
+        Returns:
+            Optional[Set[str]]: The matching ids, or None if no filter was given.
+
+        Raises:
+            ValueError: If a bound of `date_range` is not a valid date.
+        """
+        result: Optional[Set[str]] = None
+
+        def intersect(ids: Set[str]):
+            nonlocal result
+            result = set(ids) if result is None else result & ids
+
+        if date_range and len(date_range) == 2 and any(date_range):
+            # compared as ISO strings, which sort chronologically once zero-padded
+            start, end = (parse_date(bound).isoformat() if bound else None for bound in date_range)
+            ids: Set[str] = set()
+            for key, postings in self._postings["journal_date"].items():
+                if (not start or start <= key) and (not end or key <= end):
+                    ids |= postings
+            intersect(ids)
+
+        for field, value in (
+            ("chamber", chamber),
+            ("bill_number", bill_number),
+            ("act_summary", act_summary),
+            ("as_enacted", as_enacted),
+        ):
+            key = normalize_value(field, value)
+            if key is not None:
+                intersect(self._postings[field].get(key, set()))
+
+        return result
+
+    def save(self, path: str):
+        """Writes the index to a JSON file."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "values": self._values}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MetadataIndex":
+        """Reads an index written by `save`."""
+        index = cls()
+        with open(path) as f:
+            values = json.load(f)["values"]
+        for doc_id, keys in values.items():
+            index._values[doc_id] = keys
+            for field, key in keys.items():
+                index._postings[field][key].add(doc_id)
+        return index
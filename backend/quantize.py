@@ -0,0 +1,171 @@
+import argparse
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from llm import get_embeddings
+from load import (
+    COMPRESSED_INDEX_KINDS,
+    INDEX_IDS_FILE,
+    compressed_index_file,
+    compressed_manifest_file,
+    index_ids_digest,
+)
+
+BASE_DIR = Path(__file__).resolve().parent
+FAISS_PATH = str((BASE_DIR.parent / "faiss_index").resolve())
+# questions of the retrieval benchmark, the default evaluation queries
+QUESTIONS_PATH = BASE_DIR / "bench_questions.json"
+
+
+def build_compressed_index(flat_index: faiss.Index, kind: str, nlist: int | None = None, m: int | None = None) -> faiss.Index:
+    """Builds a compressed copy of a flat index.
+
+    Vectors are added in the same order, so positions (and therefore the docstore mapping) are
+    shared with the flat index.
+
+    Args:
+        flat_index (faiss.Index): The exact index to compress.
+        kind (str): "sq8" for 8-bit scalar quantization, or "ivfpq" for an inverted file with
+                    product quantization.
+        nlist (int | None): Number of IVF lists. Defaults to about 4 * sqrt(n).
+        m (int | None): Number of PQ sub-quantizers. Defaults to the largest divisor of the
+                        dimension that is at most dimension / 16.
+
+    Returns:
+        faiss.Index: The trained and filled compressed index.
+    """
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    d = flat_index.d
+    metric = flat_index.metric_type
+
+    if kind == "sq8":
+        index = faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit, metric)
+    elif kind == "ivfpq":
+        nlist = nlist or max(1, min(int(4 * math.sqrt(len(vectors))), len(vectors) // 39))
+        if m is None:
+            m = max(divisor for divisor in range(1, max(1, d // 16) + 1) if d % divisor == 0)
+        quantizer = faiss.IndexFlat(d, metric)
+        index = faiss.IndexIVFPQ(quantizer, d, nlist, m, 8, metric)
+    else:
+        raise ValueError(f"Unknown compressed index kind {kind!r}, expected one of {COMPRESSED_INDEX_KINDS}")
+
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def load_queries(path: str | None = None) -> list[str]:
+    """Evaluation queries: one per line of `path`, e.g. logged user queries, or the benchmark questions.
+
+    Indexed vectors must not be used as their own queries: each is its own exact nearest neighbour,
+    which a compressed index finds far more easily than the neighbours of a real question.
+    """
+    if path:
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()]
+    with open(QUESTIONS_PATH) as f:
+        return [question["question"] for question in json.load(f)["questions"]]
+
+
+def query_vectors(queries: list[str], flat_index: faiss.Index) -> np.ndarray:
+    """Embeds the queries with the configured embeddings, the way `Storage` embeds a question."""
+    embeddings = get_embeddings()
+    if hasattr(embeddings, "embed_queries"):
+        vectors = embeddings.embed_queries(queries)
+    else:
+        vectors = [embeddings.embed_query(query) for query in queries]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.shape[1] != flat_index.d:
+        raise ValueError(
+            f"Query embeddings have dimension {vectors.shape[1]} but the index has {flat_index.d}; "
+            "set EMBEDDINGS_PROVIDER to the embeddings the index was built with"
+        )
+    return vectors
+
+
+def write_manifest(path: str, kind: str, compressed: faiss.Index):
+    """Records the chunk ids the compressed index was built from, checked by `Storage.load`."""
+    with open(os.path.join(path, INDEX_IDS_FILE)) as f:
+        ids = f.read()
+    manifest = {"ntotal": int(compressed.ntotal), "ids_sha256": index_ids_digest(ids)}
+    with open(os.path.join(path, compressed_manifest_file(kind)), "w") as f:
+        json.dump(manifest, f)
+
+
+def _timed_search(index: faiss.Index, queries: np.ndarray, k: int):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - started)
+        results.append(found[0])
+    return np.asarray(results), np.asarray(latencies) * 1000
+
+
+def evaluate(flat_index: faiss.Index, compressed: faiss.Index, queries: np.ndarray, k: int = 15) -> dict:
+    """Compares a compressed index against the exact flat index.
+
+    Returns:
+        dict: recall@k of the compressed index w.r.t. the exact neighbours, and per-query
+              latency percentiles (ms) and code size (bytes) of both indexes.
+    """
+    exact, flat_ms = _timed_search(flat_index, queries, k)
+    approx, compressed_ms = _timed_search(compressed, queries, k)
+    recall = np.mean([
+        len(set(e[e != -1]) & set(a[a != -1])) / max(1, len(e[e != -1]))
+        for e, a in zip(exact, approx)
+    ])
+
+    def summary(ms: np.ndarray, index: faiss.Index) -> dict:
+        return {
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "bytes": int(faiss.serialize_index(index).size),
+        }
+
+    return {
+        "k": k,
+        "queries": len(queries),
+        "recall_at_k": float(recall),
+        "flat": summary(flat_ms, flat_index),
+        "compressed": summary(compressed_ms, compressed),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build a compressed, memory-mappable copy of the FAISS index and report recall vs. latency."
+    )
+    parser.add_argument("--path", default=FAISS_PATH, help="Directory of the flat FAISS index.")
+    parser.add_argument("--kind", choices=COMPRESSED_INDEX_KINDS, default="ivfpq")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (ivfpq only).")
+    parser.add_argument("--m", type=int, default=None, help="PQ sub-quantizers (ivfpq only).")
+    parser.add_argument("--nprobe", type=int, default=int(os.getenv("FAISS_NPROBE", "16")), help="IVF lists probed when evaluating.")
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument(
+        "--queries",
+        default=None,
+        help="Text file with one evaluation query per line, e.g. logged user queries. Defaults to the "
+        "questions of bench_questions.json.",
+    )
+    args = parser.parse_args()
+
+    flat = faiss.read_index(os.path.join(args.path, "index.faiss"))
+    compressed = build_compressed_index(flat, args.kind, nlist=args.nlist, m=args.m)
+    ivf = faiss.try_extract_index_ivf(compressed)
+    if ivf is not None:
+        ivf.nprobe = args.nprobe
+
+    output_path = os.path.join(args.path, compressed_index_file(args.kind))
+    faiss.write_index(compressed, output_path)
+    write_manifest(args.path, args.kind, compressed)
+    print(f"Wrote {args.kind} index with {compressed.ntotal} vectors to {output_path}")
+
+    queries = query_vectors(load_queries(args.queries), flat)
+    print(json.dumps(evaluate(flat, compressed, queries, k=args.k), indent=2))
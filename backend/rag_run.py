@@ -1,22 +1,35 @@
+import argparse
+import asyncio
 import json
+import os
+import random
+import re
+import time
 from pydantic import BaseModel, Field
-from typing import List, Optional, Any, Set
-from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Tuple
+from langchain_core.documents import Document
 # Import messages for building the new prompt
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
-from pathlib import Path  # <-- ADDED
-
-# --- USER: EDIT THIS ---
-#
-# Assumptions:
-# 1. Your class with the .rag() method is in a file named `storage.py`.
-# 2. The class itself is named `LegislatureStorage`.
-# 3. Your `Retrieval` object is also defined in `storage.py`.
-# 4. Your `llm` and `prompt` are in `llm.py`.
-#
-# Please CHANGE these imports to match your actual project structure.
-from load import Storage, Retrieval  # <-- CHANGED
-from llm import llm                       # <-- CHANGED
+from langchain_core.messages import HumanMessage, SystemMessage
+from pathlib import Path
+
+from load import RAG_K, Storage, FAISS_INDEX_MODE, aembed_queries, search_executor
+from llm import get_llm
+
+BASE_DIR = Path(__file__).resolve().parent
+FAISS_PATH = str((BASE_DIR.parent / "faiss_index").resolve())
+OUTPUT_PATH = BASE_DIR.parent / "app" / "articles.json"
+CHECKPOINT_DIR = BASE_DIR.parent / "article_checkpoints"
+# chunk ids and source urls each topic's articles were generated from
+SOURCES_PATH = BASE_DIR.parent / "article_sources.json"
+# a topic is regenerated only when the Jaccard similarity of its retrieved chunk ids to those of
+# its current articles drops below this
+ARTICLE_REGEN_THRESHOLD = float(os.getenv("ARTICLE_REGEN_THRESHOLD", "0.8"))
+
+# topics generated at once; each holds one structured LLM call in flight
+ARTICLE_CONCURRENCY = int(os.getenv("ARTICLE_CONCURRENCY", "3"))
+ARTICLE_MAX_ATTEMPTS = int(os.getenv("ARTICLE_MAX_ATTEMPTS", "6"))
+ARTICLE_RETRY_BASE_SECONDS = float(os.getenv("ARTICLE_RETRY_BASE_SECONDS", "2"))
+ARTICLE_RETRY_MAX_SECONDS = float(os.getenv("ARTICLE_RETRY_MAX_SECONDS", "60"))
 
 
 # 1. Define the Pydantic Schema for a single article
@@ -25,7 +38,7 @@ class Article(BaseModel):
     article_title: str = Field(..., description="A catchy, descriptive title for the article.")
     article_summary: str = Field(..., description="A concise, one-paragraph summary of the article's main points.")
     article_body: str = Field(
-        ..., 
+        ...,
         description="The full body of the article, written in plain text. Do not use markdown."
     )
 
@@ -34,7 +47,7 @@ class Article(BaseModel):
 class ArticleSet(BaseModel):
     """A collection of 5 distinct articles on a given topic."""
     articles: List[Article] = Field(
-        ..., 
+        ...,
         description="A list of 5 unique articles covering different aspects of the topic."
     )
 
@@ -52,9 +65,7 @@ TOPICS = [
     "Civic & Electoral Reform"
 ]
 
-# 4. REMOVED ASPECT_PROMPTS, as requested
-
-# 5. Define the new System Prompt for the LLM
+# 4. Define the new System Prompt for the LLM
 SYSTEM_PROMPT = """You are an expert legislative reporter and journalist. Your task is to write 5 distinct, high-quality articles based *only* on the provided legislative context.
 
 Each of the 5 articles MUST cover a different aspect of the main topic. For example:
@@ -68,124 +79,283 @@ Do not just summarize the documents. Synthesize the information into 5 complete,
 """
 
 
-def generate_all_articles():
-    """
-    Main function to loop through all topics and aspects,
-    call the RAG function, and save the results to JSON.
+def _write_json(path: Path, data: Any):
+    """Writes JSON atomically, so readers never see a half-written file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _checkpoint_path(checkpoint_dir: Path, topic: str) -> Path:
+    slug = re.sub(r"[^a-z0-9]+", "-", topic.lower()).strip("-")
+    return checkpoint_dir / f"{slug}.json"
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    text = f"{type(error).__name__} {error}".lower()
+    return any(marker in text for marker in ("429", "rate limit", "ratelimit", "resourceexhausted", "resource exhausted", "quota"))
+
+
+async def _with_retries(topic: str, make_call, max_attempts: int = ARTICLE_MAX_ATTEMPTS):
+    """Awaits `make_call()`, retrying with exponential backoff and jitter.
+
+    Rate-limit errors are retried up to `max_attempts` times; any other error only twice, since
+    it is unlikely to go away by waiting.
     """
-    
-    # --- USER: EDIT THIS ---
-    # Initialize your storage class here.
-    # This instance must have the .rag() method.
-    try:
-        BASE_DIR = Path(__file__).resolve().parent
-        FAISS_PATH = str((BASE_DIR.parent / "faiss_index").resolve())
-        storage = Storage(path=FAISS_PATH, from_path=True)
-    except Exception as e:
-        print(f"!! ERROR: Failed to initialize your `Storage` class: {e}")  # <-- CHANGED
-        print("Please make sure the class is imported correctly and can be initialized.")
-        return
-    # --- END USER EDIT ---
-
-    all_articles_data = []
-    total_topics = len(TOPICS)
-    article_count = 0
-
-    print(f"Starting article generation for {total_topics} topics...")
-
-    for i, topic in enumerate(TOPICS):
-        print(f"\n--- Processing Topic {i+1}/{total_topics}: {topic} ---")
-        
+    attempt = 0
+    while True:
+        attempt += 1
         try:
-            # 1. Make one RAG query per category, with no schema
-            print(f"  (Step 1/3) Retrieving documents for '{topic}'...")
-            rag_question = f"All relevant legislative documents (transcripts, bills, journals) regarding {topic}"
-            
-            retrieval: Retrieval = storage.rag(
-                question=rag_question,
-                schema=None,  # <-- Set to None as requested
-                date_range=None
-            )
-            
-            # 2. Collect document content and URLs
-            documents: List[Any] = retrieval['documents']
-            if not documents:
-                print(f"  !! WARNING: No documents found for topic '{topic}'. Skipping.")
-                continue
-
-            docs_content = "\n\n".join(doc.page_content for doc in documents)
-            
-            referenced_urls: Set[str] = set()
-            for doc in documents:
-                if hasattr(doc, 'metadata') and isinstance(doc.metadata, dict) and doc.metadata.get('source_url'):
-                    referenced_urls.add(doc.metadata['source_url'])
-            
-            print(f"  (Step 2/3) Retrieved {len(documents)} documents. Generating 5 articles...")
-
-            # 3. Build the prompt for the LLM to generate 5 articles
-            human_prompt = f"""Here is the legislative context on the topic of "{topic}":
-            
+            return await make_call()
+        except Exception as e:
+            rate_limited = _is_rate_limited(e)
+            if attempt >= (max_attempts if rate_limited else min(max_attempts, 3)):
+                raise
+            delay = min(ARTICLE_RETRY_MAX_SECONDS, ARTICLE_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+            delay *= random.uniform(0.5, 1.5)
+            reason = "rate limited" if rate_limited else f"{type(e).__name__}: {e}"
+            print(f"  [{topic}] attempt {attempt} failed ({reason}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+async def retrieve_topic(storage: Storage, topic: str) -> List[Document]:
+    """Retrieves the context documents of a topic.
+
+    This is a plain search, without the answer synthesis of `Storage.rag`, so the structured
+    `ArticleSet` call is the only LLM call per topic.
+    """
+    rag_question = f"All relevant legislative documents (transcripts, bills, journals) regarding {topic}"
+    (vector,) = await aembed_queries([rag_question])
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(search_executor, lambda: storage.search(rag_question, k=RAG_K, vector=vector))
+
+
+def _source_urls(documents: List[Document]) -> List[str]:
+    return list(dict.fromkeys(
+        doc.metadata["source_url"] for doc in documents if doc.metadata.get("source_url")
+    ))
+
+
+def _similarity(previous: Optional[Dict[str, Any]], documents: List[Document]) -> float:
+    # Jaccard similarity of the chunk ids a topic's articles were generated from and the current ones
+    if not previous:
+        return 0.0
+    before, now = set(previous.get("chunk_ids", [])), {doc.id for doc in documents}
+    if not before and not now:
+        return 1.0
+    return len(before & now) / len(before | now)
+
+
+async def generate_topic(topic: str, documents: List[Document]) -> List[Dict[str, Any]]:
+    """Generates the articles of a topic from its retrieved documents.
+
+    Returns:
+        List[Dict[str, Any]]: The article entries in the `articles.json` format.
+    """
+    if not documents:
+        print(f"  !! WARNING: No documents found for topic '{topic}'. Skipping.")
+        return []
+
+    docs_content = "\n\n".join(doc.page_content for doc in documents)
+    referenced_urls = _source_urls(documents)
+    print(f"  [{topic}] Retrieved {len(documents)} documents. Generating 5 articles...")
+
+    # Build the prompt for the LLM to generate 5 articles
+    human_prompt = f"""Here is the legislative context on the topic of "{topic}":
+
             --- BEGIN CONTEXT ---
             {docs_content}
             --- END CONTEXT ---
-            
+
             Please generate 5 complete, distinct articles based *only* on this context,
             following the schema provided.
             """
-            
-            messages = [
-                SystemMessage(content=SYSTEM_PROMPT),
-                HumanMessage(content=human_prompt)
-            ]
-            
-            # 4. Call the LLM with the structured output schema for 5 articles
-            # We use the 'llm' imported from llm.py
-            article_set_response: ArticleSet = llm.with_structured_output(ArticleSet).invoke(messages)
-            
-            generated_articles: List[Article] = article_set_response.articles
-            
-            if not generated_articles:
-                print(f"  !! WARNING: LLM generated 0 articles for '{topic}'.")
-                continue
-
-            print(f"  (Step 3/3) Successfully generated {len(generated_articles)} articles.")
-
-            # 5. Format and append the articles to our main list
-            for article_output in generated_articles:
-                article_count += 1
-                article_entry = {
-                    "category_name": topic,
-                    "article_title": article_output.article_title,
-                    "article_summary": article_output.article_summary,
-                    "article_body": article_output.article_body,
-                    "referenced_urls": list(referenced_urls) # All articles from this batch share the same refs
-                }
-                all_articles_data.append(article_entry)
+    messages = [
+        SystemMessage(content=SYSTEM_PROMPT),
+        HumanMessage(content=human_prompt)
+    ]
 
-        except Exception as e:
-            print(f"  !! FAILED to process topic '{topic}'.")
-            print(f"  Error: {e}")
-            # Add a placeholder entry so we know it failed
-            all_articles_data.append({
-                "category_name": topic,
-                "article_title": f"FAILED to process topic: {topic}",
-                "article_summary": f"Generation failed with error: {e}",
-                "article_body": "",
-                "referenced_urls": []
-            })
-
-    # 6. Save the final JSON output
-    output_filename = "generated_articles.json"
-    print(f"\n--- All processing complete! ---")
-    print(f"Generated a total of {len(all_articles_data)} article entries.")
-    
+    model = get_llm().with_structured_output(ArticleSet)
+    article_set: ArticleSet = await _with_retries(topic, lambda: model.ainvoke(messages))
+    if not article_set.articles:
+        print(f"  !! WARNING: LLM generated 0 articles for '{topic}'.")
+
+    return [
+        {
+            "category_name": topic,
+            "article_title": article.article_title,
+            "article_summary": article.article_summary,
+            "article_body": article.article_body,
+            "referenced_urls": referenced_urls,  # All articles from this batch share the same refs
+        }
+        for article in article_set.articles
+    ]
+
+
+def _load_sources(sources_path: Path) -> Dict[str, Dict[str, Any]]:
+    if not sources_path.exists():
+        return {}
+    with open(sources_path, encoding="utf-8") as f:
+        return json.load(f)["topics"]
+
+
+def _load_output(output_path: Path) -> Dict[str, List[Dict[str, Any]]]:
+    # entries of an earlier run, by topic, kept for topics that are not regenerated
+    if not output_path.exists():
+        return {}
     try:
-        with open(output_filename, "w", encoding="utf-8") as f:
-            json.dump(all_articles_data, f, indent=2, ensure_ascii=False)
-        print(f"Results successfully saved to {output_filename}")
-    except IOError as e:
-        print(f"!! ERROR: Failed to write output file: {e}")
+        with open(output_path, encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"!! WARNING: Could not read existing {output_path}: {e}")
+        return {}
+    by_topic: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in entries:
+        by_topic.setdefault(entry.get("category_name"), []).append(entry)
+    return by_topic
+
+
+async def generate_all_articles(
+    topics: Optional[List[str]] = None,
+    concurrency: int = ARTICLE_CONCURRENCY,
+    output_path: Path = OUTPUT_PATH,
+    checkpoint_dir: Path = CHECKPOINT_DIR,
+    fresh: bool = False,
+    sources_path: Path = SOURCES_PATH,
+    threshold: float = ARTICLE_REGEN_THRESHOLD,
+) -> List[str]:
+    """Generates the articles of all topics concurrently and writes them to `output_path`.
+
+    The context of every topic is retrieved first, which only takes a vector search. A topic is
+    regenerated only if that retrieval set changed materially since its articles were generated,
+    i.e. the Jaccard similarity of the chunk ids recorded in `sources_path` falls below
+    `threshold`; otherwise its entries in `output_path` are carried over.
+
+    Each finished topic is checkpointed under `checkpoint_dir` and the output file and
+    `sources_path` are rewritten right away, so an interrupted or partly failed run keeps
+    everything already generated. Until a run completes without failures, the articles of a
+    checkpointed topic are taken from its checkpoint; like any other topic it is only generated
+    again if its retrieval changed since, it is named in `topics` or `fresh` is set. A topic that
+    yields no articles, e.g. because nothing was retrieved for it, keeps its previous articles
+    without counting as failed.
+
+    Args:
+        topics (Optional[List[str]]): Only regenerate these topics, whether or not their retrieval
+                                      changed. Defaults to every topic whose retrieval changed.
+        concurrency (int): Maximum number of topics generated at once.
+        output_path (Path): The `articles.json` file to write.
+        checkpoint_dir (Path): Directory of the per-topic checkpoints.
+        fresh (bool): Ignore existing checkpoints and regenerate every topic.
+        sources_path (Path): The file recording the chunk ids and source urls of each topic.
+        threshold (float): Minimum similarity of the retrieval sets for a topic to be kept.
 
-# 7. Run the script
+    Returns:
+        List[str]: The topics that failed.
+    """
+    unknown = set(topics or []) - set(TOPICS)
+    if unknown:
+        raise ValueError(f"Unknown topics: {sorted(unknown)}. Expected some of {TOPICS}")
+
+    storage = Storage(path=FAISS_PATH, from_path=True, index_mode=FAISS_INDEX_MODE, read_only=True)
+    if not storage.vector_store:
+        print(f"!! ERROR: No index found at {FAISS_PATH}. Run upload.py first.")
+        return list(topics or TOPICS)
+
+    entries = _load_output(output_path)
+    sources = _load_sources(sources_path)
+    candidates = []
+    for topic in TOPICS:
+        checkpoint = _checkpoint_path(checkpoint_dir, topic)
+        if topics is not None and topic not in topics:
+            continue
+        if topics is None and not fresh and checkpoint.exists():
+            # generated by an unfinished run; still regenerated below if its retrieval changed since
+            with open(checkpoint, encoding="utf-8") as f:
+                entries[topic] = json.load(f)["articles"]
+        candidates.append(topic)
+
+    retrieved = dict(zip(candidates, await asyncio.gather(*(retrieve_topic(storage, topic) for topic in candidates))))
+    pending: List[Tuple[str, List[Document]]] = []
+    for topic, documents in retrieved.items():
+        similarity = _similarity(sources.get(topic), documents)
+        if topics is None and not fresh and entries.get(topic) and similarity >= threshold:
+            print(f"  [{topic}] Retrieval unchanged (similarity {similarity:.2f}), keeping {len(entries[topic])} articles.")
+            continue
+        pending.append((topic, documents))
+
+    print(f"Starting article generation for {len(pending)} of {len(TOPICS)} topics ({concurrency} at a time)...")
+    semaphore = asyncio.Semaphore(concurrency)
+    write_lock = asyncio.Lock()
+    failed: List[str] = []
+    empty: List[str] = []
+
+    async def run(topic: str, documents: List[Document]):
+        async with semaphore:
+            started = time.perf_counter()
+            print(f"\n--- Processing topic: {topic} ---")
+            try:
+                articles = await generate_topic(topic, documents)
+            except Exception as e:
+                print(f"  !! FAILED to process topic '{topic}'.")
+                print(f"  Error: {e}")
+                failed.append(topic)
+                return
+            if not articles:
+                # nothing to write about is not a failure: keep the entries of the last run
+                empty.append(topic)
+                return
+            print(f"  [{topic}] Generated {len(articles)} articles in {time.perf_counter() - started:.1f}s.")
+
+        async with write_lock:
+            _write_json(_checkpoint_path(checkpoint_dir, topic), {"topic": topic, "articles": articles})
+            entries[topic] = articles
+            _write_json(output_path, [entry for name in TOPICS for entry in entries.get(name, [])])
+            sources[topic] = {
+                "chunk_ids": sorted(doc.id for doc in documents),
+                "source_urls": _source_urls(documents),
+                "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            _write_json(sources_path, {"version": 1, "topics": sources})
+
+    await asyncio.gather(*(run(topic, documents) for topic, documents in pending))
+
+    if not failed:
+        # the run is complete: the next one starts over instead of resuming
+        for topic in TOPICS:
+            _checkpoint_path(checkpoint_dir, topic).unlink(missing_ok=True)
+
+    total = sum(len(articles) for articles in entries.values())
+    print(f"\n--- All processing complete! {total} articles in {output_path} ---")
+    if empty:
+        print(f"{len(empty)} topics yielded no articles and kept their previous ones: {', '.join(empty)}")
+    if failed:
+        names = " ".join(f'"{topic}"' for topic in failed)
+        print(f"!! {len(failed)} topics failed. Re-run them alone with: python rag_run.py --topics {names}")
+    return failed
+
+
+# 5. Run the script
 if __name__ == "__main__":
-    generate_all_articles()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate the articles of each topic from the FAISS index.")
+    parser.add_argument("--topics", nargs="+", default=None, help="Only (re)generate these topics.")
+    parser.add_argument("--concurrency", type=int, default=ARTICLE_CONCURRENCY, help="Topics generated at once.")
+    parser.add_argument("--output", type=Path, default=OUTPUT_PATH, help="The articles.json file to write.")
+    parser.add_argument("--checkpoint-dir", type=Path, default=CHECKPOINT_DIR, help="Directory of per-topic checkpoints.")
+    parser.add_argument("--fresh", action="store_true", help="Regenerate every topic, ignoring checkpoints and unchanged retrievals.")
+    parser.add_argument("--sources", type=Path, default=SOURCES_PATH, help="File recording the sources of each topic.")
+    parser.add_argument("--threshold", type=float, default=ARTICLE_REGEN_THRESHOLD,
+                        help="Regenerate a topic when the Jaccard similarity of its retrieved chunks drops below this.")
+    args = parser.parse_args()
+
+    failed_topics = asyncio.run(generate_all_articles(
+        topics=args.topics,
+        concurrency=args.concurrency,
+        output_path=args.output,
+        checkpoint_dir=args.checkpoint_dir,
+        fresh=args.fresh,
+        sources_path=args.sources,
+        threshold=args.threshold,
+    ))
+    raise SystemExit(1 if failed_topics else 0)
@@ -13,6 +13,8 @@ class ChatMessagePayload(BaseModel):
 class UserQueryRequest(BaseModel):
     user_query: str
     conversation: List[ChatMessagePayload] = Field(default_factory=list)
+    # adds a `timings` block with the spans and counters of this request to the response
+    include_timings: bool = False
 
 
 class DocumentPayload(BaseModel):
@@ -63,3 +65,4 @@ class DocumentPayload(BaseModel):
 class UserQueryResponse(BaseModel):
     text_response: str
     documents: List[DocumentPayload] = Field(default_factory=list)
+    timings: Optional[Dict[str, Any]] = None  # see `tracing.Trace.summary`
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# the backend modules import each other as top-level modules, as when run from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# offline models of fakes.py, see llm.py
+os.environ.setdefault("EMBEDDINGS_PROVIDER", "fake")
+os.environ.setdefault("LLM_PROVIDER", "fake")
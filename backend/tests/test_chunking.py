@@ -0,0 +1,24 @@
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from chunking import CHUNKING_STRATEGY, chunked_hash, chunker_id, split_document
+
+ACT = "\n".join(
+    f"Sec. {n}. DEFINITIONS\n" + " ".join(f"({letter}) term {n}{letter} means a thing." for letter in "abcdefghij") * (n % 4 + 1)
+    for n in range(1, 12)
+)
+
+
+def test_default_chunking_cuts_the_chunks_of_the_original_splitter():
+    # indexes built before the chunking strategies keep their hashes, so their chunks must not change
+    document = Document(page_content=ACT, metadata={"source_url": "act.pdf"})
+    original = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=0).split_documents([document])
+
+    assert CHUNKING_STRATEGY == "fixed"
+    assert [chunk.page_content for chunk in split_document(document, "act")] == [chunk.page_content for chunk in original]
+    assert chunked_hash("abc") == "abc"
+
+
+def test_other_chunkings_change_the_content_hash():
+    assert chunked_hash("abc", chunker_id("structured")) == f"abc:{chunker_id('structured')}"
+    assert chunked_hash("abc", chunker_id("fixed", 500)) != "abc"
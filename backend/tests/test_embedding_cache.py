@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+
+from embedding_cache import CachedEmbeddings
+from fakes import HashingEmbeddings
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    """HashingEmbeddings that records every text it is asked to embed, and which were queries."""
+
+    def __init__(self, model: str = "hashing", **kwargs):
+        super().__init__(**kwargs)
+        self.model = model
+        self.embedded = []
+        self.queries = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.embedded.append(text)
+        self.queries.append(text)
+        return super().embed_query(text)
+
+    async def aembed_documents(self, texts):
+        self.embedded.extend(texts)
+        return await super().aembed_documents(texts)
+
+    async def aembed_query(self, text):
+        self.embedded.append(text)
+        self.queries.append(text)
+        return await super().aembed_query(text)
+
+
+def test_hits_are_not_embedded_again(tmp_path):
+    underlying = CountingEmbeddings(size=16)
+    cache = CachedEmbeddings(underlying, str(tmp_path / "cache.sqlite"))
+
+    first = cache.embed_documents(["Sec. 1. Short title.", "H. 101"])
+    second = cache.embed_documents(["H. 101", "Sec. 2. Definitions.", "Sec. 1. Short title."])
+
+    assert underlying.embedded == ["Sec. 1. Short title.", "H. 101", "Sec. 2. Definitions."]
+    # vectors are stored as float32
+    assert second[0] == pytest.approx(first[1], abs=1e-6)
+    assert second[2] == pytest.approx(first[0], abs=1e-6)
+    assert second[1] == underlying._embed("Sec. 2. Definitions.")
+    assert len(cache) == 3
+
+
+def test_queries_persist_and_are_keyed_apart_from_documents(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    underlying = CountingEmbeddings(size=16)
+    cache = CachedEmbeddings(underlying, path)
+
+    cache.embed_documents(["tax credit"])
+    cache.embed_query("tax credit")
+    assert cache.embed_queries(["tax credit", "school budget"])[1] == underlying._embed("school budget")
+    asyncio.run(cache.aembed_query("school budget"))
+    asyncio.run(cache.aembed_queries(["tax credit"]))
+    assert underlying.embedded == ["tax credit", "tax credit", "school budget"]
+    # queries are embedded as queries, even in a batch
+    assert underlying.queries == ["tax credit", "school budget"]
+    asyncio.run(cache.aembed_queries(["housing", "tax credit", "zoning"]))
+    assert underlying.queries == ["tax credit", "school budget", "housing", "zoning"]
+
+    reopened = CachedEmbeddings(underlying, path)
+    reopened.embed_query("school budget")
+    assert len(reopened) == 5
+    assert underlying.queries == ["tax credit", "school budget", "housing", "zoning"]
+
+
+def test_model_name_is_part_of_the_key(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    small = CountingEmbeddings(model="small", size=16)
+    large = CountingEmbeddings(model="large", size=32)
+
+    CachedEmbeddings(small, path).embed_documents(["Sec. 1."])
+    vector = CachedEmbeddings(large, path).embed_documents(["Sec. 1."])[0]
+    renamed = CachedEmbeddings(small, path, model_name="large").embed_documents(["Sec. 1."])[0]
+
+    assert small.embedded == ["Sec. 1."]
+    assert large.embedded == ["Sec. 1."]
+    assert len(vector) == 32
+    assert renamed == pytest.approx(vector, abs=1e-6)
+
+
+def test_least_recently_used_vectors_are_evicted_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    underlying = CountingEmbeddings(size=16)
+    cache = CachedEmbeddings(underlying, path, max_entries=4, evict_batch=2)
+
+    cache.embed_documents(["a"])
+    cache.embed_documents(["b"])
+    cache.embed_documents(["c", "d"])
+    cache.embed_documents(["a"])  # a hit, so "b" is now the least recently used
+    cache.embed_documents(["e"])  # 5 > 4 entries: evicts down to 4 - 2
+
+    assert len(cache) == 2
+    assert cache._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone() == (2,)
+    underlying.embedded.clear()
+    cache.embed_documents(["a", "e"])
+    assert underlying.embedded == []
+    cache.embed_documents(["b"])
+    assert underlying.embedded == ["b"]
+
+
+def test_hits_write_last_used_in_batches(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = CachedEmbeddings(CountingEmbeddings(size=16), path, touch_batch=3)
+    cache.embed_documents(["a", "b", "c"])
+
+    def last_used():
+        return dict(cache._conn.execute("SELECT key, last_used FROM embeddings").fetchall())
+
+    stored = last_used()
+    cache.embed_documents(["a", "b"])
+    assert last_used() == stored
+    cache.embed_documents(["c"])
+    touched = last_used()
+    assert all(touched[key] >= stored[key] for key in stored)
+    assert len(cache._touched) == 0
+
+    cache.embed_documents(["a"])
+    cache.flush()
+    assert last_used()[cache._key("a")] >= touched[cache._key("a")]
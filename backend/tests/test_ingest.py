@@ -0,0 +1,108 @@
+import json
+
+import pytest
+from langchain_core.documents import Document
+
+import upload
+from ingest import MANIFEST_FILE, BulkIngestor, hash_text
+from load import Storage
+
+
+def ingest(path, sources, **kwargs):
+    """Runs one ingestion of `sources` (source key -> text) and returns the Storage."""
+    storage = Storage(path=path)
+    with BulkIngestor(storage, batch_size=1, **kwargs) as ingestor:
+        for key, text in sources.items():
+            add(ingestor, key, text)
+    return storage
+
+
+def add(ingestor, key, text):
+    content_hash = hash_text(text, {})
+    if ingestor.needs_indexing(key, content_hash):
+        ingestor.add(key, content_hash, [Document(page_content=text, metadata={"source_url": key})])
+
+
+def manifest(path):
+    with open(f"{path}/{MANIFEST_FILE}") as f:
+        return json.load(f)["sources"]
+
+
+def indexed_texts(storage):
+    docstore = storage.vector_store.docstore
+    return sorted(docstore.search(doc_id).page_content for doc_id in storage.vector_store.index_to_docstore_id.values())
+
+
+def test_rerun_skips_unchanged_replaces_changed_and_drops_removed(tmp_path):
+    path = str(tmp_path / "index")
+    ingest(path, {"a": "Sec. 1. Short title.", "b": "H. 101 as introduced", "c": "Senate journal"})
+    before = manifest(path)
+
+    storage = ingest(path, {"a": "Sec. 1. Short title.", "b": "H. 101 as enacted"})
+    after = manifest(path)
+
+    assert sorted(after) == ["a", "b"]
+    assert after["a"] == before["a"]
+    assert after["b"]["ids"] != before["b"]["ids"]
+    assert indexed_texts(storage) == ["H. 101 as enacted", "Sec. 1. Short title."]
+    reloaded = Storage(path=path, from_path=True)
+    assert reloaded.vector_store.index.ntotal == 2
+    assert reloaded.vector_store.docstore.search(before["b"]["ids"][0]) != reloaded.vector_store.docstore.search(after["b"]["ids"][0])
+
+
+def test_keep_unseen_and_no_prune_keep_sources_that_were_not_checked(tmp_path):
+    path = str(tmp_path / "index")
+    ingest(path, {"acts/a": "Sec. 1.", "journals/b": "House journal"})
+
+    storage = Storage(path=path)
+    with BulkIngestor(storage, batch_size=1) as ingestor:
+        ingestor.keep_unseen(lambda key: key.startswith("acts/"))
+    assert sorted(manifest(path)) == ["acts/a"]
+
+    ingest(path, {}, prune=False)
+    assert sorted(manifest(path)) == ["acts/a"]
+
+
+def test_interrupted_run_resumes_from_the_last_checkpoint(tmp_path):
+    path = str(tmp_path / "index")
+    interrupted = Storage(path=path)
+    with pytest.raises(KeyboardInterrupt):
+        with BulkIngestor(interrupted, batch_size=1, checkpoint_every=2) as ingestor:
+            add(ingestor, "a", "Sec. 1.")
+            add(ingestor, "b", "Sec. 2.")  # checkpoint
+            add(ingestor, "c", "Sec. 3.")
+            raise KeyboardInterrupt
+    interrupted.close()  # as the process exits: the unsaved chunk of "c" is discarded
+    checkpointed = manifest(path)
+    assert sorted(checkpointed) == ["a", "b"]
+    assert Storage(path=path, from_path=True).vector_store.index.ntotal == 2
+
+    storage = ingest(path, {"a": "Sec. 1.", "b": "Sec. 2.", "c": "Sec. 3."})
+    resumed = manifest(path)
+    assert sorted(resumed) == ["a", "b", "c"]
+    assert {key: resumed[key] for key in checkpointed} == checkpointed
+    assert indexed_texts(storage) == ["Sec. 1.", "Sec. 2.", "Sec. 3."]
+
+
+@pytest.mark.parametrize("prune_missing", [False, True])
+def test_upload_keeps_the_sources_of_a_missing_directory(tmp_path, monkeypatch, prune_missing):
+    path = str(tmp_path / "index")
+    act_key = "vermont_acts_2026/H.1/act.pdf"
+    journal_key = "vermont_journals_2026/journal.pdf"
+    transcript_url = "https://example.org/hearing"
+    ingest(path, {act_key: "Sec. 1.", journal_key: "House journal", transcript_url: "Testimony"})
+
+    data_dir = tmp_path / "scraped_data"
+    (data_dir / "vermont_journals_2026").mkdir(parents=True)  # present, but the journal is gone
+    transcripts_path = data_dir / "transcripts.json"
+    transcripts_path.write_text(json.dumps({"house": {"judiciary": [{"url": transcript_url, "transcript": "Testimony"}]}}))
+    monkeypatch.setattr(upload, "storage", Storage(path=path))
+    monkeypatch.setattr(upload, "ACTS_DIR", data_dir / "vermont_acts_2026")  # missing
+    monkeypatch.setattr(upload, "JOURNALS_DIR", data_dir / "vermont_journals_2026")
+    monkeypatch.setattr(upload, "TRANSCRIPTS_PATH", transcripts_path)
+    monkeypatch.setattr(upload, "get_transcript_metadata", lambda entry, chamber: {})  # matches `ingest`
+
+    upload.upload_files(extract_workers=1, prune_missing=prune_missing)
+
+    expected = [transcript_url] if prune_missing else sorted([act_key, transcript_url])
+    assert sorted(manifest(path)) == expected
@@ -0,0 +1,40 @@
+import pytest
+from langchain_core.documents import Document
+
+from ingest import BulkIngestor, hash_text
+from load import RAGToolInput, Storage
+
+
+def ingest(path, sources):
+    with BulkIngestor(Storage(path=path), batch_size=8) as ingestor:
+        for key, text in sources.items():
+            content_hash = hash_text(text, {})
+            if ingestor.needs_indexing(key, content_hash):
+                ingestor.add(key, content_hash, [Document(page_content=text, metadata={"source_url": key})])
+
+
+def test_server_survives_an_upload_that_replaces_its_chunks(tmp_path):
+    path = str(tmp_path / "index")
+    sources = {f"act-{n}": f"Sec. {n}. Appropriations for the fiscal year, section {n}." for n in range(6)}
+    ingest(path, sources)
+    server = Storage(path=path, from_path=True, read_only=True)
+    loaded_ids = set(server.vector_store.index_to_docstore_id.values())
+
+    # re-indexing a changed source deletes its old chunks from the shared chunk store
+    ingest(path, {**sources, "act-0": "Sec. 0. Appropriations for the fiscal year, amended by H. 99."})
+
+    for mode in ("vector", "hybrid"):
+        documents = server.search("appropriations fiscal year H. 99", k=6, mode=mode)
+        assert documents
+        assert all(isinstance(doc, Document) for doc in documents)
+        assert {doc.id for doc in documents} <= loaded_ids
+        retrieval = server.retrieve_context_batch([RAGToolInput(question="appropriations section 0")], mode=mode)[0]
+        assert all(isinstance(doc, Document) for doc in retrieval["documents"])
+
+
+def test_read_only_storage_refuses_writes(tmp_path):
+    path = str(tmp_path / "index")
+    ingest(path, {"act-1": "Sec. 1. Short title."})
+    server = Storage(path=path, from_path=True, read_only=True)
+    with pytest.raises(ValueError):
+        server.add_documents([Document(page_content="Sec. 2.")])
@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
+
+import main
+from load import Storage
+from schemas import UserQueryRequest
+
+
+async def _disconnected_send(message):
+    raise OSError("Connection reset by peer")
+
+
+async def _receive():
+    return {"type": "http.disconnect"}
+
+
+@pytest.mark.parametrize("spec_version", ["2.4", "2.0"])
+def test_stream_slot_is_released_when_the_client_leaves_before_the_response(monkeypatch, spec_version):
+    monkeypatch.setattr(main, "app_graph", object())  # warmed up; the graph is never reached
+    monkeypatch.setattr(main, "_in_flight", 0)
+
+    async def scenario():
+        response = await main.user_query_stream_endpoint(UserQueryRequest(user_query="What did H. 101 change?"))
+        assert main._in_flight == 1
+        scope = {"type": "http", "asgi": {"spec_version": spec_version}}
+        with pytest.raises((OSError, ClientDisconnect)):
+            await response(scope, _receive, _disconnected_send)
+
+    asyncio.run(scenario())
+    assert main._in_flight == 0
+
+
+def test_ready_reports_503_until_an_index_is_loaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "storage", Storage(path=str(tmp_path / "missing"), read_only=True))
+    monkeypatch.setattr(main, "app_graph", None)
+    monkeypatch.setattr(main, "warm_error", None)
+
+    with TestClient(main.app) as client:
+        deadline = time.monotonic() + 10
+        while main.warm_error is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        response = client.get("/ready")
+
+    assert response.status_code == 503
+    assert response.json()["ready"] is False
+    assert "run upload.py first" in response.json()["error"]
+    assert main.app_graph is None
@@ -0,0 +1,29 @@
+from datetime import date
+
+import pytest
+from langchain_core.documents import Document
+
+from metadata_index import MetadataIndex
+
+
+@pytest.fixture
+def index():
+    index = MetadataIndex()
+    index.add(
+        Document(id=f"journal-{day}", page_content="", metadata={"journal_date": date(2026, 1, day), "chamber": "house"})
+        for day in (3, 5, 12, 20)
+    )
+    return index
+
+
+def test_date_range_accepts_bounds_without_leading_zeros(index):
+    assert index.match(date_range=["2026-01-05", "2026-01-12"]) == {"journal-5", "journal-12"}
+    assert index.match(date_range=["2026-1-5", "2026-1-12"]) == {"journal-5", "journal-12"}
+    assert index.match(date_range=["2026-1-4", ""]) == {"journal-5", "journal-12", "journal-20"}
+    assert index.match(date_range=[None, "2026-1-9"], chamber="House") == {"journal-3", "journal-5"}
+
+
+@pytest.mark.parametrize("bounds", [["2026-02-30", ""], ["", "January 5"], ["2026-13-01", "2026-12-31"]])
+def test_invalid_date_bounds_raise(index, bounds):
+    with pytest.raises(ValueError):
+        index.match(date_range=bounds)
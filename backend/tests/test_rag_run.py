@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+import pytest
+
+import rag_run
+from bench_retrieval import build_storage, load_questions
+
+EMPTY_TOPIC = "Civic & Electoral Reform"
+
+
+@pytest.fixture
+def run_articles(tmp_path, monkeypatch):
+    """Runs `generate_all_articles` on the fixture documents; returns the topics generated per run."""
+    index_path = str(tmp_path / "index")
+    build_storage(load_questions()["documents"], index_path).save()
+    monkeypatch.setattr(rag_run, "FAISS_PATH", index_path)
+    generated = []
+
+    async def generate_topic(topic, documents):
+        generated[-1].append(topic)
+        if topic == EMPTY_TOPIC:
+            return []
+        return [{"category_name": topic, "article_title": f"{topic} {len(generated)}", "article_summary": "", "article_body": "", "referenced_urls": []}]
+
+    monkeypatch.setattr(rag_run, "generate_topic", generate_topic)
+
+    def run():
+        generated.append([])
+        failed = asyncio.run(rag_run.generate_all_articles(
+            output_path=tmp_path / "articles.json",
+            checkpoint_dir=tmp_path / "checkpoints",
+            sources_path=tmp_path / "sources.json",
+        ))
+        return failed, sorted(generated[-1])
+
+    return run
+
+
+def test_topics_without_articles_do_not_block_checkpoint_cleanup(tmp_path, run_articles):
+    failed, generated = run_articles()
+    assert failed == []
+    assert generated == sorted(rag_run.TOPICS)
+    assert not list((tmp_path / "checkpoints").glob("*.json"))
+
+    # the empty topic has no articles to keep, so it is tried again; the others are unchanged
+    assert run_articles() == ([], [EMPTY_TOPIC])
+
+
+def test_checkpointed_topics_are_regenerated_when_their_retrieval_changed(tmp_path, run_articles):
+    run_articles()
+    topic, other = rag_run.TOPICS[:2]
+    for name in (topic, other):
+        checkpoint = rag_run._checkpoint_path(tmp_path / "checkpoints", name)
+        rag_run._write_json(checkpoint, {"topic": name, "articles": [{"category_name": name, "article_title": "checkpointed"}]})
+    sources_path = tmp_path / "sources.json"
+    sources = json.loads(sources_path.read_text())
+    sources["topics"][topic]["chunk_ids"] = ["a-chunk-that-is-gone"]
+    sources_path.write_text(json.dumps(sources))
+
+    assert run_articles() == ([], sorted([topic, EMPTY_TOPIC]))
+    titles = {entry["category_name"]: entry["article_title"] for entry in json.loads((tmp_path / "articles.json").read_text())}
+    assert titles[topic] == f"{topic} 2"
+    assert titles[other] == "checkpointed"
@@ -0,0 +1,36 @@
+import io
+import json
+from decimal import Decimal
+
+from upload import iter_transcripts
+
+TRANSCRIPTS = {
+    "house": {
+        "judiciary": [
+            {"url": "https://example.org/1", "date": "2026-01-07", "transcript": "Rep. Smith: Good morning."},
+            "not an entry",
+            {"url": "https://example.org/2", "speakers": {"chair": {"name": "Lanpher", "terms": [1, 2]}}, "duration": 1.5},
+            [{"url": "nested in a list"}],
+            None,
+            {"url": "https://example.org/3", "segments": [{"start": 0, "text": ">> Thank you."}, []]},
+        ],
+        "education": [],
+    },
+    "senate": {
+        "finance": [42, {"url": "https://example.org/4", "transcript": ""}],
+    },
+}
+
+
+def test_iter_transcripts_matches_json_load():
+    raw = json.dumps(TRANSCRIPTS).encode("utf-8")
+    expected = [
+        (chamber, committee, index, entry)
+        for chamber, committees in json.loads(raw, parse_float=Decimal).items()
+        for committee, entries in committees.items()
+        for index, entry in enumerate(entries)
+        if isinstance(entry, dict)
+    ]
+
+    assert list(iter_transcripts(io.BytesIO(raw))) == expected
+    assert [index for _, _, index, _ in expected] == [0, 2, 5, 1]
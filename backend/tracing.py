@@ -0,0 +1,203 @@
+import bisect
+import functools
+import inspect
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from typing_extensions import List
+
+# Spans time the graph nodes, LLM calls and retrieval sub-steps. Every span feeds the
+# process-wide histograms behind /metrics, and the trace of the current request, if one is
+# active, for the optional `timings` block of the response. With TRACING=0, `span` returns a
+# shared no-op context manager and `count` returns immediately.
+TRACING_ENABLED = os.getenv("TRACING", "1").lower() not in ("0", "false", "no")
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "agent"
+
+_NOOP = nullcontext()
+
+
+class Trace:
+    """The spans and counters of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[tuple] = []  # (name, start ms since the trace started, duration ms)
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()  # spans also end on search executor threads
+
+    def summary(self) -> dict:
+        """Total time, time per span name, the individual spans in start order, and the counters."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span[1])
+            counters = dict(self.counters)
+        by_name: Dict[str, Dict[str, float]] = {}
+        for name, _, duration in spans:
+            entry = by_name.setdefault(name, {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + duration, 3)
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            "by_name": by_name,
+            "spans": [{"name": name, "start_ms": round(start, 3), "duration_ms": round(duration, 3)} for name, start, duration in spans],
+            "counters": counters,
+        }
+
+
+class _Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("trace", default=None)
+_histograms: Dict[str, _Histogram] = {}
+_counters: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def _record(name: str, started: float):
+    ended = time.perf_counter()
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = _Histogram()
+        histogram.observe(ended - started)
+    trace = _current.get()
+    if trace is not None:
+        with trace._lock:
+            trace.spans.append((name, (started - trace.started) * 1000, (ended - started) * 1000))
+
+
+@contextmanager
+def _span(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(name, started)
+
+
+def span(name: str):
+    """Context manager timing the enclosed block as `name`."""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _span(name)
+
+
+def traced(name: str) -> Callable:
+    """Decorator timing every call of a sync or async function as `name`."""
+
+    def decorator(fn: Callable) -> Callable:
+        if not TRACING_ENABLED:
+            return fn
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _record(name, started)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _record(name, started)
+
+        return wrapper
+
+    return decorator
+
+
+def count(name: str, value: float = 1):
+    """Adds `value` to the counter `name`, process-wide and on the current request's trace."""
+    if not TRACING_ENABLED or not value:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    trace = _current.get()
+    if trace is not None:
+        with trace._lock:
+            trace.counters[name] = trace.counters.get(name, 0) + value
+
+
+def count_usage(message: Any):
+    """Counts the tokens in and out reported by a model response, if it reports them."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        count("llm_tokens_in", usage.get("input_tokens", 0))
+        count("llm_tokens_out", usage.get("output_tokens", 0))
+
+
+@contextmanager
+def trace() -> Iterator[Optional[Trace]]:
+    """Collects the spans and counters of the enclosed request; yields None when tracing is off.
+
+    Tasks and `asyncio.to_thread` calls started inside inherit the trace. Work handed to an
+    executor directly must be run in a copy of the context, see `load.Storage.aretrieve_context`.
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+    current = Trace()
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:  # exited in another context, e.g. a cancelled streaming response
+            _current.set(None)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    """Renders the span histograms, the counters and `gauges` in the Prometheus text format."""
+    with _lock:
+        histograms = {name: (list(h.buckets), h.count, h.sum) for name, h in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = [
+        f"# HELP {METRIC_PREFIX}_span_seconds Duration of graph nodes, LLM calls and retrieval steps.",
+        f"# TYPE {METRIC_PREFIX}_span_seconds histogram",
+    ]
+    for name, (buckets, total, seconds) in sorted(histograms.items()):
+        label = f'span="{_escape(name)}"'
+        cumulative = 0
+        for bound, observed in zip(LATENCY_BUCKETS, buckets):
+            cumulative += observed
+            lines.append(f'{METRIC_PREFIX}_span_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_PREFIX}_span_seconds_bucket{{{label},le="+Inf"}} {total}')
+        lines.append(f"{METRIC_PREFIX}_span_seconds_sum{{{label}}} {seconds:.6f}")
+        lines.append(f"{METRIC_PREFIX}_span_seconds_count{{{label}}} {total}")
+
+    for name, value in sorted(counters.items()):
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name}_total counter")
+        lines.append(f"{METRIC_PREFIX}_{name}_total {value:g}")
+
+    for name, value in sorted((gauges or {}).items()):
+        if value is None:
+            continue
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} gauge")
+        lines.append(f"{METRIC_PREFIX}_{name} {float(value):g}")
+    return "\n".join(lines) + "\n"
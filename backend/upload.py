@@ -2,10 +2,14 @@ import os
 from pathlib import Path
 import re
 from datetime import datetime
-import json
+import argparse
+from typing import BinaryIO, Iterator, Tuple
+import ijson
 from langchain_core.documents import Document
 
-from load import Storage, PDF, text_splitter
+from load import Storage, PDF, extract_pdf_pages, PDF_EXTRACT_WORKERS
+from chunking import chunked_hash, chunker_id, split_document
+from ingest import BulkIngestor, INGEST_BATCH_SIZE, INGEST_CHECKPOINT_EVERY, hash_file, hash_text
 
 # --- Vector Store Setup ---
 FAISS_PATH = "faiss_index"
@@ -15,6 +19,7 @@ storage = Storage(path=FAISS_PATH)
 ACTS_DIR = Path(__file__).parent.parent / "scraped_data/vermont_acts_2026"
 JOURNALS_DIR = Path(__file__).parent.parent / "scraped_data/vermont_journals_2026"
 TRANSCRIPTS_PATH = Path(__file__).parent.parent / "scraped_data/vermont_transcripts_clean.json"
+TRANSCRIPT_PROGRESS_EVERY = 500  # entries between progress reports
 
 # --- Metadata Extraction ---
 def get_act_metadata(file_path: Path) -> dict:
@@ -84,50 +89,162 @@ def get_transcript_metadata(transcript_entry: dict, chamber: str) -> dict:
         "as_enacted": None,
     }
 
+# --- Transcript Streaming ---
+def iter_transcripts(f: BinaryIO) -> Iterator[Tuple[str, str, int, dict]]:
+    """Lazily yields the entries of the transcripts file.
+
+    The file maps chamber -> committee -> list of transcript entries. It is parsed as a stream of
+    JSON events and only the entry currently being read is built in memory, so memory use does
+    not grow with the size of the file.
+
+    Args:
+        f (BinaryIO): The transcripts file, opened in binary mode.
+
+    Yields:
+        Tuple[str, str, int, dict]: The chamber, committee, index in the committee's list and entry.
+    """
+    depth = 0
+    chamber = committee = None
+    index = 0
+    builder = None
+    for _, event, value in ijson.parse(f):
+        opens = event in ("start_map", "start_array")
+        closes = event in ("end_map", "end_array")
+        if builder is not None:
+            builder.event(event, value)
+            depth += opens - closes
+            if depth == 3:  # back at the committee's list, the entry is complete
+                yield chamber, committee, index, builder.value
+                builder = None
+                index += 1
+            continue
+
+        if event == "map_key" and depth == 1:
+            chamber = value
+        elif event == "map_key" and depth == 2:
+            committee = value
+        elif event == "start_array" and depth == 2:
+            index = 0
+        elif event == "start_map" and depth == 3:
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+        elif depth == 3 and not closes:
+            index += 1  # a malformed entry, keep the indices of the others stable
+        depth += opens - closes
+
 # --- Main Upload Logic ---
-def upload_files():
-    # Process Acts
-    print("Processing acts...")
-    if not ACTS_DIR.exists():
-        print(f"Warning: Directory not found: {ACTS_DIR}")
-    else:
-        act_files = list(ACTS_DIR.glob("**/*.pdf"))
-        for pdf_path in act_files:
-            print(f"Processing {pdf_path}...")
-            metadata = get_act_metadata(pdf_path)
-            PDF(str(pdf_path), storage, metadata)
-
-    # Process Journals
-    print("Processing journals...")
-    if not JOURNALS_DIR.exists():
-        print(f"Warning: Directory not found: {JOURNALS_DIR}")
-    else:
-        journal_files = list(JOURNALS_DIR.glob("*.pdf"))
-        for pdf_path in journal_files:
+def _under(root: Path):
+    # acts and journals are keyed by their path relative to the scraped_data directory
+    return lambda source_key: Path(source_key).parts[:1] == (root.name,)
+
+
+def upload_files(
+    batch_size: int = INGEST_BATCH_SIZE,
+    checkpoint_every: int = INGEST_CHECKPOINT_EVERY,
+    resume: bool = True,
+    extract_workers: int = PDF_EXTRACT_WORKERS,
+    prune: bool = True,
+    prune_missing: bool = False,
+):
+    """Ingests acts, journals and transcripts in bulk.
+
+    Only new or changed sources are (re-)embedded; see `BulkIngestor`. If the acts or journals
+    directory or the transcripts file is missing, e.g. an unmounted volume or a failed scrape,
+    the sources indexed from it are kept unless `prune_missing` is set.
+
+    Args:
+        batch_size (int): Number of splits embedded and added to the index at once.
+        checkpoint_every (int): Number of splits between writes of the index to disk.
+        resume (bool): Resume from the last checkpoint instead of rebuilding the index.
+        extract_workers (int): Number of processes used for PDF text extraction.
+        prune (bool): Remove sources from the index that were not found during this run.
+        prune_missing (bool): Also remove the sources of a missing directory or file.
+    """
+    with BulkIngestor(storage, batch_size=batch_size, checkpoint_every=checkpoint_every, resume=resume, prune=prune) as ingestor:
+        # Collect acts and journals, then extract them together on the process pool
+        pdf_sources = {}  # path -> (source_key, content_hash, metadata, source_type)
+        # the chunking is part of every hash, so changing it re-chunks the sources on the next run
+        chunking = chunker_id()
+
+        print("Collecting acts...")
+        if not ACTS_DIR.exists():
+            print(f"Warning: Directory not found: {ACTS_DIR}")
+            if not prune_missing:
+                ingestor.keep_unseen(_under(ACTS_DIR))
+        else:
+            for pdf_path in ACTS_DIR.glob("**/*.pdf"):
+                source_key = str(pdf_path.relative_to(ACTS_DIR.parent))
+                content_hash = chunked_hash(hash_file(str(pdf_path)), chunking)
+                if ingestor.needs_indexing(source_key, content_hash):
+                    pdf_sources[str(pdf_path)] = (source_key, content_hash, get_act_metadata(pdf_path), "act")
+
+        print("Collecting journals...")
+        if not JOURNALS_DIR.exists():
+            print(f"Warning: Directory not found: {JOURNALS_DIR}")
+            if not prune_missing:
+                ingestor.keep_unseen(_under(JOURNALS_DIR))
+        else:
+            for pdf_path in JOURNALS_DIR.glob("*.pdf"):
+                source_key = str(pdf_path.relative_to(JOURNALS_DIR.parent))
+                content_hash = chunked_hash(hash_file(str(pdf_path)), chunking)
+                if ingestor.needs_indexing(source_key, content_hash):
+                    pdf_sources[str(pdf_path)] = (source_key, content_hash, get_journal_metadata(pdf_path), "journal")
+
+        print(f"Extracting {len(pdf_sources)} PDFs with {extract_workers} workers...")
+        for pdf_path, pages in extract_pdf_pages(pdf_sources, max_workers=extract_workers):
             print(f"Processing {pdf_path}...")
-            metadata = get_journal_metadata(pdf_path)
-            PDF(str(pdf_path), storage, metadata)
-
-    # Process Transcripts
-    print("Processing transcripts...")
-    if not TRANSCRIPTS_PATH.exists():
-        print(f"Warning: File not found: {TRANSCRIPTS_PATH}")
-    else:
-        with open(TRANSCRIPTS_PATH, 'r') as f:
-            all_transcripts_data = json.load(f)
-        
-        for chamber_name, committees in all_transcripts_data.items():
-            for committee_abbr, transcript_list in committees.items():
-                for transcript_entry in transcript_list:
-                    if transcript_entry.get('transcript'):
-                        doc = Document(page_content=transcript_entry['transcript'])
-                        metadata = get_transcript_metadata(transcript_entry, chamber_name)
-                        doc.metadata.update(metadata)
-                        splits = text_splitter.split_documents([doc])
-                        storage.add_documents(documents=splits)
-                        print(f"Processing transcript from {transcript_entry.get('url')} (Chamber: {chamber_name}, Committee: {committee_abbr})")
+            source_key, content_hash, metadata, source_type = pdf_sources[pdf_path]
+            ingestor.add(source_key, content_hash, PDF(pdf_path, None, metadata, pages=pages, source_type=source_type).splits)
+
+        # Process Transcripts
+        print("Processing transcripts...")
+        if not TRANSCRIPTS_PATH.exists():
+            print(f"Warning: File not found: {TRANSCRIPTS_PATH}")
+            if not prune_missing:
+                # transcripts are keyed by URL, so they are whatever is not an act or journal
+                ingestor.keep_unseen(lambda key: not (_under(ACTS_DIR)(key) or _under(JOURNALS_DIR)(key)))
+        else:
+            total_bytes = TRANSCRIPTS_PATH.stat().st_size
+            seen = indexed = 0
+            with open(TRANSCRIPTS_PATH, "rb") as f:
+                for chamber_name, committee_abbr, i, transcript_entry in iter_transcripts(f):
+                    seen += 1
+                    if seen % TRANSCRIPT_PROGRESS_EVERY == 0:
+                        print(f"Transcripts: {seen} read, {indexed} indexed, "
+                              f"{f.tell() / max(total_bytes, 1):.0%} of {total_bytes / 1e6:.1f} MB...")
+                    if not transcript_entry.get('transcript'):
+                        continue
+                    source_key = transcript_entry.get('url') or f"{chamber_name}/{committee_abbr}/{i}"
+                    metadata = get_transcript_metadata(transcript_entry, chamber_name)
+                    content_hash = chunked_hash(hash_text(transcript_entry['transcript'], metadata), chunking)
+                    if not ingestor.needs_indexing(source_key, content_hash):
+                        continue
+                    doc = Document(page_content=transcript_entry['transcript'])
+                    doc.metadata.update(metadata)
+                    splits = split_document(doc, "transcript")
+                    ingestor.add(source_key, content_hash, splits)
+                    indexed += 1
+                    print(f"Processing transcript from {transcript_entry.get('url')} (Chamber: {chamber_name}, Committee: {committee_abbr})")
+            print(f"Transcripts: {seen} read, {indexed} indexed.")
 
     print("Upload complete.")
 
 if __name__ == "__main__":
-    upload_files()
+    parser = argparse.ArgumentParser(description="Ingest scraped legislative documents into the FAISS index.")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Splits embedded per batch.")
+    parser.add_argument("--checkpoint-every", type=int, default=INGEST_CHECKPOINT_EVERY, help="Splits between index checkpoints.")
+    parser.add_argument("--extract-workers", type=int, default=PDF_EXTRACT_WORKERS, help="Processes used for PDF text extraction.")
+    parser.add_argument("--no-prune", action="store_true", help="Keep indexed sources that were not found during this run.")
+    parser.add_argument("--prune-missing", action="store_true",
+                        help="Also remove the sources of a missing acts or journals directory or transcripts file.")
+    parser.add_argument("--fresh", action="store_true", help="Ignore any checkpoint and rebuild the index from scratch.")
+    args = parser.parse_args()
+
+    upload_files(
+        batch_size=args.batch_size,
+        checkpoint_every=args.checkpoint_every,
+        resume=not args.fresh,
+        extract_workers=args.extract_workers,
+        prune=not args.no_prune,
+        prune_missing=args.prune_missing,
+    )
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# --- Configuration ---
+# Point this at a local stand-in server to test the scrapers offline.
+BASE_URL = os.getenv("SCRAPE_BASE_URL", "https://legislature.vermont.gov/")
+MAX_CONNECTIONS = int(os.getenv("SCRAPE_MAX_CONNECTIONS", "16"))
+PER_HOST_CONCURRENCY = int(os.getenv("SCRAPE_PER_HOST_CONCURRENCY", "4"))
+PER_HOST_RATE = float(os.getenv("SCRAPE_PER_HOST_RATE", "4"))  # request starts per second and host
+MAX_ATTEMPTS = int(os.getenv("SCRAPE_MAX_ATTEMPTS", "4"))
+CHUNK_SIZE = 1 << 16
+
+# Pretend to be a real browser to avoid simple bot detection
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+# ---------------------
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CrawlState:
+    """Resumable crawl state, kept as JSON next to the downloads.
+
+    Remembers the ETag and Last-Modified of every fetched URL, so the next run can send
+    conditional requests, and which work items of the current run are done, so an interrupted
+    run picks up where it stopped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.validators: Dict[str, Dict[str, str]] = {}  # url -> {"etag", "last_modified", ...}
+        self.completed: Dict[str, dict] = {}  # work item -> result, for the current run
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.validators = data.get("validators", {})
+            self.completed = data.get("completed", {})
+        self._dirty = 0
+
+    def save(self):
+        """Writes the state atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": 1, "validators": self.validators, "completed": self.completed}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = 0
+
+    def mark_done(self, item: str, result: Optional[dict] = None, save_every: int = 20):
+        """Records a finished work item, saving every `save_every` items."""
+        self.completed[item] = result or {}
+        self._dirty += 1
+        if self._dirty >= save_every:
+            self.save()
+
+    def finish_run(self):
+        """Forgets the work items of a completed run; the next run starts over, conditionally."""
+        self.completed = {}
+        self.save()
+
+
+class _HostLimiter:
+    # caps requests in flight per host and spaces their starts by 1 / rate seconds
+    def __init__(self, concurrency: int, rate: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class Fetcher:
+    """Async HTTP client shared by the scrapers.
+
+    One connection pool serves every request, with a per-host concurrency and rate limit.
+    Failed requests (connection errors, 429 and 5xx) are retried with exponential backoff,
+    honouring Retry-After.
+    """
+
+    def __init__(
+        self,
+        state: CrawlState,
+        max_connections: int = MAX_CONNECTIONS,
+        per_host_concurrency: int = PER_HOST_CONCURRENCY,
+        per_host_rate: float = PER_HOST_RATE,
+        max_attempts: int = MAX_ATTEMPTS,
+        timeout: float = 60,
+    ):
+        self.state = state
+        self.max_connections = max_connections
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._limiters: Dict[str, _HostLimiter] = {}
+
+    async def __aenter__(self) -> "Fetcher":
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.per_host_concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=connector, headers=HEADERS, timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    def _limiter(self, url: str) -> _HostLimiter:
+        host = urlsplit(url).netloc
+        if host not in self._limiters:
+            self._limiters[host] = _HostLimiter(self.per_host_concurrency, self.per_host_rate)
+        return self._limiters[host]
+
+    async def _request(self, url: str, headers: Optional[Dict[str, str]] = None):
+        # Returns an open response (the caller releases it), retrying transient failures.
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                async with self._limiter(url):
+                    response = await self.session.get(url, headers=headers, allow_redirects=True)
+                if response.status not in RETRY_STATUSES or attempt == self.max_attempts:
+                    return response
+                retry_after = response.headers.get("Retry-After", "")
+                response.release()
+                delay = float(retry_after) if retry_after.isdigit() else 2 ** (attempt - 1)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.max_attempts:
+                    raise
+                delay = 2 ** (attempt - 1)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    def _conditional_headers(self, url: str) -> Dict[str, str]:
+        validators = self.state.validators.get(url, {})
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        return headers
+
+    def _remember(self, url: str, response: aiohttp.ClientResponse, **extra):
+        self.state.validators[url] = {
+            "etag": response.headers.get("ETag", ""),
+            "last_modified": response.headers.get("Last-Modified", ""),
+            **extra,
+        }
+
+    async def get_page(self, url: str) -> Tuple[int, Optional[str]]:
+        """Fetches an HTML page conditionally.
+
+        Returns:
+            Tuple[int, Optional[str]]: The HTTP status and the page text. The text is None for
+                                       errors and for 304 Not Modified, in which case the caller
+                                       reuses what it extracted from the page last time.
+        """
+        response = await self._request(url, headers=self._conditional_headers(url))
+        async with response:
+            if response.status != 200:
+                return response.status, None
+            text = await response.text()
+            self._remember(url, response)
+            return 200, text
+
+    async def download(self, url: str, path: str) -> str:
+        """Streams a file to disk, unless the server reports it unchanged.
+
+        The body is written to `path.part` chunk by chunk and moved into place when complete,
+        so memory stays flat and an interrupted download never leaves a truncated file. The
+        `.part` file of a failed or cancelled download is removed.
+
+        Returns:
+            str: "downloaded", "unchanged" or "failed".
+        """
+        headers = self._conditional_headers(url) if os.path.exists(path) else {}
+        try:
+            response = await self._request(url, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Failed to download {url}. Error: {e}")
+            return "failed"
+
+        async with response:
+            if response.status == 304:
+                return "unchanged"
+            if response.status != 200:
+                print(f"Failed to download {url}. HTTP {response.status}")
+                return "failed"
+
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            part_path = f"{path}.part"
+            size = 0
+            try:
+                with open(part_path, "wb") as f:
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+                os.replace(part_path, path)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                print(f"Failed to download {url}. Error: {e}")
+                return "failed"
+            finally:
+                if os.path.exists(part_path):  # failed or cancelled before it was moved into place
+                    os.remove(part_path)
+            self._remember(url, response, size=size)
+            return "downloaded"
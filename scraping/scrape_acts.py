@@ -1,18 +1,48 @@
+import argparse
+import asyncio
 import os
-import requests
-import time
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
+from fetcher import BASE_URL, PER_HOST_CONCURRENCY, CrawlState, Fetcher
+
 # --- Configuration ---
-STATUS_URL_TEMPLATE = "https://legislature.vermont.gov/bill/status/2026/{bill_name}"
-BASE_URL = "https://legislature.vermont.gov/"
+STATUS_PATH_TEMPLATE = "bill/status/2026/{bill_name}"
 DOWNLOAD_DIR = "scraped_data/vermont_acts_2026"
+STATE_FILE = "crawl_state.json"
 # Stop after this many consecutive 404s
 MAX_CONSECUTIVE_FAILURES = 1 # <-- Changed to 1 as requested
 # ---------------------
 
-def download_act_pdfs(bill_url, bill_name, download_dir):
+
+def extract_act_links(html, base_url):
+    """
+    Finds the 'As Enacted' and 'Act Summary' PDF links in the 'act' tab of a bill page.
+    Returns None if the page is not a valid bill page (no title).
+    """
+    soup = BeautifulSoup(html, "html.parser")
+
+    # --- Validate page has a bill title ---
+    # Find <div class="bill-title">
+    if not soup.find("div", class_="bill-title"):
+        return None
+
+    # Look for the specific div
+    act_div = soup.find("div", id="act")
+    if not act_div:
+        return []
+
+    pdf_links = []
+    for link in act_div.find_all("a", href=True):
+        link_text = link.text.strip()
+        href = link.get("href", "")
+        # Only grab the specific links requested
+        if (link_text == "As Enacted" or link_text == "Act Summary") and ".pdf" in href.lower():
+            pdf_links.append(urljoin(base_url, href.split("#")[0]))
+    return pdf_links
+
+
+async def download_act_pdfs(fetcher, base_url, bill_name, download_dir):
     """
     Visits a single bill page and downloads PDFs from the 'act' tab.
     Returns a status code:
@@ -20,124 +50,115 @@ def download_act_pdfs(bill_url, bill_name, download_dir):
     - 404: Page not found.
     - 500: Other error.
     """
+    state = fetcher.state
+    if bill_name in state.completed:
+        return state.completed[bill_name]["status"]  # done earlier in this run
+
+    bill_url = urljoin(base_url, STATUS_PATH_TEMPLATE.format(bill_name=bill_name))
     try:
-        response = requests.get(bill_url)
-        
-        # Check for other HTTP errors
-        response.raise_for_status()
-        
-        # If we get here, the page exists (HTTP 200)
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        # --- New check: Validate page has a bill title ---
-        # Find <div class="bill-title">
-        title_div = soup.find("div", class_="bill-title")
-        if not title_div:
-            print(f"--- {bill_name} is not a valid bill page (no title).")
-            return 404 # Treat as failure to stop iteration
-        # --- End of new check ---
-
-        print(f"--- Checking {bill_name} ---")
-        
-        # Look for the specific div
-        act_div = soup.find("div", id="act")
-        
-        if not act_div:
-            print(f"No 'act' tab found for {bill_name}.")
-            return 200 # Page existed, but no act
-
-        # --- Modified PDF link finding logic ---
-        # Find all PDF links within that div
-        all_links = act_div.find_all("a", href=True)
-        pdf_links = []
-        for link in all_links:
-            link_text = link.text.strip()
-            href = link.get("href", "").lower()
-            # Only grab the specific links requested
-            if (link_text == "As Enacted" or link_text == "Act Summary") and ".pdf" in href:
-                pdf_links.append(link)
-        # --- End of modified logic ---
-        
-        if not pdf_links:
-            print(f"'act' div found, but no PDF links inside for {bill_name}.")
-            return 200 # Page existed, but no PDFs in the act div
-
-        print(f"Found {len(pdf_links)} Act PDF(s) for {bill_name}. Downloading...")
-        
-        # Create a sub-directory for this bill's acts
-        bill_act_dir = os.path.join(download_dir, bill_name)
-        os.makedirs(bill_act_dir, exist_ok=True)
-        
-        for link in pdf_links:
-            href = link.get("href")
-            cleaned_href = href.split("#")[0]
-            absolute_url = urljoin(BASE_URL, cleaned_href)
-            filename = absolute_url.split("/")[-1]
-            file_path = os.path.join(bill_act_dir, filename)
-            
-            try:
-                print(f"Downloading {filename}...")
-                pdf_response = requests.get(absolute_url)
-                pdf_response.raise_for_status()
-                
-                with open(file_path, "wb") as f:
-                    f.write(pdf_response.content)
-                print(f"Successfully saved to {file_path}")
-                
-            except requests.exceptions.RequestException as e:
-                print(f"Failed to download {absolute_url}. Error: {e}")
-        
-        return 200 # Success
-
-    except requests.exceptions.RequestException as e:
+        status, html = await fetcher.get_page(bill_url)
+    except Exception as e:
         # Handle errors fetching the bill page itself
         print(f"Failed to fetch {bill_url}. Error: {e}")
-        return 500 # General error
+        return 500
+
+    if status == 304:
+        # unchanged since the last run: reuse the links found then
+        pdf_links = state.validators[bill_url].get("pdf_links")
+    elif status == 200:
+        pdf_links = extract_act_links(html, base_url)
+        state.validators[bill_url]["pdf_links"] = pdf_links
+    elif status == 404:
+        pdf_links = None
+    else:
+        print(f"Failed to fetch {bill_url}. HTTP {status}")
+        return 500
+
+    if pdf_links is None:
+        print(f"--- {bill_name} is not a valid bill page.")
+        state.mark_done(bill_name, {"status": 404})
+        return 404 # Treat as failure to stop iteration
 
-def iterate_and_scrape(bill_prefix, download_dir):
+    if not pdf_links:
+        print(f"No act PDFs found for {bill_name}.")
+    else:
+        # Create a sub-directory for this bill's acts
+        bill_act_dir = os.path.join(download_dir, bill_name)
+        results = await asyncio.gather(*(
+            fetcher.download(url, os.path.join(bill_act_dir, url.split("/")[-1])) for url in pdf_links
+        ))
+        print(f"--- {bill_name}: {results.count('downloaded')} downloaded, "
+              f"{results.count('unchanged')} unchanged, {results.count('failed')} failed")
+        if "failed" in results:
+            return 500 # not marked done, so a resumed run retries it
+
+    state.mark_done(bill_name, {"status": 200})
+    return 200 # Success
+
+
+async def iterate_and_scrape(fetcher, base_url, bill_prefix, download_dir, window=PER_HOST_CONCURRENCY):
     """
-    Iterates through bill numbers (e.g., H.1, H.2...) until
-    MAX_CONSECUTIVE_FAILURES is reached.
+    Probes bill numbers (e.g., H.1, H.2...) `window` at a time until
+    MAX_CONSECUTIVE_FAILURES consecutive bills are not found.
+    Returns the number of bills that failed with other errors.
+
+    The bills of a window are requested together, so the scan overshoots the
+    first miss by up to `window - 1` requests. That is intended: the overshoot
+    costs at most one window of 404s per prefix, while probing one bill at a
+    time would serialize every request of a scan of hundreds of bills. Bills
+    found past the miss in the same window are downloaded and kept.
     """
     print(f"\n--- Starting scrape for prefix '{bill_prefix}' ---")
     i = 1
     consecutive_failures = 0
-    
-    while consecutive_failures < MAX_CONSECUTIVE_FAILURES:
-        bill_name = f"{bill_prefix}{i}"
-        bill_url = STATUS_URL_TEMPLATE.format(bill_name=bill_name)
-        
-        status = download_act_pdfs(bill_url, bill_name, download_dir)
-        
-        if status == 404:
-            consecutive_failures += 1
-        else: # Any success or server error
-            consecutive_failures = 0 # Reset on success
-        # If status is 500 (other error), we also reset,
-        # just in case it was a temporary server glitch.
-        # else:  <-- Old logic
-        #     consecutive_failures = 0 
-            
-        i += 1
-        time.sleep(0.25) # Be polite
-        
-    print(f"--- Hit {consecutive_failures} consecutive failures. Stopping scrape for '{bill_prefix}' ---")
-
-
-def main():
+    errors = 0
+
+    while True:
+        names = [f"{bill_prefix}{n}" for n in range(i, i + window)]
+        statuses = await asyncio.gather(*(
+            download_act_pdfs(fetcher, base_url, name, download_dir) for name in names
+        ))
+        for status in statuses:
+            errors += status == 500
+            if status == 404:
+                consecutive_failures += 1
+            else: # Any success or server error
+                # Reset on success, and also on other errors,
+                # just in case it was a temporary server glitch.
+                consecutive_failures = 0
+            if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                print(f"--- Hit {consecutive_failures} consecutive failures. Stopping scrape for '{bill_prefix}' ---")
+                return errors
+        i += window
+
+
+async def main(base_url=BASE_URL, download_dir=DOWNLOAD_DIR):
     """
     Main function to orchestrate the scraping.
     """
-    print(f"Creating download directory at: {DOWNLOAD_DIR}")
-    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-    
-    # Iterate for House bills (H.1, H.2, ...)
-    iterate_and_scrape("H.", DOWNLOAD_DIR)
-    
-    # Iterate for Senate bills (S.1, S.2, ...)
-    iterate_and_scrape("S.", DOWNLOAD_DIR)
-            
+    print(f"Creating download directory at: {download_dir}")
+    os.makedirs(download_dir, exist_ok=True)
+    state = CrawlState(os.path.join(download_dir, STATE_FILE))
+
+    try:
+        async with Fetcher(state) as fetcher:
+            # Iterate for House bills (H.1, H.2, ...)
+            errors = await iterate_and_scrape(fetcher, base_url, "H.", download_dir)
+
+            # Iterate for Senate bills (S.1, S.2, ...)
+            errors += await iterate_and_scrape(fetcher, base_url, "S.", download_dir)
+    finally:
+        state.save()
+
+    if errors:
+        print(f"\n{errors} bills failed. Run again to resume and retry them.")
+    else:
+        state.finish_run()
     print("\nScraping complete.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Download the act PDFs of every 2026 bill.")
+    parser.add_argument("--base-url", default=BASE_URL, help="Site to scrape, e.g. a local stand-in server.")
+    parser.add_argument("--download-dir", default=DOWNLOAD_DIR)
+    args = parser.parse_args()
+    asyncio.run(main(base_url=args.base_url, download_dir=args.download_dir))
@@ -0,0 +1,16 @@
+import functools
+import sys
+from pathlib import Path
+
+import pytest
+
+# the scrapers import each other as top-level modules, as when run from scraping/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fetcher  # noqa: E402
+
+
+@pytest.fixture
+def unthrottled(monkeypatch):
+    """Drops the per-host rate limit, which only slows down requests to the local stand-in."""
+    monkeypatch.setattr(fetcher.Fetcher, "__init__", functools.partialmethod(fetcher.Fetcher.__init__, per_host_rate=0))
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+
+import scrape_acts
+import scrape_journals
+from fetcher import CHUNK_SIZE, CrawlState, Fetcher
+
+
+class StandIn:
+    """Local stand-in for the legislature site.
+
+    Serves registered resources with their validators, answers conditional requests with 304,
+    and logs every request as (path, request headers, response status).
+    """
+
+    def __init__(self):
+        self.resources = {}  # path -> {"body", "etag", "last_modified", "truncate"}
+        self.queued = {}  # path -> responses sent before the resource itself
+        self.log = []
+        self.port = 0
+        self.url = None
+
+    def add(self, path, body, etag=None, last_modified=None, truncate=False):
+        self.resources[path] = {
+            "body": body.encode("utf-8") if isinstance(body, str) else body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "truncate": truncate,
+        }
+
+    def statuses(self, path):
+        return [status for logged, _, status in self.log if logged == path]
+
+    async def handle(self, request):
+        path = request.path.lstrip("/")
+        if self.queued.get(path):
+            response = self.queued[path].pop(0)
+        elif path not in self.resources:
+            response = web.Response(status=404)
+        else:
+            response = await self._serve(request, self.resources[path])
+        self.log.append((path, dict(request.headers), response.status))
+        return response
+
+    async def _serve(self, request, resource):
+        if resource["etag"] and request.headers.get("If-None-Match") == resource["etag"]:
+            return web.Response(status=304)
+        if resource["last_modified"] and request.headers.get("If-Modified-Since") == resource["last_modified"]:
+            return web.Response(status=304)
+
+        body = resource["body"]
+        response = web.StreamResponse(headers={"Content-Length": str(len(body))})
+        if resource["etag"]:
+            response.headers["ETag"] = resource["etag"]
+        if resource["last_modified"]:
+            response.headers["Last-Modified"] = resource["last_modified"]
+        await response.prepare(request)
+        if resource["truncate"]:
+            await response.write(body[: len(body) // 3])
+            request.transport.close()  # the connection drops mid-body
+            return response
+        for start in range(0, len(body), 8192):
+            await response.write(body[start:start + 8192])
+        await response.write_eof()
+        return response
+
+
+@asynccontextmanager
+async def serve(stand_in):
+    app = web.Application()
+    app.router.add_get("/{path:.*}", stand_in.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    # later runs reuse the port, so the URLs in crawl_state.json stay valid
+    site = web.TCPSite(runner, "127.0.0.1", stand_in.port)
+    await site.start()
+    stand_in.port = site._server.sockets[0].getsockname()[1]
+    stand_in.url = f"http://127.0.0.1:{stand_in.port}/"
+    try:
+        yield stand_in
+    finally:
+        await runner.cleanup()
+
+
+def bill_page(*pdf_paths):
+    links = "".join(f'<a href="/{path}#page=1">{name}</a>' for name, path in pdf_paths)
+    return f'<html><div class="bill-title">An act</div><div id="act">{links}</div></html>'
+
+
+def journal_page(*pdf_paths):
+    return "<html>" + "".join(f'<a href="/{path}">Journal</a>' for path in pdf_paths) + "</html>"
+
+
+def test_download_streams_to_disk_and_skips_unchanged_files(tmp_path, unthrottled):
+    stand_in = StandIn()
+    body = os.urandom(3 * CHUNK_SIZE + 100)
+    stand_in.add("Documents/etag.pdf", body, etag='"v1"')
+    stand_in.add("Documents/dated.pdf", b"%PDF dated", last_modified="Wed, 01 Apr 2026 12:00:00 GMT")
+
+    async def scenario():
+        async with serve(stand_in), Fetcher(CrawlState(str(tmp_path / "crawl_state.json"))) as fetcher:
+            for name in ("etag.pdf", "dated.pdf"):
+                url, path = f"{stand_in.url}Documents/{name}", str(tmp_path / name)
+                assert await fetcher.download(url, path) == "downloaded"
+                assert not os.path.exists(f"{path}.part")
+                assert await fetcher.download(url, path) == "unchanged"
+            return fetcher.state
+
+    state = asyncio.run(scenario())
+
+    assert (tmp_path / "etag.pdf").read_bytes() == body
+    assert state.validators[f"{stand_in.url}Documents/etag.pdf"]["size"] == len(body)
+    assert stand_in.statuses("Documents/etag.pdf") == [200, 304]
+    assert stand_in.statuses("Documents/dated.pdf") == [200, 304]
+    etag_headers, dated_headers = (headers for path, headers, status in stand_in.log if status == 304)
+    assert etag_headers["If-None-Match"] == '"v1"'
+    assert dated_headers["If-Modified-Since"] == "Wed, 01 Apr 2026 12:00:00 GMT"
+
+
+def test_interrupted_download_keeps_the_previous_file(tmp_path, unthrottled):
+    stand_in = StandIn()
+    stand_in.add("Documents/act.pdf", b"%PDF old", etag='"v1"')
+    path = str(tmp_path / "act.pdf")
+
+    async def scenario():
+        async with serve(stand_in), Fetcher(CrawlState(str(tmp_path / "crawl_state.json"))) as fetcher:
+            url = f"{stand_in.url}Documents/act.pdf"
+            assert await fetcher.download(url, path) == "downloaded"
+            stand_in.add("Documents/act.pdf", os.urandom(2 * CHUNK_SIZE), etag='"v2"', truncate=True)
+            assert await fetcher.download(url, path) == "failed"
+
+    asyncio.run(scenario())
+
+    with open(path, "rb") as f:
+        assert f.read() == b"%PDF old"
+    assert not os.path.exists(f"{path}.part")
+
+
+def test_retry_after_is_honoured_on_429(tmp_path, unthrottled, monkeypatch):
+    monkeypatch.setattr(random, "uniform", lambda low, high: 1.0)  # no jitter
+    stand_in = StandIn()
+    stand_in.add("house/service/2026/journal", "<html></html>")
+    stand_in.queued["house/service/2026/journal"] = [web.Response(status=429, headers={"Retry-After": "2"})]
+
+    async def scenario():
+        async with serve(stand_in), Fetcher(CrawlState(str(tmp_path / "crawl_state.json"))) as fetcher:
+            started = time.monotonic()
+            status, _ = await fetcher.get_page(f"{stand_in.url}house/service/2026/journal")
+            return status, time.monotonic() - started
+
+    status, elapsed = asyncio.run(scenario())
+
+    assert status == 200
+    assert stand_in.statuses("house/service/2026/journal") == [429, 200]
+    assert elapsed >= 2  # the first backoff without Retry-After would be 1s
+
+
+def test_act_scraper_reuses_unchanged_bill_pages(tmp_path, unthrottled):
+    stand_in = StandIn()
+    pdfs = [("As Enacted", "Documents/2026/ACT001.pdf"), ("Act Summary", "Documents/2026/ACT001-summary.pdf")]
+    stand_in.add("bill/status/2026/H.1", bill_page(*pdfs), etag='"h1"')
+    for _, pdf_path in pdfs:
+        stand_in.add(pdf_path, f"%PDF {pdf_path}", etag=f'"{pdf_path}"')
+    download_dir = str(tmp_path / "acts")
+
+    asyncio.run(_run(stand_in, scrape_acts.main, download_dir))
+    asyncio.run(_run(stand_in, scrape_acts.main, download_dir))
+
+    assert stand_in.statuses("bill/status/2026/H.1") == [200, 304]
+    for _, pdf_path in pdfs:
+        assert stand_in.statuses(pdf_path) == [200, 304]
+        with open(os.path.join(download_dir, "H.1", os.path.basename(pdf_path))) as f:
+            assert f.read() == f"%PDF {pdf_path}"
+    with open(os.path.join(download_dir, scrape_acts.STATE_FILE)) as f:
+        assert json.load(f)["completed"] == {}
+
+
+def test_journal_scraper_resumes_from_crawl_state(tmp_path, unthrottled):
+    stand_in = StandIn()
+    pdfs = [f"Documents/2026/journal-{n}.pdf" for n in range(3)]
+    stand_in.add("house/service/2026/journal", journal_page(*pdfs), etag='"journal"')
+    for pdf_path in pdfs[:2]:
+        stand_in.add(pdf_path, f"%PDF {pdf_path}")  # the last one is missing on the first run
+    download_dir = str(tmp_path / "journals")
+    state_path = os.path.join(download_dir, scrape_journals.STATE_FILE)
+
+    asyncio.run(_run(stand_in, scrape_journals.main, download_dir))
+    with open(state_path) as f:
+        completed = json.load(f)["completed"]
+    assert sorted(completed) == [f"{stand_in.url}{pdf_path}" for pdf_path in pdfs[:2]]
+
+    stand_in.add(pdfs[2], f"%PDF {pdfs[2]}")
+    asyncio.run(_run(stand_in, scrape_journals.main, download_dir))
+
+    # only the failed download is retried; the finished ones are not requested again
+    assert [stand_in.statuses(pdf_path) for pdf_path in pdfs] == [[200], [200], [404, 200]]
+    assert stand_in.statuses("house/service/2026/journal") == [200, 304]
+    assert sorted(os.listdir(download_dir)) == sorted([scrape_journals.STATE_FILE] + [os.path.basename(p) for p in pdfs])
+    with open(state_path) as f:
+        assert json.load(f)["completed"] == {}
+
+
+async def _run(stand_in, main, download_dir):
+    async with serve(stand_in):
+        await main(base_url=stand_in.url, download_dir=download_dir)